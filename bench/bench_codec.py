@@ -0,0 +1,146 @@
+""" Per-message encode/decode cost of UWHProtoHandler, against the codec it
+    replaced (dict literals built on every enum conversion and message
+    allocation, and an if/elif chain for dispatch).
+
+    Run from the top of the repository:
+
+        python bench/bench_codec.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uwh import messages_pb2
+from uwh.comms import UWHProtoHandler
+from uwh.gamemanager import GameManager, GameState, TimeoutState, PoolLayout, TeamColor, Penalty
+
+
+def legacy_gs_to_proto_enum(gamemanager_enum):
+    return { GameState.game_over        : messages_pb2.GameState_GameOver,
+             GameState.pre_game         : messages_pb2.GameState_PreGame,
+             GameState.first_half       : messages_pb2.GameState_FirstHalf,
+             GameState.half_time        : messages_pb2.GameState_HalfTime,
+             GameState.second_half      : messages_pb2.GameState_SecondHalf,
+             GameState.ot_first         : messages_pb2.GameState_OTFirst,
+             GameState.ot_half          : messages_pb2.GameState_OTHalf,
+             GameState.ot_second        : messages_pb2.GameState_OTSecond,
+             GameState.sudden_death     : messages_pb2.GameState_SuddenDeath,
+             GameState.pre_ot           : messages_pb2.GameState_PreOT,
+             GameState.pre_sudden_death : messages_pb2.GameState_PreSuddenDeath,
+           }[gamemanager_enum]
+
+def legacy_ts_to_proto_enum(gamemanager_enum):
+    return { TimeoutState.none         : messages_pb2.TimeoutState_None,
+             TimeoutState.ref          : messages_pb2.TimeoutState_RefTimeout,
+             TimeoutState.white        : messages_pb2.TimeoutState_WhiteTimeout,
+             TimeoutState.black        : messages_pb2.TimeoutState_BlackTimeout,
+             TimeoutState.penalty_shot : messages_pb2.TimeoutState_PenaltyShot,
+           }[gamemanager_enum]
+
+def legacy_l_to_proto_enum(gamemanager_enum):
+    return { PoolLayout.white_on_right : messages_pb2.WhiteOnRight,
+             PoolLayout.white_on_left  : messages_pb2.WhiteOnLeft
+           }[gamemanager_enum]
+
+
+class LegacyHandler(UWHProtoHandler):
+    def recv_message(self, sender, kind, msg):
+        if kind == messages_pb2.MessageType_Ping:
+            self.handle_Ping(sender, msg)
+        elif kind == messages_pb2.MessageType_GameKeyFrame:
+            self.handle_GameKeyFrame(sender, msg)
+        elif kind == messages_pb2.MessageType_Penalty:
+            self.handle_Penalty(sender, msg)
+        elif kind == messages_pb2.MessageType_Goal:
+            self.handle_Goal(sender, msg)
+        elif kind == messages_pb2.MessageType_GameTime:
+            self.handle_GameTime(sender, msg)
+
+    def message_for_msg_kind(self, msg_kind):
+        return { messages_pb2.MessageType_Ping : messages_pb2.Ping,
+                 messages_pb2.MessageType_Pong : messages_pb2.Pong,
+                 messages_pb2.MessageType_GameKeyFrame : messages_pb2.GameKeyFrame,
+                 messages_pb2.MessageType_Penalty : messages_pb2.Penalty,
+                 messages_pb2.MessageType_Goal : messages_pb2.Goal,
+                 messages_pb2.MessageType_GameTime : messages_pb2.GameTime,
+               }[msg_kind]()
+
+    def get_GameKeyFrame(self):
+        kind = messages_pb2.MessageType_GameKeyFrame
+        msg = self.message_for_msg_kind(kind)
+        msg.ClockRunning = self._mgr.gameClockRunning()
+        msg.TimeLeft = max(0, int(self._mgr.gameClock()))
+        msg.BlackScore = self._mgr.blackScore()
+        msg.WhiteScore = self._mgr.whiteScore()
+        msg.Period = legacy_gs_to_proto_enum(self._mgr.gameState())
+        msg.Timeout = legacy_ts_to_proto_enum(self._mgr.timeoutState())
+        msg.Layout = legacy_l_to_proto_enum(self._mgr.layout())
+        msg.tid = self._mgr.tid()
+        msg.gid = self._mgr.gid()
+        msg.TimeAtPause = max(0, int(self._mgr.gameClockAtPause()))
+
+        return (kind, msg)
+
+
+def game():
+    mgr = GameManager()
+    mgr.setGameState(GameState.first_half)
+    mgr.setTimeoutState(TimeoutState.none)
+    mgr.setLayout(PoolLayout.white_on_right)
+    mgr.setGameClock(600)
+    mgr.setTid(1)
+    mgr.setGid(2)
+    for n in range(3):
+        mgr.addWhiteGoal(n + 1)
+        mgr.addPenalty(Penalty(n + 10, TeamColor.black, 60))
+    return mgr
+
+
+def cases(handler):
+    (kind, keyframe) = handler.get_GameKeyFrame()
+    keyframe_raw = handler.pack_message(kind, keyframe)
+    (kind, penalties) = handler.get_Penalties()
+    penalty_raw = handler.pack_message(kind, penalties[0])
+
+    def encode_keyframe():
+        (kind, msg) = handler.get_GameKeyFrame()
+        handler.pack_message(kind, msg)
+
+    def encode_penalties():
+        (kind, msgs) = handler.get_Penalties()
+        for msg in msgs:
+            handler.pack_message(kind, msg)
+
+    def decode_keyframe():
+        handler.recv_raw(None, keyframe_raw)
+
+    def decode_penalty():
+        handler.recv_raw(None, penalty_raw)
+
+    return [('encode GameKeyFrame', encode_keyframe),
+            ('encode Penalty x6', encode_penalties),
+            ('decode GameKeyFrame', decode_keyframe),
+            ('decode Penalty', decode_penalty)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    before = cases(LegacyHandler(game()))
+    after = cases(UWHProtoHandler(game()))
+
+    print('%-22s %12s %12s %8s' % ('', 'before (us)', 'after (us)', 'speedup'))
+    for ((name, old), (_, new)) in zip(before, after):
+        t_old = min(timeit.repeat(old, number=args.number, repeat=3)) / args.number
+        t_new = min(timeit.repeat(new, number=args.number, repeat=3)) / args.number
+        print('%-22s %12.2f %12.2f %7.2fx' % (name, t_old * 1e6, t_new * 1e6,
+                                             t_old / t_new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+""" Throughput of the comms encode/decode and broadcast paths.
+
+    Covers building messages from a GameManager, packing and unpacking them,
+    dispatching received frames into a GameManager with observers, and whole
+    broadcast cycles over an in-memory loopback, for a few game sizes.
+
+    Run from the top of the repository:
+
+        python bench/bench_comms.py [--number N] [--repeat N] [--json FILE]
+
+    --json writes the results as JSON ('-' for stdout), to compare across
+    releases.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.protobuf import __version__ as protobuf_version
+from google.protobuf.internal import api_implementation
+
+from uwh.comms import UWHProtoHandler, DeltaTracker
+from uwh.gamemanager import GameManager, GameState, TeamColor, Penalty
+
+# (name, penalties, goals): an empty game, a typical one, and a rout with a
+# pile of penalties
+GAMES = [
+    ('empty', 0, 0),
+    ('typical', 4, 8),
+    ('heavy', 16, 30),
+]
+
+
+def game(penalties, goals, observers=None):
+    mgr = GameManager(observers)
+    mgr.setTid(1)
+    mgr.setGid(42)
+    mgr.setGameState(GameState.second_half)
+    mgr.setGameClock(600)
+    for n in range(penalties):
+        team = TeamColor.white if n % 2 else TeamColor.black
+        mgr.addPenalty(Penalty(n + 1, team, 120, start_time=700 - n))
+    for n in range(goals):
+        if n % 2:
+            mgr.addWhiteGoal(n + 1)
+        else:
+            mgr.addBlackGoal(n + 1)
+    return mgr
+
+
+class Loopback(UWHProtoHandler):
+    """ Hands every frame straight to the clients' recv_raw """
+
+    def __init__(self, mgr, clients):
+        UWHProtoHandler.__init__(self, mgr)
+        self.clients = clients
+        self.frames = 0
+        self.bytes = 0
+
+    def send_raw(self, recipient, data):
+        self.frames += 1
+        self.bytes += len(data)
+        recipient.recv_raw(self, data)
+        return True
+
+
+def strip_seq(frames, handler):
+    """ Re-pack frames without record sequence numbers, as an older server
+        would send them, so every record gets applied again """
+    stripped = []
+    for frame in frames:
+        (kind, msg) = handler.unpack_message(frame)
+        if 'Seq' in msg.DESCRIPTOR.fields_by_name:
+            msg.ClearField('Seq')
+        stripped.append(handler.pack_message(kind, msg))
+    return stripped
+
+
+def cases(penalties, goals):
+    """ (name, callable, extra) for one game size """
+    mgr = game(penalties, goals)
+    handler = UWHProtoHandler(mgr)
+
+    msgs = handler.get_Cycle()
+    frames = [handler.pack_message(kind, msg) for (kind, msg) in msgs]
+
+    yield ('get_GameKeyFrame', handler.get_GameKeyFrame, {})
+    yield ('get_Penalties', handler.get_Penalties, {})
+    yield ('get_Goals', handler.get_Goals, {})
+
+    def pack():
+        for (kind, msg) in msgs:
+            handler.pack_message(kind, msg)
+    yield ('pack_message', pack, {'messages': len(msgs)})
+
+    def unpack():
+        for frame in frames:
+            handler.unpack_message(frame)
+    yield ('unpack_message', unpack, {'messages': len(frames)})
+
+    observers = [GameManager(), GameManager()]
+    receiver = UWHProtoHandler(GameManager(observers))
+    for frame in frames:
+        receiver.recv_raw(None, frame)
+
+    def dispatch_versioned():
+        for frame in frames:
+            receiver.recv_raw(None, frame)
+    yield ('recv_raw', dispatch_versioned,
+           {'messages': len(frames), 'observers': len(observers)})
+
+    unversioned = strip_seq(frames, handler)
+
+    def dispatch_unversioned():
+        for frame in unversioned:
+            receiver.recv_raw(None, frame)
+    yield ('recv_raw_unversioned', dispatch_unversioned,
+           {'messages': len(frames), 'observers': len(observers)})
+
+    def loopback(name, cycle, **extra):
+        client = UWHProtoHandler(GameManager())
+        server = Loopback(mgr, [client])
+        cycle(server, client)
+        server.frames = server.bytes = 0
+        number = [0]
+
+        def run():
+            cycle(server, client)
+            number[0] += 1
+
+        def stats():
+            n = max(number[0], 1)
+            return dict(extra, frames_per_cycle=server.frames / n,
+                        bytes_per_cycle=server.bytes / n)
+        return (name, run, stats)
+
+    yield loopback('cycle_full',
+                   lambda s, c: s.send_messages(c, s.get_Cycle()))
+    yield loopback('cycle_full_batched',
+                   lambda s, c: s.send_messages(c, s.get_Cycle(), batch=True),
+                   mtu=UWHProtoHandler.mtu)
+
+    def snapshot(s, c):
+        (kind, msgs) = s.get_GameSnapshot()
+        s.send_messages(c, [(kind, msg) for msg in msgs])
+    yield loopback('cycle_snapshot', snapshot)
+
+    tracker = DeltaTracker(resync_interval=3600)
+    yield loopback('cycle_delta_idle',
+                   lambda s, c: s.send_Delta(c, tracker))
+
+
+def measure(fn, number, repeat):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--number', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', metavar='FILE')
+    args = parser.parse_args()
+
+    results = []
+    for (game_name, penalties, goals) in GAMES:
+        for (name, fn, extra) in cases(penalties, goals):
+            seconds = measure(fn, args.number, args.repeat)
+            if callable(extra):
+                extra = extra()
+            results.append(dict(extra, benchmark=name, game=game_name,
+                                penalties=penalties, goals=goals,
+                                us_per_op=seconds * 1e6))
+
+    if args.json:
+        report = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'protobuf': protobuf_version,
+            'protobuf_api': api_implementation.Type(),
+            'number': args.number,
+            'repeat': args.repeat,
+            'results': results,
+        }
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+        return
+
+    print('%-22s %-8s %12s' % ('benchmark', 'game', 'us/op'))
+    for r in results:
+        print('%-22s %-8s %12.2f' % (r['benchmark'], r['game'], r['us_per_op']))
+
+
+if __name__ == '__main__':
+    main()
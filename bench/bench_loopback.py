@@ -0,0 +1,125 @@
+""" End-to-end scoreboard latency and broadcast throughput for N clients,
+    over the hardware-free transports in uwh.loopback_comms.
+
+    Latency is from a goal being scored on the server's GameManager to each
+    client's GameManager showing it. Throughput is what the broadcast loop
+    put on the wire meanwhile.
+
+    Run from the top of the repository:
+
+        python bench/bench_loopback.py [--transport loopback|serial|pty]
+            [--clients N] [--baud N] [--loss P] [--reorder P] [--corrupt P]
+            [--goals N] [--delta] [--batch] [--event-driven]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uwh.gamemanager import GameManager, GameState
+from uwh.loopback_comms import LinkModel, LoopbackBus, LoopbackServer, LoopbackClient, SerialBus
+from uwh.rs485_comms import RS485Server, RS485Client
+
+
+def game():
+    mgr = GameManager()
+    mgr.setTid(1)
+    mgr.setGid(42)
+    mgr.setGameState(GameState.second_half)
+    mgr.setGameClock(600)
+    return mgr
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--transport', choices=['loopback', 'serial', 'pty'],
+                        default='loopback')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--loss', type=float, default=0)
+    parser.add_argument('--reorder', type=float, default=0)
+    parser.add_argument('--corrupt', type=float, default=0)
+    parser.add_argument('--framing', default='hex')
+    parser.add_argument('--goals', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--delta', action='store_true')
+    parser.add_argument('--batch', action='store_true')
+    parser.add_argument('--event-driven', action='store_true')
+    args = parser.parse_args()
+
+    # Corrupt frames get logged by the clients; that's expected here
+    logging.disable(logging.CRITICAL)
+
+    link = LinkModel(baud=args.baud or None, latency=args.latency,
+                     loss=args.loss, reorder=args.reorder, corrupt=args.corrupt)
+    mgr = game()
+    stop = threading.Event()
+    if args.transport == 'loopback':
+        bus = LoopbackBus(link)
+        server = LoopbackServer(mgr, bus)
+        clients = [LoopbackClient(GameManager(), bus) for _ in range(args.clients)]
+        server.broadcast_thread(args.delta, args.interval, 5, args.event_driven,
+                                args.batch, stop=stop)
+    else:
+        bus = SerialBus(args.clients, link, args.framing,
+                        pty=args.transport == 'pty')
+        server = RS485Server(mgr, bus.server_port, args.baud, args.framing)
+        clients = [RS485Client(GameManager(), port, args.baud, args.framing)
+                   for port in bus.client_ports]
+        for c in clients:
+            c.listen_thread()
+        server.broadcast_thread(args.delta, args.interval, 5, args.event_driven,
+                                args.batch, stop=stop)
+
+    latencies = []
+    missed = 0
+    start = time.monotonic()
+    start_stats = bus.stats()
+    for n in range(args.goals):
+        mgr.addWhiteGoal(n + 1)
+        score = mgr.whiteScore()
+        scored_at = time.monotonic()
+        pending = set(range(len(clients)))
+        while pending and time.monotonic() - scored_at < args.timeout:
+            for idx in list(pending):
+                if clients[idx]._mgr.whiteScore() >= score:
+                    latencies.append(time.monotonic() - scored_at)
+                    pending.discard(idx)
+            time.sleep(0.0005)
+        missed += len(pending)
+    elapsed = time.monotonic() - start
+    end_stats = bus.stats()
+    stop.set()
+
+    sent = dict((k, end_stats[k] - start_stats[k]) for k in end_stats)
+    print('%s, %d clients, %s baud, loss %g, reorder %g, corrupt %g'
+          % (args.transport, args.clients, args.baud or 'unlimited',
+             args.loss, args.reorder, args.corrupt))
+    if latencies:
+        print('latency ms: mean %.2f  p50 %.2f  p95 %.2f  max %.2f'
+              % (1e3 * sum(latencies) / len(latencies),
+                 1e3 * percentile(latencies, 0.5),
+                 1e3 * percentile(latencies, 0.95),
+                 1e3 * max(latencies)))
+    print('updates: %d seen, %d missed after %gs'
+          % (len(latencies), missed, args.timeout))
+    print('throughput: %.1f frames/s, %.0f bytes/s on the wire, '
+          '%d deliveries, %d lost'
+          % (sent['frames'] / elapsed, sent['bytes'] / elapsed,
+             sent['delivered'], sent['lost']))
+    bus.close()
+
+
+if __name__ == '__main__':
+    main()
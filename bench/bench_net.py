@@ -0,0 +1,115 @@
+""" Scoreboard latency and per-display round trips for N displays on the
+    UDP multicast transport, all on this machine.
+
+    Latency is from a goal being scored on the server's GameManager to each
+    display's GameManager showing it. Round trips are the server's own
+    per-client Ping statistics.
+
+    Run from the top of the repository:
+
+        python bench/bench_net.py [--clients N] [--interval S] [--goals N]
+            [--delta] [--batch] [--event-driven] [--tcp]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uwh.gamemanager import GameManager, GameState, TeamColor, Penalty
+from uwh.net_comms import NetServer, NetClient
+
+
+def game(penalties):
+    mgr = GameManager()
+    mgr.setTid(1)
+    mgr.setGid(42)
+    mgr.setGameState(GameState.second_half)
+    mgr.setGameClock(600)
+    for n in range(penalties):
+        team = TeamColor.white if n % 2 else TeamColor.black
+        mgr.addPenalty(Penalty(n + 1, team, 120))
+    return mgr
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def ms(seconds):
+    return 1e3 * seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--group', default='239.255.42.1')
+    parser.add_argument('--port', type=int, default=4280)
+    parser.add_argument('--interface', default='127.0.0.1')
+    parser.add_argument('--interval', type=float, default=0.1)
+    parser.add_argument('--penalties', type=int, default=4)
+    parser.add_argument('--goals', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--delta', action='store_true')
+    parser.add_argument('--batch', action='store_true')
+    parser.add_argument('--event-driven', action='store_true')
+    parser.add_argument('--tcp', action='store_true',
+                        help='have every display hold a catch-up connection')
+    args = parser.parse_args()
+
+    mgr = game(args.penalties)
+    server = NetServer(mgr, args.group, args.port,
+                       tcp_port=0 if args.tcp else None,
+                       interface=args.interface)
+    clients = [NetClient(GameManager(), args.group, args.port,
+                         server=server.tcp_address(), interface=args.interface)
+               for _ in range(args.clients)]
+    stop = threading.Event()
+    for c in clients:
+        c.listen_thread(stop)
+    server.broadcast_thread(args.delta, args.interval, 5, args.event_driven,
+                            args.batch, ping_interval=0.2, stop=stop)
+
+    latencies = []
+    missed = 0
+    for n in range(args.goals):
+        mgr.addWhiteGoal(n + 1)
+        score = mgr.whiteScore()
+        scored_at = time.monotonic()
+        pending = set(range(len(clients)))
+        while pending and time.monotonic() - scored_at < args.timeout:
+            for idx in list(pending):
+                if clients[idx]._mgr.whiteScore() >= score:
+                    latencies.append(time.monotonic() - scored_at)
+                    pending.discard(idx)
+            time.sleep(0.0005)
+        missed += len(pending)
+
+    stats = server.client_stats()
+    stop.set()
+
+    print('%d displays, %g s interval%s%s%s' % (
+        args.clients, args.interval, ', delta' if args.delta else '',
+        ', batched' if args.batch else '',
+        ', event driven' if args.event_driven else ''))
+    if latencies:
+        print('goal latency ms: mean %.2f  p50 %.2f  p95 %.2f  max %.2f'
+              % (ms(sum(latencies) / len(latencies)),
+                 ms(percentile(latencies, 0.5)),
+                 ms(percentile(latencies, 0.95)), ms(max(latencies))))
+    print('updates: %d seen, %d missed after %gs'
+          % (len(latencies), missed, args.timeout))
+    print()
+    print('%-22s %6s %6s %6s %9s %9s %9s'
+          % ('display', 'pings', 'pongs', 'loss', 'min ms', 'mean ms', 'max ms'))
+    for (addr, s) in sorted(stats.items()):
+        print('%-22s %6d %6d %5.1f%% %9.2f %9.2f %9.2f'
+              % ('%s:%d' % addr, s['pings'], s['pongs'], 100 * s['loss'],
+                 ms(s['min']), ms(s['mean']), ms(s['max'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+""" Memory and allocation cost of Penalty and Goal, slotted against the
+    plain dict-backed classes they replaced, and on a client receiving
+    continuous broadcasts from a server too old to send record sequence
+    numbers (so every message allocates a fresh record).
+
+    Run from the top of the repository:
+
+        python bench/bench_records.py [--count N] [--cycles N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uwh.comms import UWHProtoHandler
+from uwh.gamemanager import GameManager, GameState, TeamColor, Penalty, Goal
+
+
+class DictPenalty(object):
+    def __init__(self, player, team, duration, start_time=None,
+                 duration_remaining=None):
+        self._player = player
+        self._team = team
+        self._start_time = None if start_time is None else int(start_time)
+        self._duration = int(duration)
+        self._duration_remaining = int(duration_remaining or duration)
+        self._seq = 0
+
+
+class DictGoal(object):
+    def __init__(self, goal_no, player, team, time, state):
+        self._goal_no = goal_no
+        self._player = player
+        self._team = team
+        self._time = int(time)
+        self._state = state
+        self._seq = 0
+
+
+def bytes_per_object(make, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objs = [make(n) for n in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    # Don't count the list holding them
+    size -= sys.getsizeof(objs)
+    return size / count
+
+
+def receive(cycles):
+    """ Per-cycle allocations on a client fed unversioned records """
+    s_mgr = GameManager()
+    s_mgr.setTid(1)
+    s_mgr.setGid(1)
+    s_mgr.setGameState(GameState.second_half)
+    for n in range(6):
+        s_mgr.addPenalty(Penalty(n, TeamColor.white, 120))
+        s_mgr.addWhiteGoal(n)
+        s_mgr.addBlackGoal(n)
+    server = UWHProtoHandler(s_mgr)
+
+    frames = []
+    for (kind, msg) in server.get_Cycle():
+        if 'Seq' in msg.DESCRIPTOR.fields_by_name:
+            msg.ClearField('Seq')
+        frames.append(server.pack_message(kind, msg))
+
+    client = UWHProtoHandler(GameManager())
+    for frame in frames:
+        client.recv_raw(None, frame)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(cycles):
+        for frame in frames:
+            client.recv_raw(None, frame)
+    elapsed = time.perf_counter() - start
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (len(frames), elapsed / cycles, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--cycles', type=int, default=2000)
+    args = parser.parse_args()
+
+    cases = [
+        ('Penalty', lambda n: DictPenalty(n, TeamColor.white, 60),
+                    lambda n: Penalty(n, TeamColor.white, 60)),
+        ('Goal', lambda n: DictGoal(n, n, TeamColor.white, 60, 1),
+                 lambda n: Goal(n, n, TeamColor.white, 60, 1)),
+    ]
+    print('%-10s %16s %16s' % ('', 'dict (bytes)', 'slots (bytes)'))
+    for (name, old, new) in cases:
+        print('%-10s %16.1f %16.1f' % (name, bytes_per_object(old, args.count),
+                                       bytes_per_object(new, args.count)))
+
+    (messages, per_cycle, peak) = receive(args.cycles)
+    print()
+    print('client receiving %d messages per cycle: %.1f us per cycle, '
+          'peak traced memory %d bytes' % (messages, per_cycle * 1e6, peak))
+
+
+if __name__ == '__main__':
+    main()
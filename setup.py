@@ -4,5 +4,7 @@ setup(
     name='uwh-common',
     version='1.0.0',
     packages=find_packages(),
+    # messages_pb2.py is generated for the 3.20+ runtime
+    install_requires=['protobuf>=3.20'],
     scripts=[],
 )
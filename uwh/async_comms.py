@@ -0,0 +1,162 @@
+""" An asyncio core for the transports. Each transport only moves frames:
+    it hands what arrives to the core on the event loop, and sends what the
+    core gives it. The core runs the protocol, applies what arrives to the
+    GameManager under its lock, builds each broadcast cycle from a single
+    snapshot of it, and has one scheduler deciding when cycles go out.
+
+    The scheduler awaits every frame of a cycle before it builds the next,
+    so a slow link stretches the cycle instead of piling up a backlog, and a
+    change made meanwhile goes out with the latest state rather than behind
+    a queue of stale ones. """
+
+from .comms import UWHProtoHandler, DeltaTracker
+
+import asyncio
+import logging
+
+
+class Transport(object):
+    """ What AsyncEndpoint expects of a transport """
+
+    def open(self, loop, deliver):
+        """ Start receiving. `deliver(sender, packet)` must be called on
+            `loop`, once per packet. """
+        raise NotImplementedError("Not Yet Implemented")
+
+    async def send(self, recipient, packet):
+        """ Send one packet. May return False if `recipient` did not
+            acknowledge it. """
+        raise NotImplementedError("Not Yet Implemented")
+
+    def close(self):
+        pass
+
+
+class AsyncEndpoint(UWHProtoHandler):
+    """ A server or client on one Transport. Answers to what arrives (pongs,
+        resync replies) go through a bounded queue; when it is full they are
+        dropped and counted in `dropped`, as the link would have lost them
+        anyway. """
+
+    def __init__(self, mgr, transport, max_replies=32):
+        UWHProtoHandler.__init__(self, mgr)
+        self._transport = transport
+        self._max_replies = max_replies
+        self._replies = None
+        self._medium = None
+        self._tasks = []
+        self.dropped = 0
+
+    def open(self):
+        """ Start receiving and answering, on the running loop """
+        loop = asyncio.get_running_loop()
+        self._replies = asyncio.Queue(self._max_replies)
+        # Broadcasts and replies take turns on the transport
+        self._medium = asyncio.Lock()
+        self._transport.open(loop, self._deliver)
+        self._tasks.append(loop.create_task(self._reply_loop()))
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._transport.close()
+
+    def _deliver(self, sender, packet):
+        try:
+            with self._mgr.lock():
+                self.recv_raw(sender, packet)
+        except Exception:
+            logging.exception("Problem handling packet")
+
+    def send_raw(self, recipient, data):
+        try:
+            self._replies.put_nowait((recipient, bytes(data)))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    async def _reply_loop(self):
+        while True:
+            (recipient, data) = await self._replies.get()
+            try:
+                async with self._medium:
+                    await self._transport.send(recipient, data)
+            except Exception:
+                logging.exception("Problem sending reply")
+
+    async def _send_frames(self, recipient, frames, tracker=None, full=False):
+        """ send_frames, over the transport """
+        for (frame, msgs) in frames:
+            async with self._medium:
+                delivered = await self._transport.send(recipient, frame)
+            if delivered is False:
+                return False
+            if tracker is not None:
+                for (kind, msg) in msgs:
+                    tracker.mark_sent(kind, msg)
+        if full:
+            tracker.resynced()
+        return True
+
+    async def broadcast(self, recipients=('',), delta=False, interval=0.1,
+                        resync_interval=5, event_driven=False, batch=False,
+                        snapshot=False, drift_threshold=None):
+        """ The scheduler: send cycles to `recipients` until cancelled. The
+            options mean what they do for RS485Server.broadcast_loop. """
+        loop = asyncio.get_running_loop()
+        trackers = { r : DeltaTracker(resync_interval, drift_threshold)
+                     for r in recipients }
+        listener = self._mgr.listen() if event_driven else None
+        changed = listener.asyncio_event(loop) if listener else None
+        try:
+            while True:
+                started = loop.time()
+                if changed is not None:
+                    changed.clear()
+                    listener.poll()
+
+                try:
+                    plan = self.plan_Cycle(recipients, trackers, delta, batch,
+                                           snapshot)
+                    for (recipient, frames, tracker, full) in plan:
+                        await self._send_frames(recipient, frames, tracker, full)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logging.exception("Problem sending broadcast cycle")
+
+                if changed is None:
+                    timeout = interval
+                elif self._mgr.gameClockRunning():
+                    # A running clock changes without telling anybody
+                    timeout = interval
+                else:
+                    timeout = resync_interval
+                remaining = started + timeout - loop.time()
+                if changed is None:
+                    await asyncio.sleep(max(0, remaining))
+                elif remaining > 0:
+                    try:
+                        await asyncio.wait_for(changed.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            if listener is not None:
+                listener.close()
+
+    async def serve(self, recipients=('',), **broadcast_args):
+        """ Open, then broadcast until cancelled """
+        self.open()
+        try:
+            await self.broadcast(recipients, **broadcast_args)
+        finally:
+            self.close()
+
+    async def listen(self):
+        """ Open, then receive until cancelled """
+        self.open()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            self.close()
@@ -0,0 +1,86 @@
+from .async_comms import Transport, AsyncEndpoint
+from .gamemanager import GameManager, TeamColor
+from .loopback_comms import SerialBus
+from .rs485_comms import SerialTransport
+from .testing import game, wait_for_async
+
+import asyncio
+
+
+class SlowTransport(Transport):
+    """ Takes `delay` seconds over every packet """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.sent = []
+
+    def open(self, loop, deliver):
+        self.deliver = deliver
+
+    async def send(self, recipient, packet):
+        await asyncio.sleep(self.delay)
+        self.sent.append((recipient, packet))
+
+
+def test_serial():
+    bus = SerialBus(clients=2)
+    mgr = game()
+    server = AsyncEndpoint(mgr, SerialTransport(bus.server_port))
+    clients = [AsyncEndpoint(GameManager(), SerialTransport(port))
+               for port in bus.client_ports]
+
+    async def run():
+        tasks = [asyncio.ensure_future(c.listen()) for c in clients]
+        tasks.append(asyncio.ensure_future(
+            server.serve(delta=True, batch=True, event_driven=True,
+                         resync_interval=60)))
+        try:
+            for c in clients:
+                assert await wait_for_async(lambda: c._mgr.whiteScore() == 3)
+                assert await wait_for_async(
+                    lambda: len(c._mgr.penalties(TeamColor.black)) == 1)
+            # Scored from another thread, like the UI would
+            await asyncio.get_running_loop().run_in_executor(
+                None, mgr.addBlackGoal, 5)
+            for c in clients:
+                assert await wait_for_async(lambda: c._mgr.blackScore() == 1)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    try:
+        asyncio.run(run())
+    finally:
+        bus.close()
+
+
+def test_back_pressure():
+    transport = SlowTransport(0.01)
+    server = AsyncEndpoint(game(), transport)
+
+    async def run():
+        task = asyncio.ensure_future(server.serve(interval=0))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    # Each cycle waits for the last one to go out, so nothing piles up and
+    # no more gets sent than the link can carry
+    assert 10 <= len(transport.sent) <= 21
+
+
+def test_replies_dropped_when_full():
+    transport = SlowTransport(1)
+    client = AsyncEndpoint(GameManager(), transport, max_replies=2)
+
+    async def run():
+        client.open()
+        for n in range(5):
+            client.send_raw('', b'\x00' * n)
+        client.close()
+
+    asyncio.run(run())
+    # The reply task never got a look in, so two fitted in the queue
+    assert client.dropped == 3
@@ -1,91 +1,281 @@
 from . import messages_pb2
 from .gamemanager import GameState, TimeoutState, TeamColor, Goal, Penalty, PoolLayout
 
+import logging
+import time
+
+_GS_FROM_PROTO = {
+    messages_pb2.GameState_GameOver        : GameState.game_over,
+    messages_pb2.GameState_PreGame         : GameState.pre_game,
+    messages_pb2.GameState_FirstHalf       : GameState.first_half,
+    messages_pb2.GameState_HalfTime        : GameState.half_time,
+    messages_pb2.GameState_SecondHalf      : GameState.second_half,
+    messages_pb2.GameState_WallClock       : GameState.game_over, # bold-faced lie
+    messages_pb2.GameState_OTFirst         : GameState.ot_first,
+    messages_pb2.GameState_OTHalf          : GameState.ot_half,
+    messages_pb2.GameState_OTSecond        : GameState.ot_second,
+    messages_pb2.GameState_SuddenDeath     : GameState.sudden_death,
+    messages_pb2.GameState_PreOT           : GameState.pre_ot,
+    messages_pb2.GameState_PreSuddenDeath  : GameState.pre_sudden_death,
+}
+
+_TS_FROM_PROTO = {
+    messages_pb2.TimeoutState_None         : TimeoutState.none,
+    messages_pb2.TimeoutState_RefTimeout   : TimeoutState.ref,
+    messages_pb2.TimeoutState_WhiteTimeout : TimeoutState.white,
+    messages_pb2.TimeoutState_BlackTimeout : TimeoutState.black,
+    messages_pb2.TimeoutState_PenaltyShot  : TimeoutState.penalty_shot,
+}
+
+_L_FROM_PROTO = {
+    messages_pb2.WhiteOnRight : PoolLayout.white_on_right,
+    messages_pb2.WhiteOnLeft  : PoolLayout.white_on_left
+}
+
+_GS_TO_PROTO = {
+    GameState.game_over        : messages_pb2.GameState_GameOver,
+    GameState.pre_game         : messages_pb2.GameState_PreGame,
+    GameState.first_half       : messages_pb2.GameState_FirstHalf,
+    GameState.half_time        : messages_pb2.GameState_HalfTime,
+    GameState.second_half      : messages_pb2.GameState_SecondHalf,
+    GameState.ot_first         : messages_pb2.GameState_OTFirst,
+    GameState.ot_half          : messages_pb2.GameState_OTHalf,
+    GameState.ot_second        : messages_pb2.GameState_OTSecond,
+    GameState.sudden_death     : messages_pb2.GameState_SuddenDeath,
+    GameState.pre_ot           : messages_pb2.GameState_PreOT,
+    GameState.pre_sudden_death : messages_pb2.GameState_PreSuddenDeath,
+}
+
+_TS_TO_PROTO = {
+    TimeoutState.none         : messages_pb2.TimeoutState_None,
+    TimeoutState.ref          : messages_pb2.TimeoutState_RefTimeout,
+    TimeoutState.white        : messages_pb2.TimeoutState_WhiteTimeout,
+    TimeoutState.black        : messages_pb2.TimeoutState_BlackTimeout,
+    TimeoutState.penalty_shot : messages_pb2.TimeoutState_PenaltyShot,
+}
+
+_L_TO_PROTO = {
+    PoolLayout.white_on_right : messages_pb2.WhiteOnRight,
+    PoolLayout.white_on_left  : messages_pb2.WhiteOnLeft
+}
+
 def gs_from_proto_enum(proto_enum):
-    return { messages_pb2.GameState_GameOver        : GameState.game_over,
-             messages_pb2.GameState_PreGame         : GameState.pre_game,
-             messages_pb2.GameState_FirstHalf       : GameState.first_half,
-             messages_pb2.GameState_HalfTime        : GameState.half_time,
-             messages_pb2.GameState_SecondHalf      : GameState.second_half,
-             messages_pb2.GameState_WallClock       : GameState.game_over, # bold-faced lie
-             messages_pb2.GameState_OTFirst         : GameState.ot_first,
-             messages_pb2.GameState_OTHalf          : GameState.ot_half,
-             messages_pb2.GameState_OTSecond        : GameState.ot_second,
-             messages_pb2.GameState_SuddenDeath     : GameState.sudden_death,
-             messages_pb2.GameState_PreOT           : GameState.pre_ot,
-             messages_pb2.GameState_PreSuddenDeath  : GameState.pre_sudden_death,
-           }[proto_enum]
+    return _GS_FROM_PROTO[proto_enum]
 
 def ts_from_proto_enum(proto_enum):
-    return {
-             messages_pb2.TimeoutState_None         : TimeoutState.none,
-             messages_pb2.TimeoutState_RefTimeout   : TimeoutState.ref,
-             messages_pb2.TimeoutState_WhiteTimeout : TimeoutState.white,
-             messages_pb2.TimeoutState_BlackTimeout : TimeoutState.black,
-             messages_pb2.TimeoutState_PenaltyShot  : TimeoutState.penalty_shot,
-           }[proto_enum]
+    return _TS_FROM_PROTO[proto_enum]
 
 def l_from_proto_enum(proto_enum):
-    return {
-             messages_pb2.WhiteOnRight : PoolLayout.white_on_right,
-             messages_pb2.WhiteOnLeft  : PoolLayout.white_on_left
-           }[proto_enum]
+    return _L_FROM_PROTO[proto_enum]
 
 def gs_to_proto_enum(gamemanager_enum):
-    return { GameState.game_over        : messages_pb2.GameState_GameOver,
-             GameState.pre_game         : messages_pb2.GameState_PreGame,
-             GameState.first_half       : messages_pb2.GameState_FirstHalf,
-             GameState.half_time        : messages_pb2.GameState_HalfTime,
-             GameState.second_half      : messages_pb2.GameState_SecondHalf,
-             GameState.ot_first         : messages_pb2.GameState_OTFirst,
-             GameState.ot_half          : messages_pb2.GameState_OTHalf,
-             GameState.ot_second        : messages_pb2.GameState_OTSecond,
-             GameState.sudden_death     : messages_pb2.GameState_SuddenDeath,
-             GameState.pre_ot           : messages_pb2.GameState_PreOT,
-             GameState.pre_sudden_death : messages_pb2.GameState_PreSuddenDeath,
-           }[gamemanager_enum]
+    return _GS_TO_PROTO[gamemanager_enum]
 
 def ts_to_proto_enum(gamemanager_enum):
-    return { TimeoutState.none         : messages_pb2.TimeoutState_None,
-             TimeoutState.ref          : messages_pb2.TimeoutState_RefTimeout,
-             TimeoutState.white        : messages_pb2.TimeoutState_WhiteTimeout,
-             TimeoutState.black        : messages_pb2.TimeoutState_BlackTimeout,
-             TimeoutState.penalty_shot : messages_pb2.TimeoutState_PenaltyShot,
-           }[gamemanager_enum]
+    return _TS_TO_PROTO[gamemanager_enum]
 
 def l_to_proto_enum(gamemanager_enum):
-    return { PoolLayout.white_on_right : messages_pb2.WhiteOnRight,
-             PoolLayout.white_on_left  : messages_pb2.WhiteOnLeft
-           }[gamemanager_enum]
+    return _L_TO_PROTO[gamemanager_enum]
+
+
+# Wire kind -> protobuf message class, and the name of the UWHProtoHandler
+# method that handles it (None for ones that only get sent)
+_MESSAGE_CLASSES = {}
+_HANDLERS = {}
+
+def register_message_kind(kind, message_class, handler=None):
+    """ Teach every UWHProtoHandler about a new kind of message. `handler` is
+        the name of the method that receives it, as (sender, msg). A
+        `message_class` of None forgets the kind again. """
+    if 255 < kind:
+        raise ValueError("Message kind doesn't fit in one byte")
+    if message_class is None:
+        _MESSAGE_CLASSES.pop(kind, None)
+    else:
+        _MESSAGE_CLASSES[kind] = message_class
+    if handler is None:
+        _HANDLERS.pop(kind, None)
+    else:
+        _HANDLERS[kind] = handler
+
+register_message_kind(messages_pb2.MessageType_Ping, messages_pb2.Ping, 'handle_Ping')
+register_message_kind(messages_pb2.MessageType_Pong, messages_pb2.Pong)
+register_message_kind(messages_pb2.MessageType_GameKeyFrame, messages_pb2.GameKeyFrame, 'handle_GameKeyFrame')
+register_message_kind(messages_pb2.MessageType_Penalty, messages_pb2.Penalty, 'handle_Penalty')
+register_message_kind(messages_pb2.MessageType_Goal, messages_pb2.Goal, 'handle_Goal')
+register_message_kind(messages_pb2.MessageType_GameTime, messages_pb2.GameTime, 'handle_GameTime')
+register_message_kind(messages_pb2.MessageType_GameSnapshot, messages_pb2.GameSnapshot, 'handle_GameSnapshot')
+register_message_kind(messages_pb2.MessageType_ResyncRequest, messages_pb2.ResyncRequest, 'handle_ResyncRequest')
+
+# Bumped whenever GameSnapshot changes incompatibly
+SNAPSHOT_VERSION = 1
+
+
+class DeltaTracker(object):
+    """ Remembers what has been delivered to one recipient, so that a
+        broadcast only needs to carry what changed since then. A full
+        resync is forced every `resync_interval` seconds.
+
+        With a `drift_threshold`, the recipient is assumed to run its clock
+        on its own (see GameManager.setPassive), so a running clock is only
+        resent once it is that many seconds away from where the recipient
+        will have extrapolated it to. """
+
+    # Fields that tick along with a running clock
+    _CLOCK_FIELDS = ('TimeLeft', 'TimeLeftMs', 'TimeAtPause')
+
+    def __init__(self, resync_interval=5, drift_threshold=None):
+        self._resync_interval = resync_interval
+        self._drift_threshold = drift_threshold
+        self.reset()
+
+    def reset(self):
+        self._fields = {}
+        self._records = {}
+        self._last_resync = None
+        self._clock_sent = None
+
+    def resync_due(self):
+        return (self._last_resync is None or
+                time.monotonic() - self._last_resync >= self._resync_interval)
+
+    def resynced(self):
+        self._last_resync = time.monotonic()
+
+    def changed_fields(self, msg):
+        changed = [(fd, value) for (fd, value) in msg.ListFields()
+                   if self._fields.get(fd.name) != value]
+        if self._clock_extrapolated(msg):
+            changed = [(fd, value) for (fd, value) in changed
+                       if fd.name not in self._CLOCK_FIELDS]
+        return changed
+
+    def _clock_extrapolated(self, msg):
+        """ Whether the recipient's own clock is still close enough """
+        if (self._drift_threshold is None or self._clock_sent is None or
+            not msg.ClockRunning or not self._fields.get('ClockRunning')):
+            return False
+        (time_left, sent_at) = self._clock_sent
+        expected = time_left - (time.monotonic() - sent_at)
+        return abs(expected - clock_seconds(msg)) <= self._drift_threshold
+
+    def record_changed(self, kind, key, msg):
+        return self._records.get((kind, key)) != msg.SerializeToString()
+
+    def mark_sent(self, kind, msg):
+        if kind == messages_pb2.MessageType_GameKeyFrame:
+            if (msg.HasField('Period') and
+                self._fields.get('Period') != msg.Period):
+                # The recipient may drop its penalties and goals on a period
+                # change, so they all have to go out again.
+                self._records = {}
+            for (fd, value) in msg.ListFields():
+                self._fields[fd.name] = value
+            if msg.HasField('TimeLeft') or msg.HasField('TimeLeftMs'):
+                self._clock_sent = (clock_seconds(msg), time.monotonic())
+        else:
+            key = record_key(kind, msg)
+            if key is not None:
+                self._records[(kind, key)] = msg.SerializeToString()
+
+
+def clock_seconds(msg):
+    """ The clock carried by a keyframe, as precisely as it was sent """
+    if msg.HasField('TimeLeftMs'):
+        return msg.TimeLeftMs / 1000.0
+    return msg.TimeLeft
+
+
+def record_key(kind, msg):
+    if kind == messages_pb2.MessageType_Penalty:
+        return (msg.IsWhite, msg.PlayerNo, msg.Index)
+    elif kind == messages_pb2.MessageType_Goal:
+        return (msg.IsWhite, msg.GoalNo)
+    return None
 
 
 class UWHProtoHandler(object):
+    # Largest frame the transport carries in one transmission. Batches are
+    # packed up to this; a single message may still exceed it, as before.
+    mtu = 255
+
+    # Whether to ask the sender for penalties and goals that went missing.
+    # Only for transports where a client may talk back.
+    resync_requests = False
+
+    # Whether to send the game clock to the millisecond (TimeLeftMs) along
+    # with the whole seconds. It changes on every cycle while the clock runs.
+    fractional_clock = False
+
     def __init__(self, mgr):
         self._mgr = mgr
+        self._snapshot_seq = 0
+        self._fragments_seq = None
+        self._fragments = {}
+        self._announced_seq = 0
+        self._announced_count = 0
 
     def send_message(self, recipient, msg_kind, msg):
-        self.send_raw(recipient, self.pack_message(msg_kind, msg))
+        return self.send_raw(recipient, self.pack_message(msg_kind, msg))
+
+    def send_messages(self, recipient, msgs, batch=False):
+        """ Send a list of (kind, msg). With `batch`, they are packed into as
+            few frames as will fit, which only newer clients understand.
+            Returns False if any frame was not acknowledged. """
+        delivered = True
+        for (frame, _) in self.pack_frames(msgs, batch):
+            if self.send_raw(recipient, frame) is False:
+                delivered = False
+        return delivered
 
     def send_raw(self, recipient, data):
-        """ To be implemented by the deriving class """
+        """ To be implemented by the deriving class. May return False to
+            signal that the recipient did not acknowledge the data. """
         raise NotImplementedError("Not Yet Implemented")
 
+    def send_Delta(self, recipient, tracker, batch=False, state=None):
+        """ Send one broadcast cycle to `recipient`, skipping everything it
+            has already been sent according to `tracker` """
+        full = tracker.resync_due()
+        msgs = self.get_Delta(tracker, full=full, state=state)
+        return self.send_frames(recipient, self.pack_frames(msgs, batch),
+                                tracker, full)
+
+    def send_frames(self, recipient, frames, tracker=None, full=False):
+        """ Send frames from pack_frames, stopping at the first one that is
+            not acknowledged. What got through is marked as sent in
+            `tracker`, which counts as resynced if `full` all got through.
+            Returns False if a frame was not acknowledged. """
+        for (frame, sent) in frames:
+            if self.send_raw(recipient, frame) is False:
+                return False
+            if tracker is not None:
+                for (kind, msg) in sent:
+                    tracker.mark_sent(kind, msg)
+        if full:
+            tracker.resynced()
+        return True
+
+    def send_Cycle(self, recipients, trackers=None, delta=False, batch=False,
+                   snapshot=False):
+        """ Send one broadcast cycle to each of `recipients`, as planned by
+            plan_Cycle. Returns False if any of them missed a frame. """
+        delivered = True
+        for (recipient, frames, tracker, full) in self.plan_Cycle(
+                recipients, trackers, delta, batch, snapshot):
+            if not self.send_frames(recipient, frames, tracker, full):
+                delivered = False
+        return delivered
+
     def recv_message(self, sender, kind, msg):
-        if kind == messages_pb2.MessageType_Ping:
-            self.handle_Ping(sender, msg)
-        elif kind == messages_pb2.MessageType_GameKeyFrame:
-            self.handle_GameKeyFrame(sender, msg)
-        elif kind == messages_pb2.MessageType_Penalty:
-            self.handle_Penalty(sender, msg)
-        elif kind == messages_pb2.MessageType_Goal:
-            self.handle_Goal(sender, msg)
-        elif kind == messages_pb2.MessageType_GameTime:
-            self.handle_GameTime(sender, msg)
+        handler = _HANDLERS.get(kind)
+        if handler is not None:
+            getattr(self, handler)(sender, msg)
 
     def recv_raw(self, sender, data):
         try:
-            (kind, msg) = self.unpack_message(data)
-            self.recv_message(sender, kind, msg)
+            for (kind, msg) in self.unpack_messages(data):
+                self.recv_message(sender, kind, msg)
         except ValueError as e:
             print("had ValueError, recovering gracefully... ish")
             print(e)
@@ -98,13 +288,10 @@ class UWHProtoHandler(object):
         return msg.Data
 
     def message_for_msg_kind(self, msg_kind):
-        return { messages_pb2.MessageType_Ping : messages_pb2.Ping,
-                 messages_pb2.MessageType_Pong : messages_pb2.Pong,
-                 messages_pb2.MessageType_GameKeyFrame : messages_pb2.GameKeyFrame,
-                 messages_pb2.MessageType_Penalty : messages_pb2.Penalty,
-                 messages_pb2.MessageType_Goal : messages_pb2.Goal,
-                 messages_pb2.MessageType_GameTime : messages_pb2.GameTime,
-               }[msg_kind]()
+        try:
+            return _MESSAGE_CLASSES[msg_kind]()
+        except KeyError:
+            raise ValueError("Unknown message kind: " + str(msg_kind))
 
     def pack_message(self, msg_kind, msg):
         if 255 < msg_kind:
@@ -124,6 +311,70 @@ class UWHProtoHandler(object):
         msg.ParseFromString(data[2:])
         return (msg_kind, msg)
 
+    def pack_frames(self, msgs, batch=True):
+        """ Pack a list of (kind, msg) into frames, returned as a list of
+            (frame, msgs it carries). Without `batch`, that is one frame per
+            message.
+
+            A batch frame is [MessageType_Batch, count] followed by `count`
+            records, each laid out exactly like a single message frame. A
+            batch that would only hold one record goes out as a plain frame.
+            A client that doesn't know about batches can't look up their kind
+            and stalls until its read times out, so only batch for displays
+            that have been upgraded.
+        """
+        frames = []
+        records = []
+        batched = []
+        size = 2
+
+        def flush():
+            if len(records) == 1:
+                frames.append((records[0], batched))
+            elif records:
+                frame = bytearray([messages_pb2.MessageType_Batch, len(records)])
+                for record in records:
+                    frame += record
+                frames.append((frame, batched))
+
+        for (kind, msg) in msgs:
+            record = self.pack_message(kind, msg)
+            if not batch:
+                frames.append((record, [(kind, msg)]))
+                continue
+            if records and (size + len(record) > self.mtu or len(records) == 255):
+                flush()
+                records = []
+                batched = []
+                size = 2
+            records.append(record)
+            batched.append((kind, msg))
+            size += len(record)
+        flush()
+
+        return frames
+
+    def unpack_messages(self, data):
+        """ All the (kind, msg) in a frame, batched or not. A batch is
+            rejected as a whole if any of its records is malformed. """
+        if len(data) < 2:
+            raise ValueError("Malformed message: too short")
+        if data[0] != messages_pb2.MessageType_Batch:
+            return [self.unpack_message(data)]
+
+        count = data[1]
+        msgs = []
+        idx = 2
+        for _ in range(count):
+            if idx + 2 > len(data):
+                raise ValueError("Malformed batch: truncated record")
+            end = idx + 2 + data[idx + 1]
+            msgs.append(self.unpack_message(data[idx:end]))
+            idx = end
+        if idx != len(data):
+            raise ValueError("Malformed batch: trailing data")
+        return msgs
+
     def handle_Ping(self, sender, msg):
         kind = messages_pb2.MessageType_Pong
         pong = self.message_for_msg_kind(kind)
@@ -131,43 +382,78 @@ class UWHProtoHandler(object):
         self.send_message(sender, kind, pong)
 
     def handle_GameKeyFrame(self, sender, msg):
-        if msg.HasField('ClockRunning'):
-            self._mgr.setGameClockRunning(msg.ClockRunning)
-
-        if msg.HasField('TimeLeft'):
-            self._mgr.setGameClock(msg.TimeLeft)
-
-        if msg.HasField('BlackScore'):
-            self._mgr.setBlackScore(msg.BlackScore)
-
-        if msg.HasField('WhiteScore'):
-            self._mgr.setWhiteScore(msg.WhiteScore)
+        # Only touch what changed: every setter fans out to the observers
+        # and subscribers, and most keyframes repeat what we already have.
+        mgr = self._mgr
+        clock_toggled = (msg.HasField('ClockRunning') and
+                         msg.ClockRunning != mgr.gameClockRunning())
+        if clock_toggled:
+            mgr.setGameClockRunning(msg.ClockRunning)
+
+        time_left = None
+        if msg.HasField('TimeLeftMs'):
+            if msg.TimeLeftMs != self.as_ms(mgr.gameClockPrecise()):
+                time_left = self.received_clock(msg)
+        elif msg.HasField('TimeLeft') and msg.TimeLeft != mgr.gameClock():
+            time_left = self.received_clock(msg)
+        if time_left is not None:
+            if clock_toggled:
+                # The exact time the clock started or stopped at
+                mgr.setGameClock(time_left)
+            else:
+                mgr.syncGameClock(time_left)
+
+        if msg.HasField('BlackScore') and msg.BlackScore != mgr.blackScore():
+            mgr.setBlackScore(msg.BlackScore)
+
+        if msg.HasField('WhiteScore') and msg.WhiteScore != mgr.whiteScore():
+            mgr.setWhiteScore(msg.WhiteScore)
 
         if msg.HasField('Period'):
             period = gs_from_proto_enum(msg.Period)
-            if period == GameState.pre_game:
-                self._mgr.deleteAllPenalties()
-                self._mgr.delAllGoals()
-            elif (period == GameState.half_time or
-                  period == GameState.ot_half or
-                  period == GameState.pre_sudden_death):
-                self._mgr.deleteServedPenalties()
-            self._mgr.setGameState(period)
+            if period != mgr.gameState():
+                if period == GameState.pre_game:
+                    mgr.deleteAllPenalties()
+                    mgr.delAllGoals()
+                elif (period == GameState.half_time or
+                      period == GameState.ot_half or
+                      period == GameState.pre_sudden_death):
+                    mgr.deleteServedPenalties()
+                mgr.setGameState(period)
 
         if msg.HasField('Timeout'):
-            self._mgr.setTimeoutState(ts_from_proto_enum(msg.Timeout))
+            timeout = ts_from_proto_enum(msg.Timeout)
+            if timeout != mgr.timeoutState():
+                mgr.setTimeoutState(timeout)
 
         if msg.HasField('Layout'):
-            self._mgr.setLayout(l_from_proto_enum(msg.Layout))
-
-        if msg.HasField('tid'):
-            self._mgr.setTid(msg.tid)
-
-        if msg.HasField('gid'):
-            self._mgr.setGid(msg.gid)
-
-        if msg.HasField('TimeAtPause'):
-            self._mgr.setGameClockAtPause(msg.TimeAtPause)
+            layout = l_from_proto_enum(msg.Layout)
+            if layout != mgr.layout():
+                mgr.setLayout(layout)
+
+        if msg.HasField('tid') and msg.tid != mgr.tid():
+            mgr.setTid(msg.tid)
+
+        if msg.HasField('gid') and msg.gid != mgr.gid():
+            mgr.setGid(msg.gid)
+
+        if msg.HasField('TimeAtPause') and msg.TimeAtPause != mgr.timeAtPause():
+            mgr.setGameClockAtPause(msg.TimeAtPause)
+
+        if msg.HasField('RecordSeq') or msg.HasField('RecordCount'):
+            # The records announced by the last keyframe follow right behind
+            # it, so by now they should all have arrived. Missing ones newer
+            # than any we have show in the seq, older ones only in the count.
+            have = mgr.recordSeq()
+            if self.resync_requests:
+                if self._announced_count > mgr.recordCount():
+                    self.request_Resync(sender, 0)
+                elif self._announced_seq > have:
+                    self.request_Resync(sender, have)
+            if msg.HasField('RecordSeq'):
+                self._announced_seq = msg.RecordSeq
+            if msg.HasField('RecordCount'):
+                self._announced_count = msg.RecordCount
 
     def handle_Penalty(self, sender, msg):
         if (msg.HasField('PlayerNo') and
@@ -175,11 +461,25 @@ class UWHProtoHandler(object):
             msg.HasField('StartTime')):
             team = TeamColor.white if msg.IsWhite else TeamColor.black
             player_no = self.as_int(msg.PlayerNo)
+            # Each message stands for one of the player's penalties, in the
+            # same position as on the sender
+            held = self._mgr.penaltiesByPlayer(player_no, team)
+            count = msg.Count if msg.HasField('Count') else None
+            stale = count is not None and len(held) > count
+            current = held[msg.Index] if msg.Index < len(held) else None
+            if (not stale and msg.Seq and current is not None and
+                current.seq() == msg.Seq):
+                return
             pp = Penalty(player_no, team,
                          msg.Duration, start_time=msg.StartTime or None,
                          duration_remaining=msg.DurationRemaining)
-            self._mgr.delPenaltyByPlayer(player_no, team)
-            self._mgr.addPenalty(pp)
+            if (not stale and not msg.Seq and current is not None and
+                not current.seq() and current._fields() == pp._fields()):
+                # Old servers repeat everything every cycle
+                return
+            # Before it is ours, so that it costs no second snapshot
+            pp.setSeq(msg.Seq)
+            self._mgr.putPenalty(pp, msg.Index, count)
 
     def handle_Goal(self, sender, msg):
         if (msg.HasField('GoalNo') and
@@ -188,14 +488,113 @@ class UWHProtoHandler(object):
             msg.HasField('TimeLeft') and
             msg.HasField('Period')):
             team = TeamColor.white if msg.IsWhite else TeamColor.black
+            current = self._mgr.goalByNo(msg.GoalNo, team)
+            if msg.Seq and current is not None and current.seq() == msg.Seq:
+                return
             player_no = self.as_int(msg.PlayerNo)
             gg = Goal(msg.GoalNo, player_no, team,
                       msg.TimeLeft, gs_from_proto_enum(msg.Period))
-            self._mgr.delGoalByNo(msg.GoalNo, team)
-            self._mgr.addGoal(gg)
+            if not msg.Seq and current == gg and not current.seq():
+                # Old servers repeat everything every cycle
+                return
+            gg.setSeq(msg.Seq)
+            # One change, so one snapshot
+            with self._mgr.lock():
+                self._mgr.delGoalByNo(msg.GoalNo, team)
+                self._mgr.addGoal(gg)
 
     def handle_GameTime(self, sender, msg):
-        self._mgr.setGameClock(msg.TimeLeft)
+        self._mgr.syncGameClock(self.received_clock(msg))
+
+    def received_clock(self, msg):
+        """ The game clock carried by `msg`, in seconds. Without TimeLeftMs
+            the sender dropped the fraction, so its clock is somewhere in
+            the second above TimeLeft. A clock that runs on by itself starts
+            from the middle of that, rather than up to a second behind. """
+        if msg.HasField('TimeLeftMs'):
+            return msg.TimeLeftMs / 1000.0
+        if self._mgr.extrapolates() and msg.TimeLeft:
+            return msg.TimeLeft + 0.5
+        return msg.TimeLeft
+
+    def request_Resync(self, recipient, since):
+        kind = messages_pb2.MessageType_ResyncRequest
+        msg = self.message_for_msg_kind(kind)
+        msg.Since = since
+        self.send_message(recipient, kind, msg)
+
+    def handle_ResyncRequest(self, sender, msg):
+        state = self.state()
+        (pen_kind, pen_msgs) = self.get_Penalties(state)
+        (gol_kind, gol_msgs) = self.get_Goals(state)
+        msgs = ([(pen_kind, m) for m in pen_msgs if m.Seq > msg.Since] +
+                [(gol_kind, m) for m in gol_msgs if m.Seq > msg.Since])
+        # Only clients new enough to ask know about batches too
+        self.send_messages(sender, msgs, batch=True)
+
+    def handle_GameSnapshot(self, sender, msg):
+        if msg.Version != SNAPSHOT_VERSION:
+            logging.warning("Ignoring GameSnapshot version %d", msg.Version)
+            return
+        if msg.FragmentIndex >= msg.FragmentCount:
+            raise ValueError("Malformed GameSnapshot: fragment {} of {}".format(
+                             msg.FragmentIndex, msg.FragmentCount))
+
+        if msg.Seq != self._fragments_seq:
+            # Anything left of an older snapshot is never going to complete
+            self._fragments_seq = msg.Seq
+            self._fragments = {}
+        self._fragments[msg.FragmentIndex] = msg
+        if len(self._fragments) < msg.FragmentCount:
+            return
+
+        snapshot = self.message_for_msg_kind(messages_pb2.MessageType_GameSnapshot)
+        for idx in range(msg.FragmentCount):
+            if idx not in self._fragments:
+                return
+            snapshot.MergeFrom(self._fragments[idx])
+        self._fragments = {}
+        self.apply_GameSnapshot(snapshot)
+
+    def apply_GameSnapshot(self, msg):
+        """ Load a complete (reassembled) snapshot into the manager """
+        penalties = []
+        penalty_seqs = list(msg.PenaltySeq) or [0] * len(msg.PenaltyPlayerNo)
+        for (player_no, start_time, duration, remaining, is_white, seq) in zip(
+                msg.PenaltyPlayerNo, msg.PenaltyStartTime, msg.PenaltyDuration,
+                msg.PenaltyDurationRemaining, msg.PenaltyIsWhite, penalty_seqs):
+            team = TeamColor.white if is_white else TeamColor.black
+            p = Penalty(player_no, team, duration,
+                        start_time=start_time or None,
+                        duration_remaining=remaining)
+            p.setSeq(seq)
+            penalties += [p]
+
+        goals = []
+        goal_seqs = list(msg.GoalSeq) or [0] * len(msg.GoalNo)
+        for (goal_no, player_no, is_white, time_left, period, seq) in zip(
+                msg.GoalNo, msg.GoalPlayerNo, msg.GoalIsWhite,
+                msg.GoalTimeLeft, msg.GoalPeriod, goal_seqs):
+            team = TeamColor.white if is_white else TeamColor.black
+            g = Goal(goal_no, player_no, team, time_left,
+                     gs_from_proto_enum(period))
+            g.setSeq(seq)
+            goals += [g]
+
+        game_clock = self.received_clock(msg)
+
+        self._mgr.restoreState(clock_running=msg.ClockRunning,
+                               game_clock=game_clock,
+                               clock_at_pause=msg.TimeAtPause,
+                               white_score=msg.WhiteScore,
+                               black_score=msg.BlackScore,
+                               game_state=gs_from_proto_enum(msg.Period),
+                               timeout_state=ts_from_proto_enum(msg.Timeout),
+                               layout=l_from_proto_enum(msg.Layout),
+                               tid=msg.tid if msg.HasField('tid') else None,
+                               gid=msg.gid if msg.HasField('gid') else None,
+                               penalties=penalties,
+                               goals=goals)
 
     def as_int(self, n):
         try:
@@ -203,64 +602,254 @@ class UWHProtoHandler(object):
         except ValueError:
             return -1
 
-    def get_GameKeyFrame(self):
+    def as_ms(self, seconds):
+        return max(0, int(round(seconds * 1000)))
+
+    def state(self):
+        """ Stamp whatever changed since it was last sent, and take one
+            StateSnapshot of the game to build messages from. The get_*
+            methods take one of their own if they aren't given one, so pass
+            the same one to each for a consistent cycle. """
+        self._mgr.stampRecords()
+        return self._mgr.snapshot()
+
+    def get_GameKeyFrame(self, state=None):
+        if state is None:
+            state = self.state()
         kind = messages_pb2.MessageType_GameKeyFrame
         msg = self.message_for_msg_kind(kind)
-        msg.ClockRunning = self._mgr.gameClockRunning()
-        msg.TimeLeft = max(0, int(self._mgr.gameClock()))
-        msg.BlackScore = self._mgr.blackScore()
-        msg.WhiteScore = self._mgr.whiteScore()
-        msg.Period = gs_to_proto_enum(self._mgr.gameState())
-        msg.Timeout = ts_to_proto_enum(self._mgr.timeoutState())
-        msg.Layout = l_to_proto_enum(self._mgr.layout())
-        msg.tid = self._mgr.tid()
-        msg.gid = self._mgr.gid()
-        msg.TimeAtPause = max(0, int(self._mgr.gameClockAtPause()))
+        msg.ClockRunning = state.gameClockRunning()
+        msg.TimeLeft = max(0, int(state.gameClock()))
+        msg.BlackScore = state.blackScore()
+        msg.WhiteScore = state.whiteScore()
+        msg.Period = gs_to_proto_enum(state.gameState())
+        msg.Timeout = ts_to_proto_enum(state.timeoutState())
+        msg.Layout = l_to_proto_enum(state.layout())
+        msg.tid = state.tid()
+        msg.gid = state.gid()
+        msg.TimeAtPause = max(0, int(state.gameClockAtPause()))
+        msg.RecordSeq = state.recordSeq()
+        msg.RecordCount = state.recordCount()
+        if self.fractional_clock:
+            msg.TimeLeftMs = self.as_ms(state.gameClockPrecise())
 
         return (kind, msg)
 
-    def get_Penalties(self):
+    def get_Penalties(self, state=None):
+        if state is None:
+            state = self.state()
         kind = messages_pb2.MessageType_Penalty
         msgs = []
 
-        for p in self._mgr.penalties(TeamColor.black):
-            msg = self.message_for_msg_kind(kind)
-            msg.PlayerNo = self.as_int(p.player())
-            msg.Duration = p.duration()
-            msg.StartTime = p.startTime() or 0
-            msg.DurationRemaining = p.durationRemaining()
-            msg.IsWhite = False
-            msgs += [msg]
-
-        for p in self._mgr.penalties(TeamColor.white):
-            msg = self.message_for_msg_kind(kind)
-            msg.PlayerNo = self.as_int(p.player())
-            msg.Duration = p.duration()
-            msg.StartTime = p.startTime() or 0
-            msg.DurationRemaining = p.durationRemaining()
-            msg.IsWhite = True
-            msgs += [msg]
+        for (team, is_white) in ((TeamColor.black, False),
+                                 (TeamColor.white, True)):
+            # A player may have several penalties at once
+            counts = {}
+            for p in state.penalties(team):
+                msg = self.message_for_msg_kind(kind)
+                msg.PlayerNo = self.as_int(p.player())
+                msg.Duration = p.duration()
+                msg.StartTime = p.startTime() or 0
+                msg.DurationRemaining = p.durationRemaining()
+                msg.IsWhite = is_white
+                msg.Seq = p.seq()
+                index = counts.get(p.player(), 0)
+                if index:
+                    msg.Index = index
+                else:
+                    # So that receivers drop any the player no longer has
+                    msg.Count = len(state.penaltiesByPlayer(p.player(), team))
+                counts[p.player()] = index + 1
+                msgs += [msg]
 
         return (kind, msgs)
 
-    def get_Goals(self):
+    def get_Goals(self, state=None):
+        if state is None:
+            state = self.state()
         kind = messages_pb2.MessageType_Goal
         msgs = []
 
-        for g in self._mgr.goals():
+        for g in state.goals():
             msg = self.message_for_msg_kind(kind)
             msg.GoalNo = g.goal_no()
             msg.PlayerNo = self.as_int(g.player())
             msg.IsWhite = g.team() == TeamColor.white
             msg.TimeLeft = g.time()
             msg.Period = g.state()
+            msg.Seq = g.seq()
             msgs += [msg]
 
         return (kind, msgs)
 
-    def get_GameTime(self):
+    def get_GameSnapshot(self, state=None):
+        """ The whole game as GameSnapshot fragments, each small enough to
+            fit in one frame. Only for displays that know the message:
+            older ones stall on a kind they don't recognise. """
+        if state is None:
+            state = self.state()
+        kind = messages_pb2.MessageType_GameSnapshot
+        self._snapshot_seq = (self._snapshot_seq + 1) & 0xFFFFFFFF
+        limit = min(self.mtu, 257) - 2
+
+        def fragment():
+            msg = self.message_for_msg_kind(kind)
+            msg.Version = SNAPSHOT_VERSION
+            msg.Seq = self._snapshot_seq
+            # Reserve room for the index and count, filled in below
+            msg.FragmentIndex = 255
+            msg.FragmentCount = 255
+            return msg
+
+        head = fragment()
+        head.ClockRunning = state.gameClockRunning()
+        head.TimeLeft = max(0, int(state.gameClock()))
+        if self.fractional_clock:
+            head.TimeLeftMs = self.as_ms(state.gameClockPrecise())
+        head.TimeAtPause = max(0, int(state.gameClockAtPause()))
+        head.BlackScore = state.blackScore()
+        head.WhiteScore = state.whiteScore()
+        head.Period = gs_to_proto_enum(state.gameState())
+        head.Timeout = ts_to_proto_enum(state.timeoutState())
+        head.Layout = l_to_proto_enum(state.layout())
+        if state.tid() is not None:
+            head.tid = state.tid()
+        if state.gid() is not None:
+            head.gid = state.gid()
+
+        def add_penalty(msg, p):
+            msg.PenaltyPlayerNo.append(self.as_int(p.player()))
+            msg.PenaltyStartTime.append(p.startTime() or 0)
+            msg.PenaltyDuration.append(p.duration())
+            msg.PenaltyDurationRemaining.append(p.durationRemaining())
+            msg.PenaltyIsWhite.append(p.team() == TeamColor.white)
+            msg.PenaltySeq.append(p.seq())
+
+        def add_goal(msg, g):
+            msg.GoalNo.append(g.goal_no())
+            msg.GoalPlayerNo.append(self.as_int(g.player()))
+            msg.GoalIsWhite.append(g.team() == TeamColor.white)
+            msg.GoalTimeLeft.append(g.time())
+            msg.GoalPeriod.append(gs_to_proto_enum(g.state()))
+            msg.GoalSeq.append(g.seq())
+
+        records = ([(add_penalty, p) for p in state.penalties(TeamColor.black)] +
+                   [(add_penalty, p) for p in state.penalties(TeamColor.white)] +
+                   [(add_goal, g) for g in state.goals()])
+
+        msgs = [head]
+        for (add, record) in records:
+            candidate = self.message_for_msg_kind(kind)
+            candidate.CopyFrom(msgs[-1])
+            add(candidate, record)
+            if candidate.ByteSize() > limit:
+                candidate = fragment()
+                add(candidate, record)
+                if candidate.ByteSize() > limit:
+                    raise ValueError("Record is too long to send over the wire")
+                msgs.append(candidate)
+            else:
+                msgs[-1] = candidate
+
+        for (idx, msg) in enumerate(msgs):
+            msg.FragmentIndex = idx
+            msg.FragmentCount = len(msgs)
+
+        return (kind, msgs)
+
+    def plan_Cycle(self, recipients, trackers=None, delta=False, batch=False,
+                   snapshot=False):
+        """ Every recipient's frames for one broadcast cycle, all built from
+            the same state, as a list of (recipient, frames, tracker, full)
+            to hand to send_frames. With `snapshot` the cycle is GameSnapshot
+            fragments; with `delta` it is only what each recipient's tracker,
+            from `trackers` by recipient, says it is missing; otherwise it is
+            the whole of get_Cycle. """
+        state = self.state()
+        if snapshot:
+            (kind, msgs) = self.get_GameSnapshot(state)
+            frames = self.pack_frames([(kind, msg) for msg in msgs], batch)
+        elif not delta:
+            frames = self.pack_frames(self.get_Cycle(state), batch)
+        else:
+            plan = []
+            for recipient in recipients:
+                tracker = trackers[recipient]
+                full = tracker.resync_due()
+                msgs = self.get_Delta(tracker, full=full, state=state)
+                plan.append((recipient, self.pack_frames(msgs, batch),
+                             tracker, full))
+            return plan
+        return [(recipient, frames, None, False) for recipient in recipients]
+
+    def get_Cycle(self, state=None):
+        """ The keyframe, penalties and goals as one list of (kind, msg), all
+            from the same snapshot """
+        if state is None:
+            state = self.state()
+        (gkf_kind, gkf_msg) = self.get_GameKeyFrame(state)
+        (pen_kind, pen_msgs) = self.get_Penalties(state)
+        (gol_kind, gol_msgs) = self.get_Goals(state)
+
+        return ([(gkf_kind, gkf_msg)] +
+                [(pen_kind, msg) for msg in pen_msgs] +
+                [(gol_kind, msg) for msg in gol_msgs])
+
+    def wait_for_changes(self, listener, interval, resync_interval):
+        """ Pause a broadcast loop until the next cycle is due. Without a
+            `listener` that is a fixed `interval`, otherwise whenever the
+            manager changes. A running clock changes without telling anybody,
+            so it is still polled every `interval`. """
+        if listener is None:
+            time.sleep(interval)
+        elif self._mgr.gameClockRunning():
+            listener.wait(interval)
+        else:
+            listener.wait(resync_interval)
+
+    def get_Delta(self, tracker, full=False, state=None):
+        """ Messages needed to bring a recipient described by `tracker` up to
+            date. With `full`, everything is included, as in a keyframe. """
+        if state is None:
+            state = self.state()
+        (gkf_kind, gkf_msg) = self.get_GameKeyFrame(state)
+        (pen_kind, pen_msgs) = self.get_Penalties(state)
+        (gol_kind, gol_msgs) = self.get_Goals(state)
+
+        msgs = []
+        resend_records = full
+
+        changed = gkf_msg.ListFields() if full else tracker.changed_fields(gkf_msg)
+        if changed:
+            names = [fd.name for (fd, _) in changed]
+            if 'ClockRunning' in names:
+                # The recipient recomputes its clock when it starts or stops,
+                # so pin it down explicitly
+                names += ['TimeLeft', 'TimeLeftMs', 'TimeAtPause']
+            if 'Period' in names:
+                resend_records = True
+
+            delta = self.message_for_msg_kind(gkf_kind)
+            for (fd, value) in gkf_msg.ListFields():
+                if fd.name in names:
+                    setattr(delta, fd.name, value)
+            msgs += [(gkf_kind, delta)]
+
+        for (kind, records) in ((pen_kind, pen_msgs), (gol_kind, gol_msgs)):
+            for msg in records:
+                if (resend_records or
+                    tracker.record_changed(kind, record_key(kind, msg), msg)):
+                    msgs += [(kind, msg)]
+
+        return msgs
+
+    def get_GameTime(self, state=None):
+        if state is None:
+            state = self._mgr.snapshot()
         kind = messages_pb2.MessageType_GameTime
         msg = self.message_for_msg_kind(kind)
-        msg.TimeLeft = max(0, int(self._mgr.gameClock()))
+        msg.TimeLeft = max(0, int(state.gameClock()))
+        if self.fractional_clock:
+            msg.TimeLeftMs = self.as_ms(state.gameClockPrecise())
 
         return (kind, msg)
@@ -1,7 +1,9 @@
-from .comms import UWHProtoHandler, gs_to_proto_enum, gs_from_proto_enum, ts_to_proto_enum, ts_from_proto_enum, l_from_proto_enum, l_to_proto_enum
+from .comms import UWHProtoHandler, DeltaTracker, register_message_kind, gs_to_proto_enum, gs_from_proto_enum, ts_to_proto_enum, ts_from_proto_enum, l_from_proto_enum, l_to_proto_enum
 
 from . import messages_pb2
-from .gamemanager import GameManager, TimeoutState, GameState, Penalty, TeamColor, PoolLayout
+from .gamemanager import GameManager, TimeoutState, GameState, Penalty, TeamColor, PoolLayout, ChangeKind
+
+import time
 
 def test_PingPong():
     class Client(UWHProtoHandler):
@@ -123,6 +125,36 @@ def test_pack_unpack():
     assert threw == 2
 
 
+
+def test_register_message_kind():
+    class Handler(UWHProtoHandler):
+        def __init__(self, mgr):
+            UWHProtoHandler.__init__(self, mgr)
+            self.received = []
+
+        def handle_Custom(self, sender, msg):
+            self.received += [msg.Data]
+
+    handler = Handler(GameManager())
+
+    # Unknown kinds are malformed data, not a crash
+    threw = False
+    try:
+        handler.unpack_message(bytearray([200, 0]))
+    except ValueError:
+        threw = True
+    assert threw
+
+    register_message_kind(200, messages_pb2.Ping, 'handle_Custom')
+    try:
+        msg = messages_pb2.Ping()
+        msg.Data = 9
+        handler.recv_raw(None, handler.pack_message(200, msg))
+        assert handler.received == [9]
+    finally:
+        register_message_kind(200, None)
+
+
 def test_enum_conversion():
     assert ts_from_proto_enum(messages_pb2.TimeoutState_None) == TimeoutState.none
     assert ts_to_proto_enum(TimeoutState.none) == messages_pb2.TimeoutState_None
@@ -152,3 +184,599 @@ def test_enum_conversion():
 
     assert l_to_proto_enum(PoolLayout.white_on_right) == messages_pb2.WhiteOnRight
     assert l_to_proto_enum(PoolLayout.white_on_left) == messages_pb2.WhiteOnLeft
+
+
+def test_Delta():
+    class Server(UWHProtoHandler):
+        def __init__(self, mgr, client):
+            UWHProtoHandler.__init__(self, mgr)
+            self.client = client
+            self.sent = []
+            self.deliver = True
+
+        def send_raw(self, recipient, data):
+            if not self.deliver:
+                return False
+            self.sent += [data[0]]
+            self.client.recv_raw(self, data)
+
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    c = UWHProtoHandler(c_mgr)
+    s = Server(s_mgr, c)
+    tracker = DeltaTracker(resync_interval=60)
+
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.setGameClock(42)
+    s_mgr.addWhiteGoal(3)
+    s_mgr.addPenalty(Penalty(24, TeamColor.white, 5 * 60))
+
+    # First cycle is a full resync
+    assert s.send_Delta(None, tracker)
+    assert s.sent == [messages_pb2.MessageType_GameKeyFrame,
+                      messages_pb2.MessageType_Penalty,
+                      messages_pb2.MessageType_Goal]
+    assert c_mgr.whiteScore() == 1
+    assert len(c_mgr.goals()) == 1
+
+    # Nothing changed, nothing to send
+    s.sent = []
+    assert s.send_Delta(None, tracker)
+    assert s.sent == []
+
+    # A new goal costs a keyframe for the score, plus only the new goal
+    s_mgr.addBlackGoal(7)
+    assert s.send_Delta(None, tracker)
+    assert s.sent == [messages_pb2.MessageType_GameKeyFrame,
+                      messages_pb2.MessageType_Goal]
+    assert c_mgr.blackScore() == 1
+    assert len(c_mgr.goals()) == 2
+    assert c_mgr.gameClock() == 42
+
+    # Undelivered changes are retried on the next cycle
+    s.sent = []
+    s_mgr.setWhiteScore(5)
+    s.deliver = False
+    assert not s.send_Delta(None, tracker)
+    s.deliver = True
+    assert s.send_Delta(None, tracker)
+    assert s.sent == [messages_pb2.MessageType_GameKeyFrame]
+    assert c_mgr.whiteScore() == 5
+
+    # A period change resends every record
+    s.sent = []
+    s_mgr.setGameState(GameState.second_half)
+    assert s.send_Delta(None, tracker)
+    assert s.sent == [messages_pb2.MessageType_GameKeyFrame,
+                      messages_pb2.MessageType_Penalty,
+                      messages_pb2.MessageType_Goal,
+                      messages_pb2.MessageType_Goal]
+    assert c_mgr.gameState() == GameState.second_half
+
+
+def test_Delta_same_player():
+    class Server(UWHProtoHandler):
+        def __init__(self, mgr, client):
+            UWHProtoHandler.__init__(self, mgr)
+            self.client = client
+            self.sent = []
+
+        def send_raw(self, recipient, data):
+            self.sent += [data[0]]
+            self.client.recv_raw(self, data)
+
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    c = UWHProtoHandler(c_mgr)
+    s = Server(s_mgr, c)
+    tracker = DeltaTracker(resync_interval=60)
+
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.addPenalty(Penalty(7, TeamColor.white, 2 * 60))
+    s_mgr.addPenalty(Penalty(7, TeamColor.white, 5 * 60))
+
+    assert s.send_Delta(None, tracker)
+    durations = [p.duration() for p in c_mgr.penalties(TeamColor.white)]
+    assert durations == [2 * 60, 5 * 60]
+
+    # Both count as sent, rather than one shadowing the other
+    s.sent = []
+    assert s.send_Delta(None, tracker)
+    assert s.sent == []
+
+    # An edit replaces the same one on the client
+    s_mgr.penalties(TeamColor.white)[1].setDuration(4 * 60)
+    assert s.send_Delta(None, tracker)
+    assert s.sent == [messages_pb2.MessageType_GameKeyFrame,
+                      messages_pb2.MessageType_Penalty]
+    durations = [p.duration() for p in c_mgr.penalties(TeamColor.white)]
+    assert durations == [2 * 60, 4 * 60]
+
+    # Deleting the earlier one moves the later one up, and the client
+    # doesn't keep a copy of it in its old place
+    s_mgr.delPenalty(s_mgr.penalties(TeamColor.white)[0])
+    assert s.send_Delta(None, tracker)
+    durations = [p.duration() for p in c_mgr.penalties(TeamColor.white)]
+    assert durations == [4 * 60]
+    s.sent = []
+    assert s.send_Delta(None, tracker)
+    assert s.sent == []
+
+    # Nor when every cycle carries everything
+    s_mgr.addPenalty(Penalty(7, TeamColor.white, 3 * 60))
+    s.send_messages(None, s.get_Cycle())
+    durations = [p.duration() for p in c_mgr.penalties(TeamColor.white)]
+    assert durations == [4 * 60, 3 * 60]
+    s_mgr.delPenalty(s_mgr.penalties(TeamColor.white)[0])
+    for _ in range(2):
+        s.send_messages(None, s.get_Cycle())
+        durations = [p.duration() for p in c_mgr.penalties(TeamColor.white)]
+        assert durations == [3 * 60]
+
+
+def test_batch():
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    s = UWHProtoHandler(s_mgr)
+    c = UWHProtoHandler(c_mgr)
+
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.setGameClock(42)
+    s_mgr.addWhiteGoal(3)
+    s_mgr.addBlackGoal(7)
+    for player in range(10):
+        s_mgr.addPenalty(Penalty(player, TeamColor.black, 60))
+
+    msgs = s.get_Cycle()
+    assert len(msgs) == 13
+
+    # Everything fits in one frame
+    frames = s.pack_frames(msgs)
+    assert len(frames) == 1
+    (frame, carried) = frames[0]
+    assert frame[0] == messages_pb2.MessageType_Batch
+    assert frame[1] == 13
+    assert carried == msgs
+    c.recv_raw(s, frame)
+    assert c_mgr.gameClock() == 42
+    assert len(c_mgr.goals()) == 2
+    assert len(c_mgr.penalties(TeamColor.black)) == 10
+
+    # Split at the mtu, and never more than one record short of it
+    s.mtu = 40
+    frames = s.pack_frames(msgs)
+    assert 1 < len(frames)
+    assert sum(len(carried) for (_, carried) in frames) == 13
+    for (frame, carried) in frames:
+        assert len(frame) <= s.mtu or len(carried) == 1
+        assert len(c.unpack_messages(frame)) == len(carried)
+
+    # A lone record goes out the old way
+    s.mtu = 1
+    for (frame, carried) in s.pack_frames(msgs):
+        assert frame[0] != messages_pb2.MessageType_Batch
+        assert c.unpack_message(frame) is not None
+    assert len(s.pack_frames(msgs, batch=False)) == 13
+
+    # Truncated batches are rejected whole
+    s.mtu = 255
+    (frame, _) = s.pack_frames(msgs)[0]
+    for bad in (frame[:-1], frame + bytearray([0])):
+        threw = False
+        try:
+            c.unpack_messages(bad)
+        except ValueError:
+            threw = True
+        assert threw
+
+
+def test_Delta_batch():
+    class Server(UWHProtoHandler):
+        def __init__(self, mgr, client):
+            UWHProtoHandler.__init__(self, mgr)
+            self.client = client
+            self.frames = 0
+
+        def send_raw(self, recipient, data):
+            self.frames += 1
+            self.client.recv_raw(self, data)
+
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    s = Server(s_mgr, UWHProtoHandler(c_mgr))
+    tracker = DeltaTracker(resync_interval=60)
+
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.addWhiteGoal(3)
+    s_mgr.addPenalty(Penalty(24, TeamColor.white, 5 * 60))
+    s_mgr.addPenalty(Penalty(25, TeamColor.white, 5 * 60))
+
+    assert s.send_Delta(None, tracker, batch=True)
+    assert s.frames == 1
+    assert len(c_mgr.penalties(TeamColor.white)) == 2
+    assert len(c_mgr.goals()) == 1
+
+    s.frames = 0
+    assert s.send_Delta(None, tracker, batch=True)
+    assert s.frames == 0
+
+
+def test_GameSnapshot():
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    s = UWHProtoHandler(s_mgr)
+    c = UWHProtoHandler(c_mgr)
+
+    s_mgr.setGameState(GameState.second_half)
+    s_mgr.setTimeoutState(TimeoutState.ref)
+    s_mgr.setLayout(PoolLayout.white_on_left)
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.setGameClock(42)
+    s_mgr.setGameClockAtPause(40)
+    s_mgr.addWhiteGoal(3)
+    s_mgr.addBlackGoal(7)
+    s_mgr.addPenalty(Penalty(24, TeamColor.white, 5 * 60, start_time=100))
+    s_mgr.addPenalty(Penalty(-1, TeamColor.black, -1))
+
+    changes = []
+    c_mgr.subscribe(lambda mgr, ch: changes.append(ch))
+
+    (kind, msgs) = s.get_GameSnapshot()
+    assert len(msgs) == 1
+    c.recv_raw(s, s.pack_message(kind, msgs[0]))
+
+    # One update, with everything in it
+    assert len(changes) == 1
+    assert c_mgr.gameState() == GameState.second_half
+    assert c_mgr.timeoutState() == TimeoutState.ref
+    assert c_mgr.layout() == PoolLayout.white_on_left
+    assert (c_mgr.tid(), c_mgr.gid()) == (14, 6)
+    assert c_mgr.gameClock() == 42
+    assert c_mgr.gameClockAtPause() == 40
+    assert (c_mgr.whiteScore(), c_mgr.blackScore()) == (1, 1)
+    assert [(g.goal_no(), g.player(), g.team(), g.state()) for g in c_mgr.goals()] == \
+           [(1, 3, TeamColor.white, GameState.second_half),
+            (2, 7, TeamColor.black, GameState.second_half)]
+    (cp,) = c_mgr.penalties(TeamColor.white)
+    assert (cp.player(), cp.duration(), cp.startTime()) == (24, 5 * 60, 100)
+    (cp,) = c_mgr.penalties(TeamColor.black)
+    assert cp.dismissed()
+
+    # Nothing changed, nothing to publish
+    changes[:] = []
+    (kind, msgs) = s.get_GameSnapshot()
+    c.recv_raw(s, s.pack_message(kind, msgs[0]))
+    assert changes == []
+
+    # Records keep their versions, so keyframes don't ask for them again
+    assert c_mgr.recordSeq() == s_mgr.recordSeq() == 4
+    assert c_mgr.penaltyByPlayer(24, TeamColor.white).seq() == \
+           s_mgr.penaltyByPlayer(24, TeamColor.white).seq()
+
+    # A snapshot in no fragments at all is malformed, not empty
+    (kind, msgs) = s.get_GameSnapshot()
+    msgs[0].FragmentCount = 0
+    c.recv_raw(s, s.pack_message(kind, msgs[0]))
+    assert changes == []
+    assert c_mgr.whiteScore() == 1
+
+
+def test_GameSnapshot_fragments():
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    s = UWHProtoHandler(s_mgr)
+    c = UWHProtoHandler(c_mgr)
+    s.mtu = 40
+
+    for player in range(12):
+        s_mgr.addPenalty(Penalty(player, TeamColor.white, 60))
+        s_mgr.addBlackGoal(player)
+
+    (kind, msgs) = s.get_GameSnapshot()
+    assert 1 < len(msgs)
+    frames = [s.pack_message(kind, msg) for msg in msgs]
+    assert all(len(frame) <= s.mtu for frame in frames)
+
+    # Nothing is applied until the last fragment arrives, in any order
+    for frame in reversed(frames[1:]):
+        c.recv_raw(s, frame)
+        assert c_mgr.blackScore() == 0
+    c.recv_raw(s, frames[0])
+    assert c_mgr.blackScore() == 12
+    assert len(c_mgr.goals()) == 12
+    assert len(c_mgr.penalties(TeamColor.white)) == 12
+
+    # A snapshot that never completes is abandoned for the next one
+    s_mgr.setBlackScore(0)
+    (kind, lost) = s.get_GameSnapshot()
+    c.recv_raw(s, s.pack_message(kind, lost[0]))
+    s_mgr.setBlackScore(5)
+    (kind, msgs) = s.get_GameSnapshot()
+    for msg in msgs:
+        c.recv_raw(s, s.pack_message(kind, msg))
+    assert c_mgr.blackScore() == 5
+
+
+def test_record_seq():
+    class Client(UWHProtoHandler):
+        resync_requests = True
+
+        def send_raw(self, recipient, data):
+            recipient.recv_raw(self, data)
+
+    class Server(UWHProtoHandler):
+        def send_raw(self, recipient, data):
+            recipient.recv_raw(self, data)
+
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    s = Server(s_mgr)
+    c = Client(c_mgr)
+
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.addWhiteGoal(3)
+    sp = Penalty(24, TeamColor.white, 5 * 60)
+    s_mgr.addPenalty(sp)
+
+    changes = []
+    c_mgr.subscribe(lambda mgr, ch: changes.append(ch))
+
+    s.send_messages(c, s.get_Cycle())
+    assert len(c_mgr.goals()) == 1
+    assert len(changes) > 0
+    assert c_mgr.recordSeq() == s_mgr.recordSeq() == 2
+
+    # A repeat of the same cycle changes nothing on the client
+    changes[:] = []
+    s.send_messages(c, s.get_Cycle())
+    assert changes == []
+
+    # Editing a record gives it a new seq, so it gets applied
+    sp.setDuration(2 * 60)
+    s.send_messages(c, s.get_Cycle())
+    assert c_mgr.penalties(TeamColor.white)[0].duration() == 2 * 60
+    assert c_mgr.penaltyByPlayer(24, TeamColor.white).seq() == 3
+
+    # A goal that never arrives is asked for by the next keyframe
+    s_mgr.addBlackGoal(7)
+    (kind, msg) = s.get_GameKeyFrame()
+    s.send_message(c, kind, msg)
+    assert len(c_mgr.goals()) == 1
+    (kind, msg) = s.get_GameKeyFrame()
+    s.send_message(c, kind, msg)
+    assert len(c_mgr.goals()) == 2
+    assert c_mgr.goalByNo(2, TeamColor.black).player() == 7
+
+    # So is one that goes missing while a newer one arrives
+    s_mgr.addWhiteGoal(8)
+    s_mgr.addBlackGoal(9)
+    (kind, msg) = s.get_GameKeyFrame()
+    s.send_message(c, kind, msg)
+    (gol_kind, gol_msgs) = s.get_Goals()
+    s.send_message(c, gol_kind, gol_msgs[-1])
+    assert c_mgr.recordSeq() == s_mgr.recordSeq()
+    assert c_mgr.goalByNo(3, TeamColor.white) is None
+    (kind, msg) = s.get_GameKeyFrame()
+    s.send_message(c, kind, msg)
+    assert c_mgr.goalByNo(3, TeamColor.white).player() == 8
+    assert c_mgr.recordCount() == s_mgr.recordCount() == 5
+
+    # Records from a server too old to version them are only applied when
+    # they differ from what the client has
+    def unversioned():
+        msgs = s.get_Cycle()
+        for (kind, msg) in msgs:
+            for name in ('Seq', 'RecordSeq'):
+                if name in msg.DESCRIPTOR.fields_by_name:
+                    msg.ClearField(name)
+        return msgs
+
+    old_mgr = GameManager()
+    old = Client(old_mgr)
+    s.send_messages(old, unversioned())
+    snap = old_mgr.snapshot()
+    s.send_messages(old, unversioned())
+    assert old_mgr.snapshot() is snap
+    sp.setDuration(3 * 60)
+    s.send_messages(old, unversioned())
+    assert old_mgr.penalties(TeamColor.white)[0].duration() == 3 * 60
+
+
+def test_record_seq_running_clock():
+    class Handler(UWHProtoHandler):
+        def send_raw(self, recipient, data):
+            recipient.recv_raw(self, data)
+
+    s_mgr = GameManager()
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.setGameState(GameState.first_half)
+    s_mgr.setGameClock(600)
+    s_mgr.setGameClockRunning(True)
+    s_mgr.addPenalty(Penalty(24, TeamColor.white, 5 * 60))
+    s = Handler(s_mgr)
+
+    # Not passive, with its own clock running, like client.py
+    c_mgr = GameManager()
+    c_mgr.setGameClock(600)
+    c_mgr.setGameClockRunning(True)
+    c = Handler(c_mgr)
+
+    s.send_messages(c, s.get_Cycle())
+    (sp,) = s_mgr.penalties(TeamColor.white)
+    (cp,) = c_mgr.penalties(TeamColor.white)
+    # Taken as sent, not restarted on the client's clock
+    assert cp.startTime() == sp.startTime()
+    assert cp.seq() == sp.seq() == 1
+
+    changes = []
+    c_mgr.subscribe(lambda mgr, ch: changes.append(ch))
+    for _ in range(3):
+        s.send_messages(c, s.get_Cycle())
+    assert [ch for ch in changes if ChangeKind.penalty_added in ch] == []
+
+
+def test_fractional_clock():
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    s = UWHProtoHandler(s_mgr)
+    c = UWHProtoHandler(c_mgr)
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.setGameClock(41.375)
+
+    (kind, msg) = s.get_GameKeyFrame()
+    assert not msg.HasField('TimeLeftMs')
+    c.recv_raw(s, s.pack_message(kind, msg))
+    assert c_mgr.gameClockPrecise() == 41
+
+    s.fractional_clock = True
+    (kind, msg) = s.get_GameKeyFrame()
+    assert msg.TimeLeft == 41
+    assert msg.TimeLeftMs == 41375
+    c.recv_raw(s, s.pack_message(kind, msg))
+    assert c_mgr.gameClockPrecise() == 41.375
+    assert c_mgr.gameClock() == 41
+
+    s_mgr.setGameClock(12.5)
+    (kind, msg) = s.get_GameTime()
+    c.recv_raw(s, s.pack_message(kind, msg))
+    assert c_mgr.gameClockPrecise() == 12.5
+
+    s_mgr.setGameClock(7.25)
+    (kind, msgs) = s.get_GameSnapshot()
+    c.recv_raw(s, s.pack_message(kind, msgs[0]))
+    assert c_mgr.gameClockPrecise() == 7.25
+
+
+def test_extrapolated_whole_seconds():
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    c_mgr.setPassive(extrapolate=True)
+    s = UWHProtoHandler(s_mgr)
+    c = UWHProtoHandler(c_mgr)
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.setGameClock(599.99)
+    s_mgr.setGameClockRunning(True)
+
+    c.recv_raw(s, s.pack_message(*s.get_GameKeyFrame()))
+    assert c_mgr.gameClock() == s_mgr.gameClock() == 599
+    assert abs(c_mgr.gameClockPrecise() - s_mgr.gameClockPrecise()) <= 0.5
+
+    # Nothing to tell subscribers while the two clocks tick along together
+    changes = []
+    c_mgr.subscribe(lambda mgr, ch: changes.append(ch))
+    for _ in range(3):
+        time.sleep(0.02)
+        c.recv_raw(s, s.pack_message(*s.get_GameKeyFrame()))
+    assert changes == []
+    assert c_mgr.gameClock() == s_mgr.gameClock()
+
+
+def test_Delta_drift():
+    class Server(UWHProtoHandler):
+        fractional_clock = True
+
+        def __init__(self, mgr, client):
+            UWHProtoHandler.__init__(self, mgr)
+            self.client = client
+            self.sent = []
+
+        def send_raw(self, recipient, data):
+            self.sent += [data[0]]
+            self.client.recv_raw(self, data)
+
+    s_mgr = GameManager()
+    c_mgr = GameManager()
+    c_mgr.setPassive(extrapolate=True)
+    s = Server(s_mgr, UWHProtoHandler(c_mgr))
+    s_mgr.setTid(14)
+    s_mgr.setGid(6)
+    s_mgr.setGameClock(600)
+    s_mgr.setGameClockRunning(True)
+
+    ticking = DeltaTracker(resync_interval=60)
+    extrapolated = DeltaTracker(resync_interval=60, drift_threshold=1)
+    for tracker in (ticking, extrapolated):
+        s.send_Delta(None, tracker)
+    assert c_mgr.gameClockRunning()
+    assert abs(c_mgr.gameClockPrecise() - s_mgr.gameClockPrecise()) < 0.1
+
+    # The milliseconds have moved on, but the client can work that out
+    time.sleep(0.01)
+    s.sent = []
+    s.send_Delta(None, ticking)
+    assert s.sent == [messages_pb2.MessageType_GameKeyFrame]
+    s.sent = []
+    s.send_Delta(None, extrapolated)
+    assert s.sent == []
+
+    # Unless the clock gets corrected on the server
+    s_mgr.setGameClock(300)
+    s.send_Delta(None, extrapolated)
+    assert s.sent == [messages_pb2.MessageType_GameKeyFrame]
+    assert abs(c_mgr.gameClockPrecise() - 300) < 0.1
+
+
+def test_Cycle_from_one_state():
+    mgr = GameManager()
+    mgr.setTid(1)
+    mgr.setGid(2)
+    mgr.setWhiteScore(1)
+    mgr.addPenalty(Penalty(3, TeamColor.white, 60))
+    handler = UWHProtoHandler(mgr)
+
+    state = handler.state()
+    mgr.setWhiteScore(5)
+    mgr.addPenalty(Penalty(4, TeamColor.white, 60))
+
+    msgs = handler.get_Cycle(state)
+    assert msgs[0][1].WhiteScore == 1
+    assert [msg.PlayerNo for (kind, msg) in msgs[1:]] == [3]
+    # Records were stamped before the snapshot was taken
+    assert msgs[0][1].RecordSeq == msgs[1][1].Seq == 1
+
+    msgs = handler.get_Cycle()
+    assert msgs[0][1].WhiteScore == 5
+    assert [msg.PlayerNo for (kind, msg) in msgs[1:]] == [3, 4]
+
+
+def test_send_Cycle():
+    class Server(UWHProtoHandler):
+        def __init__(self, mgr):
+            UWHProtoHandler.__init__(self, mgr)
+            self.sent = []
+
+        def send_raw(self, recipient, data):
+            self.sent += [(recipient, data[0])]
+
+    mgr = GameManager()
+    mgr.setTid(1)
+    mgr.setGid(2)
+    mgr.addPenalty(Penalty(3, TeamColor.white, 60))
+    s = Server(mgr)
+    keyframe = messages_pb2.MessageType_GameKeyFrame
+    penalty = messages_pb2.MessageType_Penalty
+
+    assert s.send_Cycle(['a', 'b'])
+    assert s.sent == [('a', keyframe), ('a', penalty),
+                      ('b', keyframe), ('b', penalty)]
+
+    # Each recipient only gets what its own tracker is missing
+    trackers = { 'a' : DeltaTracker(60), 'b' : DeltaTracker(60) }
+    s.send_Cycle(['a'], trackers, delta=True)
+    s.sent = []
+    assert s.send_Cycle(['a', 'b'], trackers, delta=True)
+    assert s.sent == [('b', keyframe), ('b', penalty)]
+
+    s.sent = []
+    assert s.send_Cycle(['a', 'b'], snapshot=True)
+    assert s.sent == [('a', messages_pb2.MessageType_GameSnapshot),
+                      ('b', messages_pb2.MessageType_GameSnapshot)]
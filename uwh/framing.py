@@ -0,0 +1,159 @@
+import binascii
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return table
+
+_CRC16_TABLE = _crc16_table()
+
+def crc16(data, crc=0xFFFF):
+    """ CRC-16/CCITT-FALSE """
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC16_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def cobs_encode(data):
+    """ Consistent Overhead Byte Stuffing: removes all zero bytes from `data`,
+        at the cost of one byte per 254 """
+    out = bytearray([0])
+    code_idx = 0
+    code = 1
+    for byte in data:
+        if byte == 0:
+            out[code_idx] = code
+            code_idx = len(out)
+            out.append(0)
+            code = 1
+        else:
+            out.append(byte)
+            code += 1
+            if code == 0xFF:
+                out[code_idx] = code
+                code_idx = len(out)
+                out.append(0)
+                code = 1
+    out[code_idx] = code
+    return bytes(out)
+
+def cobs_decode(data):
+    out = bytearray()
+    idx = 0
+    end = len(data)
+    while idx < end:
+        code = data[idx]
+        if code == 0:
+            raise ValueError("Malformed frame: zero byte in COBS data")
+        idx += 1
+        if idx + code - 1 > end:
+            raise ValueError("Malformed frame: COBS block overruns frame")
+        out += data[idx:idx + code - 1]
+        idx += code - 1
+        if code < 0xFF and idx < end:
+            out.append(0)
+    return bytes(out)
+
+
+class HexFraming(object):
+    """ The original line format: hexlified packets, one per line """
+    name = 'hex'
+    delimiter = b'\n'
+
+    def encode(self, packet):
+        return binascii.hexlify(packet) + self.delimiter
+
+    def decode(self, frame):
+        """ `frame` excludes the delimiter """
+        try:
+            return binascii.unhexlify(bytes(frame))
+        except (binascii.Error, TypeError) as e:
+            raise ValueError("Malformed frame: " + str(e))
+
+
+class CobsFraming(object):
+    """ COBS encoded packets followed by a big-endian CRC-16, each terminated
+        by a zero byte """
+    name = 'cobs'
+    delimiter = b'\x00'
+
+    def encode(self, packet):
+        crc = crc16(packet)
+        return (cobs_encode(bytes(packet) + bytes([crc >> 8, crc & 0xFF])) +
+                self.delimiter)
+
+    def decode(self, frame):
+        """ `frame` excludes the delimiter """
+        data = cobs_decode(frame)
+        if len(data) < 2:
+            raise ValueError("Malformed frame: too short for a checksum")
+        if crc16(data[:-2]) != (data[-2] << 8) | data[-1]:
+            raise ValueError("Malformed frame: checksum mismatch")
+        return data[:-2]
+
+
+FRAMINGS = {
+    HexFraming.name : HexFraming,
+    CobsFraming.name : CobsFraming,
+}
+
+def framing_for_name(name):
+    try:
+        return FRAMINGS[name]()
+    except KeyError:
+        raise ValueError("Unknown framing: " + str(name))
+
+
+class FrameReceiver(object):
+    """ Reassembles frames from a byte stream that arrives in arbitrary
+        chunks. Corrupt frames are counted in `dropped` and skipped; the
+        stream resynchronises on the next delimiter. """
+
+    def __init__(self, framing, max_frame_len=4096):
+        self._framing = framing
+        self._delimiter = framing.delimiter[0]
+        self._max_frame_len = max_frame_len
+        self._buf = bytearray()
+        self.dropped = 0
+
+    def reset(self):
+        del self._buf[:]
+
+    def feed(self, data):
+        """ Returns the packets completed by `data` """
+        buf = self._buf
+        scan = len(buf)
+        buf += data
+
+        packets = []
+        start = 0
+        while True:
+            end = buf.find(self._delimiter, scan)
+            if end < 0:
+                break
+            if end > start:
+                frame = memoryview(buf)[start:end]
+                try:
+                    packets.append(self._framing.decode(frame))
+                except ValueError:
+                    self.dropped += 1
+                finally:
+                    frame.release()
+            start = scan = end + 1
+
+        if len(buf) - start > self._max_frame_len:
+            # Lost a delimiter somewhere, throw away the garbage
+            self.dropped += 1
+            start = len(buf)
+
+        # Only the tail of a partial frame is left to move
+        del buf[:start]
+        return packets
@@ -0,0 +1,97 @@
+from .framing import crc16, cobs_encode, cobs_decode, HexFraming, CobsFraming, framing_for_name, FrameReceiver
+
+
+def test_crc16():
+    # CRC-16/CCITT-FALSE check value
+    assert crc16(b'123456789') == 0x29B1
+
+
+def test_cobs_roundtrip():
+    for data in [b'', b'\x00', b'\x00\x00', b'\x11\x22\x00\x33',
+                 bytes(range(1, 255)), bytes(range(256)) * 3]:
+        encoded = cobs_encode(data)
+        assert b'\x00' not in encoded
+        assert cobs_decode(encoded) == data
+
+
+def test_cobs_known():
+    assert cobs_encode(b'\x00') == b'\x01\x01'
+    assert cobs_encode(b'\x11\x22\x00\x33') == b'\x03\x11\x22\x02\x33'
+
+
+def test_hex_framing():
+    framing = HexFraming()
+    frame = framing.encode(bytearray([3, 1, 0xAB]))
+    assert frame == b'0301ab\n'
+    assert framing.decode(frame[:-1]) == b'\x03\x01\xab'
+
+    try:
+        framing.decode(b'zz')
+        assert False
+    except ValueError:
+        pass
+
+
+def test_cobs_framing():
+    framing = CobsFraming()
+    packet = bytearray([3, 4, 0, 0, 7, 0])
+    frame = framing.encode(packet)
+    assert frame[-1:] == b'\x00'
+    assert b'\x00' not in frame[:-1]
+    # Only a few bytes of overhead, rather than double
+    assert len(frame) <= len(packet) + 4
+    assert framing.decode(frame[:-1]) == packet
+
+    corrupt = bytearray(frame[:-1])
+    corrupt[2] ^= 0x10
+    try:
+        framing.decode(corrupt)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_framing_for_name():
+    assert isinstance(framing_for_name('hex'), HexFraming)
+    assert isinstance(framing_for_name('cobs'), CobsFraming)
+    try:
+        framing_for_name('morse')
+        assert False
+    except ValueError:
+        pass
+
+
+def test_FrameReceiver_chunks():
+    for framing in [HexFraming(), CobsFraming()]:
+        packets = [bytes([3, 2, 0, 1]), bytes([4, 0]), bytes(range(200))]
+        stream = b''.join(framing.encode(p) for p in packets)
+
+        receiver = FrameReceiver(framing)
+        received = []
+        for i in range(0, len(stream), 7):
+            received += receiver.feed(stream[i:i + 7])
+        assert received == packets
+        assert receiver.dropped == 0
+
+        receiver = FrameReceiver(framing)
+        assert receiver.feed(stream) == packets
+
+
+def test_FrameReceiver_resync():
+    framing = CobsFraming()
+    good = framing.encode(bytes([5, 1, 9]))
+    bad = bytearray(good)
+    bad[1] ^= 0xFF
+
+    receiver = FrameReceiver(framing)
+    # Joining mid-frame, then a corrupt frame, then a good one
+    assert receiver.feed(good[3:] + bad + good) == [bytes([5, 1, 9])]
+    assert receiver.dropped == 2
+
+
+def test_FrameReceiver_garbage():
+    framing = HexFraming()
+    receiver = FrameReceiver(framing, max_frame_len=16)
+    assert receiver.feed(b'ab' * 20) == []
+    assert receiver.dropped == 1
+    assert receiver.feed(framing.encode(b'\x01')) == [b'\x01']
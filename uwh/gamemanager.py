@@ -1,5 +1,9 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import itertools
+import logging
+import threading
 import time
-import math
 
 class GameState(object):
     game_over = 0
@@ -32,8 +36,24 @@ class PoolLayout(object):
     white_on_left = 1
 
 
+class ChangeKind(object):
+    score = 0
+    clock = 1
+    period = 2
+    timeout = 3
+    penalty_added = 4
+    penalty_removed = 5
+    penalty_changed = 6
+    goal_added = 7
+    goal_removed = 8
+    layout = 9
+    game = 10
+
+
 def now():
-    return math.floor(time.time())
+    """ Seconds on a clock that only ever moves forward, unlike the time of
+        day. Only differences between two readings mean anything. """
+    return time.monotonic()
 
 def observed(function):
     def wrapper(self, *args, **kwargs):
@@ -42,38 +62,208 @@ def observed(function):
             function(mgr, *args, **kwargs)
     return wrapper
 
+def publishes(*changes):
+    """ Tell the manager's subscribers about `changes` once the decorated
+        mutator returns """
+    changes = frozenset(changes)
+    def decorator(function):
+        def wrapper(self, *args, **kwargs):
+            with self._changing():
+                function(self, *args, **kwargs)
+            self._publish(changes)
+        return wrapper
+    return decorator
+
+
+class ChangeListener(object):
+    """ Collects the changes published by a GameManager until they are
+        drained, so that a burst of mutations wakes the consumer only once """
+
+    def __init__(self, mgr):
+        self._mgr = mgr
+        self._cond = threading.Condition()
+        self._pending = set()
+        self._wakeups = []
+        mgr.subscribe(self._on_change)
+
+    def _on_change(self, mgr, changes):
+        with self._cond:
+            self._pending |= changes
+            self._cond.notify_all()
+            wakeups = self._wakeups
+        for (loop, event) in wakeups:
+            loop.call_soon_threadsafe(event.set)
+
+    def poll(self):
+        """ Drain the pending changes without blocking """
+        with self._cond:
+            changes = frozenset(self._pending)
+            self._pending = set()
+            return changes
+
+    def wait(self, timeout=None):
+        """ Block until something changes, or `timeout` seconds pass. Returns
+            the (possibly empty) set of changes since the last drain. """
+        with self._cond:
+            if not self._pending:
+                self._cond.wait(timeout)
+        return self.poll()
+
+    def asyncio_event(self, loop):
+        """ An asyncio.Event, for use on `loop`, that gets set whenever
+            changes are pending. Clear it before draining with poll(). """
+        import asyncio
+        event = asyncio.Event()
+        with self._cond:
+            self._wakeups = self._wakeups + [(loop, event)]
+            if self._pending:
+                event.set()
+        return event
+
+    def close(self):
+        self._mgr.unsubscribe(self._on_change)
+
 class GameManager(object):
 
     def __init__(self, observers=None):
         self._white_score = 0
         self._black_score = 0
-        self._goals = []
-        self._duration = 0
+        # (team, goal_no) -> Goal, in the order they were scored
+        self._goals = OrderedDict()
+        self._duration = 0.0
         self._time_at_start = None
         self._game_state = GameState.first_half
         self._timeout_state = TimeoutState.none
-        self._penalties = []
+        # key -> Penalty, in the order they were added. The key stays with
+        # the penalty's place in that order, even when it is replaced.
+        self._penalties = OrderedDict()
+        # (team, player) -> keys of that player's penalties, in the same order
+        self._penalties_by_player = {}
+        self._penalty_keys = itertools.count()
         self._observers = observers or []
         self._is_passive = False
+        self._extrapolate = False
+        self._drift_threshold = 1.0
         self._layout = PoolLayout.white_on_right
         self._tid = None
         self._gid = None
         self._clock_at_pause = 0
+        self._subscribers = []
+        self._record_seq = 0
+        # Highest seq in the game. Raised as records come in; worked out
+        # again with each snapshot, in case one that went had it.
+        self._max_seq = 0
+        # Whether any record may be waiting for a seq from stampRecords()
+        self._unstamped = False
+        self._lock = threading.RLock()
+        # How deep the lock is held, and whether anything changed meanwhile;
+        # whoever lets go of it last takes the new snapshot
+        self._depth = 0
+        self._dirty = False
+        self._snapshot = StateSnapshot(self)
+
+    def lock(self):
+        """ Held by every mutator while it runs. Hold it too (`with
+            mgr.lock():`) to read several things that have to agree with each
+            other, or to apply a batch of changes atomically, but never
+            across anything slow like I/O. Subscribers may be called with it
+            held, so they had better be quick too. """
+        return self._changing(dirty=False)
+
+    def snapshot(self):
+        """ A StateSnapshot of the game as it is now, which can be read from
+            any thread without locking and without seeing a change half
+            made. Mutators take a new one as they finish, so this never
+            waits for anything. """
+        return self._snapshot
+
+    @contextmanager
+    def _changing(self, dirty=True):
+        """ Hold the lock while changing the game, and take a new snapshot
+            once it is let go of, if anything changed """
+        with self._lock:
+            self._depth += 1
+            self._dirty = self._dirty or dirty
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if not self._depth and self._dirty:
+                    self._dirty = False
+                    self._snapshot = StateSnapshot(self)
+                    self._max_seq = self._snapshot._max_seq
+
+    def _penalty_changed(self, p):
+        """ Called by a penalty of ours that was changed directly """
+        with self._changing():
+            self._note_seq(p)
+
+    def _note_seq(self, r):
+        if not r.seq():
+            self._unstamped = True
+        elif r.seq() > self._max_seq:
+            self._max_seq = r.seq()
+
+    def subscribe(self, callback):
+        """ Have `callback(mgr, changes)` called after every mutation, with
+            `changes` a frozenset of ChangeKind """
+        self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        self._subscribers = [s for s in self._subscribers if s != callback]
+
+    def listen(self):
+        return ChangeListener(self)
+
+    def _publish(self, changes):
+        for callback in self._subscribers:
+            try:
+                callback(self, changes)
+            except Exception:
+                logging.exception("GameManager subscriber failed")
 
     def gameClock(self):
-        if not self.gameClockRunning() or self._is_passive:
+        return int(self.gameClockPrecise())
+
+    def gameClockPrecise(self):
+        """ The game clock in fractional seconds """
+        if not self.gameClockRunning() or self._frozen():
             return self._duration
 
-        game_clock = self._duration - (now() - self._time_at_start)
-        return int(game_clock)
+        return self._duration - (now() - self._time_at_start)
+
+    def _frozen(self):
+        # A passive clock only moves when it is told to, unless it may
+        # extrapolate
+        return self._is_passive and not self._extrapolate
+
+    def gameClockBasis(self):
+        """ (seconds, since): the clock read `seconds` at now() == `since`,
+            and has been counting down from there since. `since` is None
+            while the clock is stopped. Lets a display animate the clock on
+            its own without asking the manager every frame. """
+        if not self.gameClockRunning() or self._frozen():
+            return (self._duration, None)
+        return (self._duration, self._time_at_start)
 
     @observed
+    @publishes(ChangeKind.clock)
     def setGameClock(self, n):
-        self._duration = int(n)
+        self._duration = float(n)
 
         if self.gameClockRunning():
             self._time_at_start = now()
 
+    def syncGameClock(self, n):
+        """ Take the game clock from the one being followed. A passive
+            manager that extrapolates ignores it while its own running clock
+            is within the drift threshold of `n`. """
+        with self._lock:
+            if (self._is_passive and self._extrapolate and self.gameClockRunning() and
+                abs(self.gameClockPrecise() - n) <= self._drift_threshold):
+                return
+            self.setGameClock(n)
+
     def gameClockAtPause(self):
         if (self._game_state == GameState.half_time or
             self._game_state == GameState.ot_half or
@@ -88,56 +278,77 @@ class GameManager(object):
             return self.gameClock()
 
     @observed
+    @publishes(ChangeKind.clock)
     def setGameClockAtPause(self, val):
         self._clock_at_pause = int(val)
 
+    def timeAtPause(self):
+        """ What setGameClockAtPause() was last given. gameClockAtPause()
+            only reports it during a timeout. """
+        return self._clock_at_pause
+
     def whiteScore(self):
         return self._white_score
 
     @observed
+    @publishes(ChangeKind.score)
     def setWhiteScore(self, n):
         self._white_score = n
 
     @observed
+    @publishes(ChangeKind.score, ChangeKind.goal_added)
     def addWhiteGoal(self, player_no):
         self._white_score += 1
-        self._goals += [Goal(self._white_score + self._black_score,
-                             player_no, TeamColor.white,
-                             self.gameClockAtPause(), self._game_state)]
+        self._add_goal(Goal(self._white_score + self._black_score,
+                            player_no, TeamColor.white,
+                            self.gameClockAtPause(), self._game_state))
 
     def blackScore(self):
         return self._black_score
 
     @observed
+    @publishes(ChangeKind.score)
     def setBlackScore(self, n):
         self._black_score = n
 
     @observed
+    @publishes(ChangeKind.score, ChangeKind.goal_added)
     def addBlackGoal(self, player_no):
         self._black_score += 1
-        self._goals += [Goal(self._white_score + self._black_score,
-                             player_no, TeamColor.black,
-                             self.gameClockAtPause(), self._game_state)]
+        self._add_goal(Goal(self._white_score + self._black_score,
+                            player_no, TeamColor.black,
+                            self.gameClockAtPause(), self._game_state))
 
     def goals(self):
-        return self._goals
+        return list(self._goals.values())
+
+    def _add_goal(self, goal):
+        # A goal with the same number replaces the old one, at the end
+        key = (goal.team(), goal.goal_no())
+        self._goals.pop(key, None)
+        self._goals[key] = goal
+        self._note_seq(goal)
 
     @observed
+    @publishes(ChangeKind.goal_added)
     def addGoal(self, goal):
-        self._goals += [goal]
+        self._add_goal(goal)
 
     @observed
+    @publishes(ChangeKind.goal_removed)
     def delGoalByNo(self, goal_no, team):
-        self._goals = [g for g in self._goals if (g.goal_no() != goal_no or g.team() != team)]
+        self._goals.pop((team, goal_no), None)
 
     @observed
+    @publishes(ChangeKind.goal_removed)
     def delAllGoals(self):
-        self._goals = []
+        self._goals = OrderedDict()
 
     def gameClockRunning(self):
-        return bool(self._time_at_start)
+        return self._time_at_start is not None
 
     @observed
+    @publishes(ChangeKind.clock, ChangeKind.penalty_changed)
     def setGameClockRunning(self, b):
         if b == self.gameClockRunning():
             return
@@ -156,6 +367,7 @@ class GameManager(object):
         return self._game_state
 
     @observed
+    @publishes(ChangeKind.period)
     def setGameState(self, state):
         self._game_state = state
 
@@ -163,12 +375,14 @@ class GameManager(object):
         return self._timeout_state
 
     @observed
+    @publishes(ChangeKind.timeout)
     def setTimeoutState(self, state):
         self._timeout_state = state
 
     @observed
+    @publishes(ChangeKind.penalty_added)
     def addPenalty(self, p):
-        self._penalties.append(p)
+        self._add_penalty(p)
         if (self.gameClockRunning() and not self.passive()
             and not self.gameState() == GameState.pre_game
             and not self.gameState() == GameState.half_time
@@ -176,49 +390,230 @@ class GameManager(object):
             p.setStartTime(self.gameClockAtPause())
 
     @observed
+    def putPenalty(self, p, index, count=None):
+        """ Put `p` in place of the `index`th penalty of the same player, or
+            after the last one if there are fewer. With `count`, any of the
+            player's penalties past the first `count` go. Unlike addPenalty,
+            this takes `p` as it is, without starting it, since it is a copy
+            of one started elsewhere. """
+        changes = set([ChangeKind.penalty_added])
+        with self._changing():
+            keys = self._penalties_by_player.get((p.team(), p.player()), ())
+            if index < len(keys):
+                self._penalties[keys[index]] = p
+                p._own(self)
+                self._note_seq(p)
+            else:
+                self._add_penalty(p)
+
+            keep = max(count, index + 1) if count is not None else None
+            keys = self._penalties_by_player[(p.team(), p.player())]
+            if keep is not None and len(keys) > keep:
+                for key in keys[keep:]:
+                    del self._penalties[key]
+                del keys[keep:]
+                changes.add(ChangeKind.penalty_removed)
+        self._publish(frozenset(changes))
+
+    def _add_penalty(self, p):
+        key = next(self._penalty_keys)
+        self._penalties[key] = p
+        self._penalties_by_player.setdefault((p.team(), p.player()), []).append(key)
+        p._own(self)
+        self._note_seq(p)
+
+    def _index_penalties(self):
+        self._penalties_by_player = {}
+        for (key, p) in self._penalties.items():
+            self._penalties_by_player.setdefault((p.team(), p.player()), []).append(key)
+
+    def _penalty_moved(self, p):
+        """ Called by a penalty of ours that changed player or team, and so
+            has to be filed somewhere else """
+        with self._changing():
+            self._index_penalties()
+
+    def _all_penalties(self):
+        return list(self._penalties.values())
+
+    @observed
+    @publishes(ChangeKind.penalty_removed)
     def delPenalty(self, p):
-        if p in self._penalties:
-            self._penalties.remove(p)
+        keys = self._penalties_by_player.get((p.team(), p.player()))
+        if keys:
+            # Like list.remove, the first equal one goes
+            del self._penalties[keys.pop(0)]
+            if not keys:
+                del self._penalties_by_player[(p.team(), p.player())]
 
     @observed
+    @publishes(ChangeKind.penalty_removed)
     def delPenaltyByPlayer(self, player_no, team_color):
-        self._penalties = [p for p in self._penalties if p.team() != team_color or p.player() != player_no]
+        for key in self._penalties_by_player.pop((team_color, player_no), ()):
+            del self._penalties[key]
 
     def penalties(self, team_color):
-        return [p for p in self._penalties if p.team() == team_color]
+        return [p for p in self._penalties.values() if p.team() == team_color]
 
     @observed
+    @publishes(ChangeKind.penalty_removed)
     def deleteAllPenalties(self):
-        self._penalties = []
+        self._penalties = OrderedDict()
+        self._penalties_by_player = {}
 
     def _start_unstarted_penalties(self, game_clock):
-        for p in self._penalties:
+        for p in self._all_penalties():
             if not p.startTime():
                 p.setStartTime(game_clock)
 
     @observed
+    @publishes(ChangeKind.penalty_changed)
     def pauseOutstandingPenalties(self):
-        for p in self._penalties:
+        for p in self._all_penalties():
             if not p.servedCompletely(self):
                 p.pause(self)
 
     @observed
+    @publishes(ChangeKind.penalty_changed)
     def restartOutstandingPenalties(self):
-        for p in self._penalties:
+        for p in self._all_penalties():
             if not p.servedCompletely(self):
                 p.restart(self)
 
     @observed
+    @publishes(ChangeKind.penalty_removed)
     def deleteServedPenalties(self):
-        self._penalties = [p for p in self._penalties if not p.servedCompletely(self)]
+        self._penalties = OrderedDict((key, p) for (key, p) in self._penalties.items()
+                                      if not p.servedCompletely(self))
+        self._index_penalties()
 
-    def setPassive(self):
-        self._is_passive = True
+    @observed
+    def restoreState(self, clock_running, game_clock, clock_at_pause,
+                     white_score, black_score, game_state, timeout_state,
+                     layout, tid, gid, penalties, goals):
+        """ Replace the whole state of the game in one step, so that nobody
+            sees some of it updated and the rest not. Subscribers hear about
+            what actually changed. """
+        with self._changing():
+            changes = set()
+
+            if (white_score, black_score) != (self._white_score, self._black_score):
+                changes.add(ChangeKind.score)
+            if (clock_running != self.gameClockRunning() or
+                int(game_clock) != self.gameClock() or
+                clock_at_pause != self._clock_at_pause):
+                changes.add(ChangeKind.clock)
+            if game_state != self._game_state:
+                changes.add(ChangeKind.period)
+            if timeout_state != self._timeout_state:
+                changes.add(ChangeKind.timeout)
+            if layout != self._layout:
+                changes.add(ChangeKind.layout)
+            if (tid, gid) != (self._tid, self._gid):
+                changes.add(ChangeKind.game)
+
+            def fields_by_key(records, key):
+                # A player may have several penalties, so keep them all
+                by_key = {}
+                for r in records:
+                    by_key.setdefault(key(r), []).append(r._fields())
+                return by_key
+
+            def diff(old, new, key, added, removed, changed):
+                old = fields_by_key(old, key)
+                new = fields_by_key(new, key)
+                if set(new) - set(old):
+                    changes.add(added)
+                if set(old) - set(new):
+                    changes.add(removed)
+                if any(old[k] != new[k] for k in set(old) & set(new)):
+                    changes.add(changed)
+
+            diff(self._all_penalties(), penalties, lambda p: (p.team(), p.player()),
+                 ChangeKind.penalty_added, ChangeKind.penalty_removed,
+                 ChangeKind.penalty_changed)
+            # A goal that was rewritten counts as a new one
+            diff(self.goals(), goals, lambda g: (g.team(), g.goal_no()),
+                 ChangeKind.goal_added, ChangeKind.goal_removed,
+                 ChangeKind.goal_added)
+
+            self._duration = float(game_clock)
+            self._time_at_start = now() if clock_running else None
+            self._clock_at_pause = int(clock_at_pause)
+            self._white_score = white_score
+            self._black_score = black_score
+            self._game_state = game_state
+            self._timeout_state = timeout_state
+            self._layout = layout
+            self._tid = tid
+            self._gid = gid
+            self._penalties = OrderedDict()
+            self._penalties_by_player = {}
+            for p in penalties:
+                self._add_penalty(p)
+            self._goals = OrderedDict()
+            for g in goals:
+                self._add_goal(g)
+
+        if changes:
+            self._publish(frozenset(changes))
+
+    def penaltyByPlayer(self, player_no, team_color):
+        keys = self._penalties_by_player.get((team_color, player_no))
+        return self._penalties[keys[0]] if keys else None
+
+    def penaltiesByPlayer(self, player_no, team_color):
+        """ Every penalty of one player, in the order they were added """
+        return [self._penalties[key] for key in
+                self._penalties_by_player.get((team_color, player_no), ())]
+
+    def goalByNo(self, goal_no, team):
+        return self._goals.get((team, goal_no))
+
+    def stampRecords(self):
+        """ Give every penalty and goal that changed since it was last sent
+            a fresh sequence number. Returns the highest one in the game. """
+        with self._lock:
+            if not self._unstamped:
+                return self.recordSeq()
+            self._unstamped = False
+            unstamped = [r for r in self._all_penalties() + self.goals()
+                         if not r.seq()]
+            if unstamped:
+                with self._changing():
+                    for r in unstamped:
+                        self._record_seq += 1
+                        r.setSeq(self._record_seq)
+                        self._note_seq(r)
+            return self.recordSeq()
+
+    def recordSeq(self):
+        """ Highest sequence number among the penalties and goals """
+        return self._max_seq
+
+    def recordCount(self):
+        """ How many penalties and goals there are """
+        return len(self._penalties) + len(self._goals)
+
+    def setPassive(self, extrapolate=False, drift_threshold=1.0):
+        """ Follow a game clock kept somewhere else. Without `extrapolate`
+            the clock only changes when it is set; with it, the clock keeps
+            ticking locally from the last update, and syncGameClock() only
+            corrects it once it is more than `drift_threshold` seconds out. """
+        with self._changing():
+            self._is_passive = True
+            self._extrapolate = extrapolate
+            self._drift_threshold = drift_threshold
 
     def passive(self):
         return self._is_passive
 
+    def extrapolates(self):
+        """ Whether the clock runs on by itself between updates """
+        return self._is_passive and self._extrapolate
+
     @observed
+    @publishes(ChangeKind.layout)
     def setLayout(self, layout):
         self._layout = layout
 
@@ -226,6 +621,7 @@ class GameManager(object):
         return self._layout
 
     @observed
+    @publishes(ChangeKind.game)
     def setTid(self, tid):
         self._tid = tid
 
@@ -233,13 +629,78 @@ class GameManager(object):
         return self._tid
 
     @observed
+    @publishes(ChangeKind.game)
     def setGid(self, gid):
         self._gid = gid
 
     def gid(self):
         return self._gid
 
+class StateSnapshot(object):
+    """ A copy of a GameManager's state, taken all at once under its lock
+        as each change finishes, and handed out by GameManager.snapshot().
+        It answers the same questions the
+        manager does, and its game clock keeps running the same way, but
+        nothing else in it ever changes. Don't modify the penalties and
+        goals it hands out; they are copies, but shared by every reader. """
+
+    __slots__ = ('_duration', '_time_at_start', '_is_passive',
+                 '_extrapolate', '_clock_at_pause', '_white_score',
+                 '_black_score', '_game_state', '_timeout_state', '_layout',
+                 '_tid', '_gid', '_penalties', '_penalties_by_player', '_goals',
+                 '_max_seq')
+
+    def __init__(self, mgr):
+        self._duration = mgr._duration
+        self._time_at_start = mgr._time_at_start
+        self._is_passive = mgr._is_passive
+        self._extrapolate = mgr._extrapolate
+        self._clock_at_pause = mgr._clock_at_pause
+        self._white_score = mgr._white_score
+        self._black_score = mgr._black_score
+        self._game_state = mgr._game_state
+        self._timeout_state = mgr._timeout_state
+        self._layout = mgr._layout
+        self._tid = mgr._tid
+        self._gid = mgr._gid
+        self._penalties = OrderedDict((key, p._copy()) for (key, p) in mgr._penalties.items())
+        self._penalties_by_player = { player : list(keys) for (player, keys)
+                                      in mgr._penalties_by_player.items() }
+        self._goals = OrderedDict((key, g._copy()) for (key, g) in mgr._goals.items())
+        self._max_seq = max([r.seq() for r in self._all_penalties() + self.goals()]
+                            or [0])
+
+    # Read the copy exactly the way the manager reads itself
+    gameClock = GameManager.gameClock
+    gameClockPrecise = GameManager.gameClockPrecise
+    _frozen = GameManager._frozen
+    gameClockBasis = GameManager.gameClockBasis
+    gameClockAtPause = GameManager.gameClockAtPause
+    gameClockRunning = GameManager.gameClockRunning
+    whiteScore = GameManager.whiteScore
+    blackScore = GameManager.blackScore
+    goals = GameManager.goals
+    goalByNo = GameManager.goalByNo
+    penalties = GameManager.penalties
+    _all_penalties = GameManager._all_penalties
+    penaltyByPlayer = GameManager.penaltyByPlayer
+    penaltiesByPlayer = GameManager.penaltiesByPlayer
+    recordSeq = GameManager.recordSeq
+    recordCount = GameManager.recordCount
+    gameState = GameManager.gameState
+    timeoutState = GameManager.timeoutState
+    passive = GameManager.passive
+    extrapolates = GameManager.extrapolates
+    timeAtPause = GameManager.timeAtPause
+    layout = GameManager.layout
+    tid = GameManager.tid
+    gid = GameManager.gid
+
+
 class Penalty(object):
+    # Clients allocate one of these per received message, so keep them small
+    __slots__ = ('_player', '_team', '_start_time', '_duration',
+                 '_duration_remaining', '_seq', '_owners', '_snap')
 
     def __init__(self, player, team, duration, start_time=None,
                  duration_remaining=None):
@@ -256,15 +717,71 @@ class Penalty(object):
         # served in the first half)
         self._duration_remaining = int(duration_remaining or duration)
 
+        # Version on the wire, 0 until the GameManager stamps it. Reset by
+        # every change, so receivers can tell when they are up to date.
+        self._seq = 0
+
+        # The GameManagers holding this penalty, to be told when it changes
+        self._owners = ()
+
+        # The copy snapshots share until this changes
+        self._snap = None
+
     def __eq__(self, other):
+        """ Penalties are the same if they are for the same player """
+        if not isinstance(other, Penalty):
+            return NotImplemented
         return self._player == other._player and self._team == other._team
 
+    def __hash__(self):
+        return hash((self._player, self._team))
+
+    def _fields(self):
+        return (self._player, self._team, self._start_time, self._duration,
+                self._duration_remaining)
+
+    def _copy(self):
+        if self._snap is None:
+            copy = Penalty.__new__(Penalty)
+            for slot in Penalty.__slots__:
+                setattr(copy, slot, getattr(self, slot))
+            copy._owners = ()
+            copy._snap = None
+            self._snap = copy
+        return self._snap
+
+    def _own(self, mgr):
+        if mgr not in self._owners:
+            self._owners += (mgr,)
+
+    def _changed(self):
+        self._seq = 0
+        self._snap = None
+        for mgr in self._owners:
+            mgr._penalty_changed(self)
+
+    def _moved(self):
+        self._seq = 0
+        self._snap = None
+        for mgr in self._owners:
+            mgr._penalty_moved(self)
+
     def __repr__(self):
         return "Player(player={}, team={}, duration={}, start_time={}, duration_remaining={})".format(
                        self._player, self._team, self._duration, self._start_time, self._duration_remaining)
 
     def setStartTime(self, start_time):
         self._start_time = None if start_time is None else int(start_time)
+        self._changed()
+
+    def seq(self):
+        return self._seq
+
+    def setSeq(self, seq):
+        self._seq = seq
+        self._snap = None
+        for mgr in self._owners:
+            mgr._penalty_changed(self)
 
     def startTime(self):
         return self._start_time
@@ -286,12 +803,14 @@ class Penalty(object):
 
     def setPlayer(self, player):
         self._player = player
+        self._moved()
 
     def team(self):
         return self._team
 
     def setTeam(self, team):
         self._team = team
+        self._moved()
 
     def duration(self):
         return self._duration
@@ -299,12 +818,14 @@ class Penalty(object):
     def setDuration(self, duration):
         self._duration = int(duration)
         self._duration_remaining = int(self._duration_remaining or duration)
+        self._changed()
 
     def durationRemaining(self):
         return self._duration_remaining
 
     def setDurationRemaining(self, duration):
         self._duration_remaining = duration
+        self._changed()
 
     def dismissed(self):
         return self._duration == -1
@@ -313,13 +834,17 @@ class Penalty(object):
         if self._start_time is not None:
             self._duration_remaining = int(self.timeRemaining(mgr))
             self._start_time = None
+            self._changed()
 
     def restart(self, mgr):
         if self._start_time is None:
             self._start_time = mgr.gameClock()
+            self._changed()
 
 
 class Goal(object):
+    __slots__ = ('_goal_no', '_player', '_team', '_time', '_state', '_seq',
+                 '_snap')
 
     def __init__(self, goal_no, player, team, time, state):
         self._goal_no = goal_no
@@ -327,6 +852,29 @@ class Goal(object):
         self._team = team
         self._time = int(time)
         self._state = state
+        self._seq = 0
+        self._snap = None
+
+    def __eq__(self, other):
+        if not isinstance(other, Goal):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def _fields(self):
+        return (self._goal_no, self._player, self._team, self._time,
+                self._state)
+
+    def _copy(self):
+        if self._snap is None:
+            copy = Goal.__new__(Goal)
+            for slot in Goal.__slots__:
+                setattr(copy, slot, getattr(self, slot))
+            copy._snap = None
+            self._snap = copy
+        return self._snap
 
     def __repr__(self):
         return "Goal(goal_no={}, player={}, team={}, time={}, state={})".format(
@@ -347,3 +895,9 @@ class Goal(object):
     def state(self):
         return self._state
 
+    def seq(self):
+        return self._seq
+
+    def setSeq(self, seq):
+        self._seq = seq
+        self._snap = None
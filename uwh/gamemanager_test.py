@@ -1,4 +1,7 @@
-from .gamemanager import GameManager, GameState, TimeoutState, Penalty, TeamColor, PoolLayout
+from .gamemanager import GameManager, GameState, TimeoutState, Penalty, Goal, TeamColor, PoolLayout, ChangeKind
+
+import asyncio
+import threading
 
 import time
 
@@ -230,3 +233,362 @@ def test_gid():
     mgr.setGid(6)
     assert mgr.gid() == 6
 
+
+def test_subscribe():
+    mgr = GameManager()
+    seen = []
+    def callback(m, changes):
+        assert m is mgr
+        seen.append(changes)
+
+    mgr.subscribe(callback)
+    mgr.addWhiteGoal(3)
+    mgr.setGameState(GameState.second_half)
+    assert seen == [frozenset([ChangeKind.score, ChangeKind.goal_added]),
+                    frozenset([ChangeKind.period])]
+
+    mgr.unsubscribe(callback)
+    mgr.setTid(1)
+    assert len(seen) == 2
+
+
+def test_listener_coalesces():
+    mgr = GameManager()
+    listener = mgr.listen()
+    assert listener.poll() == frozenset()
+
+    mgr.setWhiteScore(1)
+    mgr.setBlackScore(2)
+    mgr.addPenalty(Penalty(24, TeamColor.white, 5 * 60))
+    assert listener.poll() == frozenset([ChangeKind.score,
+                                         ChangeKind.penalty_added])
+    assert listener.poll() == frozenset()
+
+    listener.close()
+    mgr.setWhiteScore(3)
+    assert listener.poll() == frozenset()
+
+
+def test_listener_wait():
+    mgr = GameManager()
+    listener = mgr.listen()
+
+    assert listener.wait(0.01) == frozenset()
+
+    timer = threading.Timer(0.01, lambda: mgr.setTimeoutState(TimeoutState.ref))
+    timer.start()
+    assert listener.wait(5) == frozenset([ChangeKind.timeout])
+    timer.join()
+
+
+def test_listener_asyncio():
+    mgr = GameManager()
+    listener = mgr.listen()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        event = listener.asyncio_event(loop)
+        loop.run_in_executor(None, mgr.setLayout, PoolLayout.white_on_left)
+        loop.run_until_complete(asyncio.wait_for(event.wait(), 5))
+        event.clear()
+        assert listener.poll() == frozenset([ChangeKind.layout])
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_stampRecords():
+    mgr = GameManager()
+    assert mgr.stampRecords() == 0
+
+    p = Penalty(2, TeamColor.white, 60)
+    mgr.addPenalty(p)
+    mgr.addWhiteGoal(4)
+    assert mgr.recordSeq() == 0
+    assert mgr.stampRecords() == 2
+    assert p.seq() == 1
+    assert mgr.goals()[0].seq() == 2
+
+    # Stamps stick until the record changes
+    assert mgr.stampRecords() == 2
+    p.setDuration(120)
+    assert p.seq() == 0
+    assert mgr.stampRecords() == 3
+    assert p.seq() == 3
+
+    # Kept up to date as records arrive with seqs of their own, or leave
+    q = Penalty(5, TeamColor.black, 60)
+    q.setSeq(9)
+    mgr.addPenalty(q)
+    assert mgr.recordSeq() == 9
+    assert mgr.snapshot().recordSeq() == 9
+    mgr.delPenaltyByPlayer(5, TeamColor.black)
+    assert mgr.recordSeq() == 3
+    mgr.deleteAllPenalties()
+    mgr.delAllGoals()
+    assert mgr.recordSeq() == 0
+
+
+def test_indexed_records():
+    mgr = GameManager()
+    p1 = Penalty(2, TeamColor.white, 60)
+    p2 = Penalty(3, TeamColor.black, 60)
+    p3 = Penalty(2, TeamColor.white, 120)
+    p4 = Penalty(5, TeamColor.white, 60)
+    for p in (p1, p2, p3, p4):
+        mgr.addPenalty(p)
+
+    assert mgr.penalties(TeamColor.white) == [p1, p3, p4]
+    assert [p.duration() for p in mgr.penalties(TeamColor.white)] == [60, 120, 60]
+    assert mgr.penaltyByPlayer(3, TeamColor.black) is p2
+    assert mgr.penaltyByPlayer(3, TeamColor.white) is None
+
+    # Like list.remove, only the first one
+    mgr.delPenalty(Penalty(2, TeamColor.white, 0))
+    assert [p.duration() for p in mgr.penalties(TeamColor.white)] == [120, 60]
+    mgr.delPenaltyByPlayer(5, TeamColor.white)
+    assert mgr.penalties(TeamColor.white) == [p3]
+
+    # Moving a penalty to another player or team is picked up
+    p3.setTeam(TeamColor.black)
+    assert mgr.penalties(TeamColor.white) == []
+    assert mgr.penaltyByPlayer(2, TeamColor.black) is p3
+    p3.setPlayer(9)
+    mgr.delPenaltyByPlayer(9, TeamColor.black)
+    assert mgr.penalties(TeamColor.black) == [p2]
+
+    # ...by the manager holding it, and only that one
+    other = GameManager()
+    other.addPenalty(Penalty(2, TeamColor.white, 60))
+    index = other._penalties_by_player
+    p2.setPlayer(4)
+    assert other._penalties_by_player is index
+    assert mgr.penaltyByPlayer(4, TeamColor.black) is p2
+    assert mgr.snapshot().penaltyByPlayer(4, TeamColor.black).player() == 4
+
+    # Several players' penalties stay in the order they were added
+    mgr.deleteAllPenalties()
+    for (player, duration) in ((1, 60), (2, 60), (1, 120)):
+        mgr.addPenalty(Penalty(player, TeamColor.white, duration))
+    mgr.addPenalty(Penalty(1, TeamColor.black, 60))
+    assert ([(p.player(), p.duration()) for p in mgr.penalties(TeamColor.white)] ==
+            [(1, 60), (2, 60), (1, 120)])
+    assert [p.team() for p in mgr._all_penalties()] == [TeamColor.white] * 3 + [TeamColor.black]
+    assert [p.duration() for p in mgr.penaltiesByPlayer(1, TeamColor.white)] == [60, 120]
+    # ...even when one of them moves, or is replaced
+    mgr.penaltyByPlayer(2, TeamColor.white).setPlayer(1)
+    assert ([p.duration() for p in mgr.penaltiesByPlayer(1, TeamColor.white)] ==
+            [60, 60, 120])
+    mgr.putPenalty(Penalty(1, TeamColor.white, 300), 1)
+    assert ([p.duration() for p in mgr.penalties(TeamColor.white)] ==
+            [60, 300, 120])
+    assert ([p.duration() for p in mgr.snapshot().penalties(TeamColor.white)] ==
+            [60, 300, 120])
+    mgr.delPenalty(Penalty(1, TeamColor.white, 0))
+    assert [p.duration() for p in mgr.penaltiesByPlayer(1, TeamColor.white)] == [300, 120]
+    # ...and trimmed to however many the player should have
+    mgr.putPenalty(Penalty(1, TeamColor.white, 240), 0, count=1)
+    assert [p.duration() for p in mgr.penalties(TeamColor.white)] == [240]
+
+    mgr.addWhiteGoal(4)
+    mgr.addBlackGoal(5)
+    mgr.addWhiteGoal(6)
+    assert [g.player() for g in mgr.goals()] == [4, 5, 6]
+    mgr.delGoalByNo(2, TeamColor.black)
+    assert [g.player() for g in mgr.goals()] == [4, 6]
+    assert mgr.goalByNo(3, TeamColor.white).player() == 6
+    assert mgr.goalByNo(3, TeamColor.black) is None
+
+
+def test_record_equality():
+    p = Penalty(24, TeamColor.white, 5 * 60)
+    assert p == Penalty(24, TeamColor.white, 2 * 60)
+    assert p != Penalty(24, TeamColor.black, 5 * 60)
+    assert len({p, Penalty(24, TeamColor.white, 60)}) == 1
+
+    g = Goal(1, 7, TeamColor.black, 100, GameState.first_half)
+    assert g == Goal(1, 7, TeamColor.black, 100, GameState.first_half)
+    assert g != Goal(1, 8, TeamColor.black, 100, GameState.first_half)
+    assert len({g, Goal(1, 7, TeamColor.black, 100, GameState.first_half)}) == 1
+
+    threw = False
+    try:
+        p.color = 'red'
+    except AttributeError:
+        threw = True
+    assert threw
+
+
+def test_gameClockPrecise():
+    from . import gamemanager
+    clock = [1000.0]
+    real_now = gamemanager.now
+    gamemanager.now = lambda: clock[0]
+    try:
+        mgr = GameManager()
+        mgr.setGameClock(60)
+
+        # Stopping and starting doesn't lose the part of a second
+        for _ in range(5):
+            mgr.setGameClockRunning(True)
+            clock[0] += 0.4
+            mgr.setGameClockRunning(False)
+        assert abs(mgr.gameClockPrecise() - 58.0) < 1e-9
+        assert mgr.gameClock() == 58
+
+        mgr.setGameClockRunning(True)
+        clock[0] += 0.25
+        assert abs(mgr.gameClockPrecise() - 57.75) < 1e-9
+        assert mgr.gameClock() == 57
+
+        (seconds, since) = mgr.gameClockBasis()
+        assert seconds - (clock[0] - since) == mgr.gameClockPrecise()
+        mgr.setGameClockRunning(False)
+        assert mgr.gameClockBasis()[1] is None
+    finally:
+        gamemanager.now = real_now
+
+
+def test_passive_extrapolate():
+    from . import gamemanager
+    clock = [1000.0]
+    real_now = gamemanager.now
+    gamemanager.now = lambda: clock[0]
+    try:
+        mgr = GameManager()
+        mgr.setPassive(extrapolate=True, drift_threshold=0.5)
+        mgr.setGameClockRunning(True)
+        mgr.setGameClock(60)
+
+        # Keeps ticking between updates
+        clock[0] += 2.5
+        assert mgr.gameClockPrecise() == 57.5
+        assert mgr.gameClockBasis() == (60, 1000.0)
+
+        # Small disagreements are ignored, bigger ones are taken
+        mgr.syncGameClock(57.25)
+        assert mgr.gameClockPrecise() == 57.5
+        mgr.syncGameClock(50)
+        assert mgr.gameClockPrecise() == 50
+
+        # Without extrapolation a passive clock only moves when told to
+        mgr.setPassive()
+        clock[0] += 3
+        assert mgr.gameClockPrecise() == 50
+        mgr.syncGameClock(49.75)
+        assert mgr.gameClockPrecise() == 49.75
+    finally:
+        gamemanager.now = real_now
+
+def test_lock():
+    mgr = GameManager()
+    stop = threading.Event()
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            n += 1
+            with mgr.lock():
+                mgr.setWhiteScore(n)
+                mgr.setBlackScore(n)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(2000):
+            with mgr.lock():
+                assert mgr.whiteScore() == mgr.blackScore()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_snapshot():
+    mgr = GameManager()
+    mgr.setWhiteScore(2)
+    mgr.addPenalty(Penalty(4, TeamColor.black, 60))
+    mgr.addWhiteGoal(9)
+
+    snap = mgr.snapshot()
+    assert mgr.snapshot() is snap
+    assert snap.whiteScore() == 3
+    assert [p.player() for p in snap.penalties(TeamColor.black)] == [4]
+    assert snap.goalByNo(3, TeamColor.white).player() == 9
+
+    # Later changes make a new one, and leave the old one alone
+    mgr.setBlackScore(1)
+    mgr.penalties(TeamColor.black)[0].setDurationRemaining(30)
+    newer = mgr.snapshot()
+    assert newer is not snap
+    assert (snap.blackScore(), newer.blackScore()) == (0, 1)
+    assert snap.penalties(TeamColor.black)[0].durationRemaining() == 60
+    assert newer.penalties(TeamColor.black)[0].durationRemaining() == 30
+
+    # Even a penalty edited behind the manager's back
+    mgr.penalties(TeamColor.black)[0].setDurationRemaining(20)
+    assert mgr.snapshot().penalties(TeamColor.black)[0].durationRemaining() == 20
+
+    # Records nobody touched are shared with the older snapshot
+    mgr.setWhiteScore(5)
+    assert mgr.snapshot().goals() == newer.goals()
+    assert mgr.snapshot().goals()[0] is newer.goals()[0]
+    assert (mgr.snapshot().penalties(TeamColor.black)[0] is not
+            newer.penalties(TeamColor.black)[0])
+
+    # ...which is nothing to do with any other manager
+    other = GameManager()
+    other_snap = other.snapshot()
+    mgr.penalties(TeamColor.black)[0].setDurationRemaining(10)
+    assert other.snapshot() is other_snap
+
+    # Reading one never waits for a writer
+    done = threading.Event()
+    with mgr.lock():
+        reader = threading.Thread(target=lambda: (mgr.snapshot(), done.set()))
+        reader.start()
+        assert done.wait(1)
+    reader.join()
+
+
+def test_snapshot_clock():
+    from . import gamemanager
+    clock = [1000.0]
+    real_now = gamemanager.now
+    gamemanager.now = lambda: clock[0]
+    try:
+        mgr = GameManager()
+        mgr.setGameClock(60)
+        mgr.setGameClockRunning(True)
+        snap = mgr.snapshot()
+
+        # The clock keeps running without a new snapshot
+        clock[0] += 2.5
+        assert mgr.snapshot() is snap
+        assert snap.gameClockPrecise() == 57.5
+        assert snap.gameClockRunning()
+    finally:
+        gamemanager.now = real_now
+
+
+def test_snapshot_threads():
+    mgr = GameManager()
+    stop = threading.Event()
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            n += 1
+            with mgr.lock():
+                mgr.setWhiteScore(n)
+                mgr.setBlackScore(n)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        for _ in range(2000):
+            snap = mgr.snapshot()
+            assert snap.whiteScore() == snap.blackScore()
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,405 @@
+""" Transports that need no hardware, for soak tests and benchmarks of the
+    broadcast path: an in-memory bus that hands frames straight to each
+    client's recv_raw, and a pseudo-serial line (socketpairs or ptys) that
+    RS485Server and RS485Client can be pointed at. Both can be throttled to a
+    baud rate and made to lose, reorder and corrupt frames. """
+
+from .comms import UWHProtoHandler
+from .framing import framing_for_name
+from .rs485_comms import RS485Server
+
+import heapq
+import itertools
+import logging
+import os
+import random
+import selectors
+import serial
+import socket
+import threading
+import time
+import tty
+
+
+class LinkModel(object):
+    """ How badly a link treats the frames sent over it. `loss`, `reorder`
+        and `corrupt` are per-frame probabilities; a reordered frame is held
+        back `reorder_delay` seconds longer than the ones after it. `baud` of
+        None means no throttling. """
+
+    def __init__(self, baud=None, latency=0, loss=0, reorder=0,
+                 reorder_delay=0.01, corrupt=0, seed=None):
+        self.baud = baud
+        self.latency = latency
+        self.loss = loss
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.corrupt = corrupt
+        self._random = random.Random(seed)
+
+    def wire_time(self, nbytes):
+        """ Seconds to clock out `nbytes`, at 8N1 """
+        if not self.baud:
+            return 0
+        return nbytes * 10.0 / self.baud
+
+    def lost(self):
+        return self.loss > 0 and self._random.random() < self.loss
+
+    def delay(self):
+        if self.reorder > 0 and self._random.random() < self.reorder:
+            return self.latency + self.reorder_delay
+        return self.latency
+
+    def mangle(self, data):
+        """ `data`, with one bit flipped if it was unlucky """
+        data = bytes(data)
+        if not data or self.corrupt <= 0 or self._random.random() >= self.corrupt:
+            return data
+        bit = self._random.randrange(len(data) * 8)
+        mangled = bytearray(data)
+        mangled[bit // 8] ^= 1 << (bit % 8)
+        return bytes(mangled)
+
+
+class _Scheduler(object):
+    """ Runs callbacks at given time.monotonic() times, in order, on one
+        background thread """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._queue = []
+        self._order = itertools.count()
+        self._busy = False
+        self._closed = False
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def at(self, when, fn, *args):
+        with self._cond:
+            heapq.heappush(self._queue, (when, next(self._order), fn, args))
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._queue:
+                        wait = self._queue[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                if self._closed:
+                    return
+                (_, _, fn, args) = heapq.heappop(self._queue)
+                self._busy = True
+            try:
+                fn(*args)
+            except Exception:
+                logging.exception("Loopback delivery failed")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def drain(self, timeout=None):
+        """ Wait until everything scheduled so far has run. Returns False if
+            `timeout` ran out first. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._busy:
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            del self._queue[:]
+            self._cond.notify_all()
+
+
+class LoopbackBus(object):
+    """ A shared medium between one server and any number of clients. What
+        the server sends reaches every client (or just `recipient`, if it is
+        one of them); what a client sends reaches the server. Senders block
+        for the wire time, one transmission at a time. """
+
+    def __init__(self, link=None):
+        self.link = link or LinkModel()
+        self.server = None
+        self.clients = []
+        self._medium = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict(frames=0, bytes=0, delivered=0, lost=0, errors=0)
+        self._scheduler = _Scheduler()
+
+    def attach(self, handler, server=False):
+        if server:
+            self.server = handler
+        else:
+            self.clients.append(handler)
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def stats(self):
+        """ Counts of frames and bytes sent, and of deliveries that arrived,
+            got lost, or blew up in the recipient """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def transmit(self, sender, recipient, data):
+        """ Returns whether anybody will receive `data` """
+        if sender is self.server:
+            recipients = [recipient] if recipient in self.clients else self.clients
+        else:
+            recipients = [self.server] if self.server is not None else []
+
+        with self._medium:
+            time.sleep(self.link.wire_time(len(data)))
+        self._count('frames')
+        self._count('bytes', len(data))
+
+        sent_at = time.monotonic()
+        delivered = False
+        for r in recipients:
+            if self.link.lost():
+                self._count('lost')
+                continue
+            self._scheduler.at(sent_at + self.link.delay(), self._deliver,
+                               sender, r, self.link.mangle(data))
+            delivered = True
+        return delivered
+
+    def _deliver(self, sender, recipient, data):
+        try:
+            recipient.recv_raw(sender, data)
+        except Exception:
+            # Corruption the framing didn't catch, e.g. a protobuf DecodeError
+            self._count('errors')
+            logging.debug("Loopback recipient failed", exc_info=True)
+        else:
+            self._count('delivered')
+
+    def drain(self, timeout=None):
+        """ Wait until everything sent so far has been delivered """
+        return self._scheduler.drain(timeout)
+
+    def close(self):
+        self._scheduler.close()
+
+
+class LoopbackServer(UWHProtoHandler):
+    def __init__(self, mgr, bus, acks=False):
+        """ With `acks`, send_raw reports frames that nobody received, the
+            way an XBee does """
+        UWHProtoHandler.__init__(self, mgr)
+        self._bus = bus
+        self._acks = acks
+        bus.attach(self, server=True)
+
+    def send_raw(self, recipient, data):
+        delivered = self._bus.transmit(self, recipient, data)
+        if self._acks:
+            return delivered
+
+    # The real RS485 loop, so that soak tests on the bus exercise it
+    broadcast_loop = RS485Server.broadcast_loop
+    broadcast_thread = RS485Server.broadcast_thread
+
+
+class LoopbackClient(UWHProtoHandler):
+    resync_requests = True
+
+    def __init__(self, mgr, bus):
+        UWHProtoHandler.__init__(self, mgr)
+        self._bus = bus
+        bus.attach(self)
+
+    def send_raw(self, recipient, data):
+        return self._bus.transmit(self, recipient, data)
+
+
+class SocketSerial(object):
+    """ Just enough of serial.Serial for RS485Server and RS485Client, over
+        one end of a socketpair """
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def read(self, size=1):
+        data = bytearray()
+        while len(data) < size:
+            try:
+                chunk = self._sock.recv(size - len(data))
+            except OSError as e:
+                raise serial.SerialException(str(e))
+            if not chunk:
+                raise serial.SerialException("Port closed")
+            data += chunk
+        return bytes(data)
+
+    @property
+    def in_waiting(self):
+        try:
+            return len(self._sock.recv(65536, socket.MSG_PEEK | socket.MSG_DONTWAIT))
+        except (BlockingIOError, OSError):
+            return 0
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def write(self, data):
+        try:
+            self._sock.sendall(data)
+        except OSError as e:
+            raise serial.SerialException(str(e))
+        return len(data)
+
+    def close(self):
+        self._sock.close()
+
+
+class SerialBus(object):
+    """ A pseudo multi-drop serial line: one port for the server and one per
+        client, to hand to RS485Server and RS485Client in place of a device
+        name. A hub in between splits the byte streams into frames on the
+        `framing` delimiter and passes each through `link`, so a frame can
+        be throttled, lost, held back or corrupted on its way to each client.
+
+        With `pty`, the ports are pseudo-terminal paths, which anything that
+        opens a serial port by name can use. Otherwise they are in-process
+        SocketSerial objects. """
+
+    def __init__(self, clients=1, link=None, framing='hex', pty=False):
+        self.link = link or LinkModel()
+        self._delimiter = framing_for_name(framing).delimiter
+        self._scheduler = _Scheduler()
+        self._stats_lock = threading.Lock()
+        self._stats = dict(frames=0, bytes=0, delivered=0, lost=0)
+        self._closing = []
+
+        (self._server_fd, self.server_port) = self._open_port(pty)
+        self._client_fds = []
+        self.client_ports = []
+        for _ in range(clients):
+            (fd, port) = self._open_port(pty)
+            self._client_fds.append(fd)
+            self.client_ports.append(port)
+
+        (self._wakeup_r, self._wakeup_w) = os.pipe()
+        self._closed = False
+        self._thread = threading.Thread(target=self._hub)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _open_port(self, pty):
+        """ (fd for the hub, port for the handler) """
+        if pty:
+            (master, slave) = os.openpty()
+            tty.setraw(slave)
+            # Hold the slave open, or the master reads EIO between opens
+            self._closing += [master, slave]
+            return (master, os.ttyname(slave))
+        (hub_end, port_end) = socket.socketpair()
+        self._closing += [hub_end, port_end]
+        return (hub_end.fileno(), SocketSerial(port_end))
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _hub(self):
+        sel = selectors.DefaultSelector()
+        buffers = {}
+        for fd in [self._server_fd] + self._client_fds:
+            sel.register(fd, selectors.EVENT_READ)
+            buffers[fd] = bytearray()
+        sel.register(self._wakeup_r, selectors.EVENT_READ)
+
+        while not self._closed:
+            for (key, _) in sel.select():
+                fd = key.fd
+                if fd == self._wakeup_r:
+                    continue
+                try:
+                    data = os.read(fd, 4096)
+                except OSError:
+                    data = b''
+                if not data:
+                    sel.unregister(fd)
+                    continue
+
+                buf = buffers[fd]
+                buf += data
+                while True:
+                    end = buf.find(self._delimiter)
+                    if end < 0:
+                        break
+                    frame = bytes(buf[:end + len(self._delimiter)])
+                    del buf[:end + len(self._delimiter)]
+                    self._forward(fd, frame)
+        sel.close()
+
+    def _forward(self, from_fd, frame):
+        # Half duplex: the hub clocks out one frame at a time, in both
+        # directions
+        time.sleep(self.link.wire_time(len(frame)))
+        self._count('frames')
+        self._count('bytes', len(frame))
+
+        if from_fd == self._server_fd:
+            destinations = self._client_fds
+        else:
+            destinations = [self._server_fd]
+        sent_at = time.monotonic()
+        for fd in destinations:
+            if self.link.lost():
+                self._count('lost')
+                continue
+            self._scheduler.at(sent_at + self.link.delay(), self._write,
+                               fd, self.link.mangle(frame))
+
+    def _write(self, fd, data):
+        try:
+            os.write(fd, data)
+        except OSError:
+            return
+        self._count('delivered')
+
+    def drain(self, timeout=None):
+        """ Wait until every frame the hub has seen so far is written out """
+        return self._scheduler.drain(timeout)
+
+    def close(self):
+        self._closed = True
+        os.write(self._wakeup_w, b'x')
+        self._thread.join(1)
+        self._scheduler.close()
+        for port in [self.server_port] + self.client_ports:
+            if isinstance(port, SocketSerial):
+                port.close()
+        for obj in self._closing:
+            try:
+                if isinstance(obj, int):
+                    os.close(obj)
+                else:
+                    obj.close()
+            except OSError:
+                pass
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
@@ -0,0 +1,156 @@
+from .gamemanager import GameManager, TeamColor
+from .loopback_comms import LinkModel, LoopbackBus, LoopbackServer, LoopbackClient, SerialBus
+from .rs485_comms import RS485Server, RS485Client
+from .testing import game, wait_for
+
+import os
+import pytest
+import threading
+
+
+def test_LinkModel():
+    assert LinkModel().wire_time(100) == 0
+    assert LinkModel(baud=1000).wire_time(100) == 1.0
+
+    link = LinkModel(loss=1, corrupt=1, seed=1)
+    assert link.lost()
+    data = bytes(range(20))
+    mangled = link.mangle(data)
+    assert len(mangled) == len(data)
+    assert sum(bin(a ^ b).count('1') for (a, b) in zip(data, mangled)) == 1
+
+    link = LinkModel(latency=0.5, reorder=1, reorder_delay=0.25)
+    assert not link.lost()
+    assert link.delay() == 0.75
+    assert link.mangle(data) == data
+
+
+def test_loopback():
+    bus = LoopbackBus()
+    server = LoopbackServer(game(), bus)
+    clients = [LoopbackClient(GameManager(), bus) for _ in range(3)]
+
+    server.send_messages('', server.get_Cycle(), batch=True)
+    assert bus.drain(1)
+
+    for c in clients:
+        assert c._mgr.whiteScore() == 3
+        assert len(c._mgr.penalties(TeamColor.black)) == 1
+    stats = bus.stats()
+    assert stats['delivered'] == 3 * stats['frames']
+    bus.close()
+
+
+def test_loopback_loss():
+    bus = LoopbackBus(LinkModel(loss=1))
+    server = LoopbackServer(game(), bus, acks=True)
+    client = LoopbackClient(GameManager(), bus)
+
+    assert server.send_messages(client, server.get_Cycle()) is False
+    assert bus.drain(1)
+    assert client._mgr.whiteScore() == 0
+    assert bus.stats()['lost'] == bus.stats()['frames']
+    bus.close()
+
+
+def test_loopback_corrupt():
+    bus = LoopbackBus(LinkModel(corrupt=1, seed=3))
+    server = LoopbackServer(game(), bus)
+    LoopbackClient(GameManager(), bus)
+
+    for _ in range(20):
+        server.send_messages('', server.get_Cycle())
+    # Mangled frames are either rejected or misread, but never take the bus
+    # down with them
+    assert bus.drain(1)
+    stats = bus.stats()
+    assert stats['delivered'] + stats['errors'] == stats['frames']
+    bus.close()
+
+
+def test_loopback_reorder():
+    bus = LoopbackBus(LinkModel(reorder=1, reorder_delay=0.05))
+    server = LoopbackServer(game(), bus)
+    client = LoopbackClient(GameManager(), bus)
+
+    server.send_messages('', server.get_Cycle())
+    assert client._mgr.whiteScore() == 0
+    assert bus.drain(1)
+    assert client._mgr.whiteScore() == 3
+    bus.close()
+
+
+def test_loopback_broadcast_thread():
+    bus = LoopbackBus(LinkModel(baud=115200))
+    mgr = game()
+    server = LoopbackServer(mgr, bus)
+    client = LoopbackClient(GameManager(), bus)
+
+    stop = threading.Event()
+    thread = server.broadcast_thread(delta=True, interval=0.01,
+                                     resync_interval=0.1,
+                                     event_driven=True, stop=stop)
+    assert wait_for(lambda: client._mgr.whiteScore() == 3)
+    mgr.addBlackGoal(4)
+    assert wait_for(lambda: client._mgr.blackScore() == 1)
+    stop.set()
+    thread.join(1)
+    assert not thread.is_alive()
+    bus.close()
+
+
+@pytest.mark.parametrize('framing', ['hex', 'cobs'])
+def test_SerialBus(framing):
+    bus = SerialBus(clients=2, framing=framing)
+    server = RS485Server(game(), bus.server_port, 115200, framing)
+    clients = [RS485Client(GameManager(), port, 115200, framing)
+               for port in bus.client_ports]
+    for c in clients:
+        c.listen_thread()
+
+    server.send_messages('', server.get_Cycle(), batch=True)
+    for c in clients:
+        assert wait_for(lambda: c._mgr.whiteScore() == 3)
+        assert wait_for(lambda: len(c._mgr.penalties(TeamColor.black)) == 1)
+    bus.close()
+
+
+
+def test_SerialBus_broadcast_thread():
+    # The real server loop, over a slow line that loses frames
+    bus = SerialBus(clients=2, link=LinkModel(baud=115200, loss=0.2, seed=5),
+                    framing='cobs')
+    mgr = game()
+    server = RS485Server(mgr, bus.server_port, 115200, 'cobs')
+    clients = [RS485Client(GameManager(), port, 115200, 'cobs')
+               for port in bus.client_ports]
+    for c in clients:
+        c.listen_thread()
+
+    stop = threading.Event()
+    thread = server.broadcast_thread(delta=True, interval=0.01,
+                                     resync_interval=0.1, event_driven=True,
+                                     batch=True, stop=stop)
+    for c in clients:
+        assert wait_for(lambda: c._mgr.whiteScore() == 3)
+    mgr.addBlackGoal(4)
+    for c in clients:
+        assert wait_for(lambda: c._mgr.blackScore() == 1)
+        assert wait_for(lambda: len(c._mgr.goals()) == 1)
+    stop.set()
+    thread.join(1)
+    assert not thread.is_alive()
+    bus.close()
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason="no ptys here")
+def test_SerialBus_pty():
+    bus = SerialBus(clients=1, link=LinkModel(baud=115200), pty=True)
+    assert os.path.exists(bus.server_port)
+
+    server = RS485Server(game(), bus.server_port, 115200)
+    client = RS485Client(GameManager(), bus.client_ports[0], 115200)
+    client.listen_thread()
+
+    server.send_messages('', server.get_Cycle())
+    assert wait_for(lambda: client._mgr.whiteScore() == 3)
+    bus.close()
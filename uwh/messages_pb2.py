@@ -1,14 +1,11 @@
+# -*- coding: utf-8 -*-
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: messages.proto
-
-import sys
-_b=sys.version_info[0]<3 and (lambda x:x) or (lambda x:x.encode('latin1'))
-from google.protobuf.internal import enum_type_wrapper
+"""Generated protocol buffer code."""
+from google.protobuf.internal import builder as _builder
 from google.protobuf import descriptor as _descriptor
-from google.protobuf import message as _message
-from google.protobuf import reflection as _reflection
+from google.protobuf import descriptor_pool as _descriptor_pool
 from google.protobuf import symbol_database as _symbol_database
-from google.protobuf import descriptor_pb2
 # @@protoc_insertion_point(imports)
 
 _sym_db = _symbol_database.Default()
@@ -16,571 +13,59 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor.FileDescriptor(
-  name='messages.proto',
-  package='',
-  serialized_pb=_b('\n\x0emessages.proto\"\x14\n\x04Ping\x12\x0c\n\x04\x44\x61ta\x18\x01 \x02(\r\"\x14\n\x04Pong\x12\x0c\n\x04\x44\x61ta\x18\x01 \x02(\r\"l\n\x07Penalty\x12\x10\n\x08PlayerNo\x18\x01 \x01(\x05\x12\x11\n\tStartTime\x18\x02 \x01(\r\x12\x10\n\x08\x44uration\x18\x03 \x01(\x05\x12\x19\n\x11\x44urationRemaining\x18\x04 \x01(\x05\x12\x0f\n\x07IsWhite\x18\x05 \x01(\x08\"g\n\x04Goal\x12\x0e\n\x06GoalNo\x18\x01 \x01(\x05\x12\x10\n\x08PlayerNo\x18\x02 \x01(\x05\x12\x0f\n\x07IsWhite\x18\x03 \x01(\x08\x12\x10\n\x08TimeLeft\x18\x04 \x01(\r\x12\x1a\n\x06Period\x18\x05 \x01(\x0e\x32\n.GameState\"\x1c\n\x08GameTime\x12\x10\n\x08TimeLeft\x18\x01 \x02(\r\"\xaa\x02\n\x0cGameKeyFrame\x12\x14\n\x0c\x43lockRunning\x18\x01 \x01(\x08\x12\x10\n\x08TimeLeft\x18\x02 \x01(\r\x12\x12\n\nBlackScore\x18\x03 \x01(\r\x12\x12\n\nWhiteScore\x18\x04 \x01(\r\x12\x1a\n\x06Period\x18\x05 \x01(\x0e\x32\n.GameState\x12\x1e\n\x07Timeout\x18\x06 \x01(\x0e\x32\r.TimeoutState\x12 \n\x0e\x42lackPenalties\x18\x07 \x03(\x0b\x32\x08.Penalty\x12 \n\x0eWhitePenalties\x18\x08 \x03(\x0b\x32\x08.Penalty\x12\x1b\n\x06Layout\x18\t \x01(\x0e\x32\x0b.PoolLayout\x12\x0b\n\x03tid\x18\n \x01(\x05\x12\x0b\n\x03gid\x18\x0b \x01(\x05\x12\x13\n\x0bTimeAtPause\x18\x0c \x01(\r*\xa0\x01\n\x0bMessageType\x12\x14\n\x10MessageType_Ping\x10\x01\x12\x14\n\x10MessageType_Pong\x10\x02\x12\x1c\n\x18MessageType_GameKeyFrame\x10\x03\x12\x17\n\x13MessageType_Penalty\x10\x04\x12\x14\n\x10MessageType_Goal\x10\x05\x12\x18\n\x14MessageType_GameTime\x10\x06*\xb1\x02\n\tGameState\x12\x17\n\x13GameState_WallClock\x10\x00\x12\x17\n\x13GameState_FirstHalf\x10\x01\x12\x18\n\x14GameState_SecondHalf\x10\x02\x12\x16\n\x12GameState_HalfTime\x10\x03\x12\x16\n\x12GameState_GameOver\x10\x04\x12\x15\n\x11GameState_PreGame\x10\x05\x12\x15\n\x11GameState_OTFirst\x10\x06\x12\x14\n\x10GameState_OTHalf\x10\x07\x12\x16\n\x12GameState_OTSecond\x10\x08\x12\x19\n\x15GameState_SuddenDeath\x10\t\x12\x13\n\x0fGameState_PreOT\x10\n\x12\x1c\n\x18GameState_PreSuddenDeath\x10\x0b*\x9e\x01\n\x0cTimeoutState\x12\x15\n\x11TimeoutState_None\x10\x00\x12\x1b\n\x17TimeoutState_RefTimeout\x10\x01\x12\x1d\n\x19TimeoutState_BlackTimeout\x10\x02\x12\x1d\n\x19TimeoutState_WhiteTimeout\x10\x03\x12\x1c\n\x18TimeoutState_PenaltyShot\x10\x04*/\n\nPoolLayout\x12\x0f\n\x0bWhiteOnLeft\x10\x00\x12\x10\n\x0cWhiteOnRight\x10\x01')
-)
-_sym_db.RegisterFileDescriptor(DESCRIPTOR)
-
-_MESSAGETYPE = _descriptor.EnumDescriptor(
-  name='MessageType',
-  full_name='MessageType',
-  filename=None,
-  file=DESCRIPTOR,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='MessageType_Ping', index=0, number=1,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='MessageType_Pong', index=1, number=2,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='MessageType_GameKeyFrame', index=2, number=3,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='MessageType_Penalty', index=3, number=4,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='MessageType_Goal', index=4, number=5,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='MessageType_GameTime', index=5, number=6,
-      options=None,
-      type=None),
-  ],
-  containing_type=None,
-  options=None,
-  serialized_start=609,
-  serialized_end=769,
-)
-_sym_db.RegisterEnumDescriptor(_MESSAGETYPE)
-
-MessageType = enum_type_wrapper.EnumTypeWrapper(_MESSAGETYPE)
-_GAMESTATE = _descriptor.EnumDescriptor(
-  name='GameState',
-  full_name='GameState',
-  filename=None,
-  file=DESCRIPTOR,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='GameState_WallClock', index=0, number=0,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_FirstHalf', index=1, number=1,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_SecondHalf', index=2, number=2,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_HalfTime', index=3, number=3,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_GameOver', index=4, number=4,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_PreGame', index=5, number=5,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_OTFirst', index=6, number=6,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_OTHalf', index=7, number=7,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_OTSecond', index=8, number=8,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_SuddenDeath', index=9, number=9,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_PreOT', index=10, number=10,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='GameState_PreSuddenDeath', index=11, number=11,
-      options=None,
-      type=None),
-  ],
-  containing_type=None,
-  options=None,
-  serialized_start=772,
-  serialized_end=1077,
-)
-_sym_db.RegisterEnumDescriptor(_GAMESTATE)
-
-GameState = enum_type_wrapper.EnumTypeWrapper(_GAMESTATE)
-_TIMEOUTSTATE = _descriptor.EnumDescriptor(
-  name='TimeoutState',
-  full_name='TimeoutState',
-  filename=None,
-  file=DESCRIPTOR,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='TimeoutState_None', index=0, number=0,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='TimeoutState_RefTimeout', index=1, number=1,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='TimeoutState_BlackTimeout', index=2, number=2,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='TimeoutState_WhiteTimeout', index=3, number=3,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='TimeoutState_PenaltyShot', index=4, number=4,
-      options=None,
-      type=None),
-  ],
-  containing_type=None,
-  options=None,
-  serialized_start=1080,
-  serialized_end=1238,
-)
-_sym_db.RegisterEnumDescriptor(_TIMEOUTSTATE)
-
-TimeoutState = enum_type_wrapper.EnumTypeWrapper(_TIMEOUTSTATE)
-_POOLLAYOUT = _descriptor.EnumDescriptor(
-  name='PoolLayout',
-  full_name='PoolLayout',
-  filename=None,
-  file=DESCRIPTOR,
-  values=[
-    _descriptor.EnumValueDescriptor(
-      name='WhiteOnLeft', index=0, number=0,
-      options=None,
-      type=None),
-    _descriptor.EnumValueDescriptor(
-      name='WhiteOnRight', index=1, number=1,
-      options=None,
-      type=None),
-  ],
-  containing_type=None,
-  options=None,
-  serialized_start=1240,
-  serialized_end=1287,
-)
-_sym_db.RegisterEnumDescriptor(_POOLLAYOUT)
-
-PoolLayout = enum_type_wrapper.EnumTypeWrapper(_POOLLAYOUT)
-MessageType_Ping = 1
-MessageType_Pong = 2
-MessageType_GameKeyFrame = 3
-MessageType_Penalty = 4
-MessageType_Goal = 5
-MessageType_GameTime = 6
-GameState_WallClock = 0
-GameState_FirstHalf = 1
-GameState_SecondHalf = 2
-GameState_HalfTime = 3
-GameState_GameOver = 4
-GameState_PreGame = 5
-GameState_OTFirst = 6
-GameState_OTHalf = 7
-GameState_OTSecond = 8
-GameState_SuddenDeath = 9
-GameState_PreOT = 10
-GameState_PreSuddenDeath = 11
-TimeoutState_None = 0
-TimeoutState_RefTimeout = 1
-TimeoutState_BlackTimeout = 2
-TimeoutState_WhiteTimeout = 3
-TimeoutState_PenaltyShot = 4
-WhiteOnLeft = 0
-WhiteOnRight = 1
-
-
-
-_PING = _descriptor.Descriptor(
-  name='Ping',
-  full_name='Ping',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='Data', full_name='Ping.Data', index=0,
-      number=1, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  options=None,
-  is_extendable=False,
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=18,
-  serialized_end=38,
-)
-
-
-_PONG = _descriptor.Descriptor(
-  name='Pong',
-  full_name='Pong',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='Data', full_name='Pong.Data', index=0,
-      number=1, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  options=None,
-  is_extendable=False,
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=40,
-  serialized_end=60,
-)
-
-
-_PENALTY = _descriptor.Descriptor(
-  name='Penalty',
-  full_name='Penalty',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='PlayerNo', full_name='Penalty.PlayerNo', index=0,
-      number=1, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='StartTime', full_name='Penalty.StartTime', index=1,
-      number=2, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='Duration', full_name='Penalty.Duration', index=2,
-      number=3, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='DurationRemaining', full_name='Penalty.DurationRemaining', index=3,
-      number=4, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='IsWhite', full_name='Penalty.IsWhite', index=4,
-      number=5, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  options=None,
-  is_extendable=False,
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=62,
-  serialized_end=170,
-)
-
-
-_GOAL = _descriptor.Descriptor(
-  name='Goal',
-  full_name='Goal',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='GoalNo', full_name='Goal.GoalNo', index=0,
-      number=1, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='PlayerNo', full_name='Goal.PlayerNo', index=1,
-      number=2, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='IsWhite', full_name='Goal.IsWhite', index=2,
-      number=3, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='TimeLeft', full_name='Goal.TimeLeft', index=3,
-      number=4, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='Period', full_name='Goal.Period', index=4,
-      number=5, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  options=None,
-  is_extendable=False,
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=172,
-  serialized_end=275,
-)
-
-
-_GAMETIME = _descriptor.Descriptor(
-  name='GameTime',
-  full_name='GameTime',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='TimeLeft', full_name='GameTime.TimeLeft', index=0,
-      number=1, type=13, cpp_type=3, label=2,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  options=None,
-  is_extendable=False,
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=277,
-  serialized_end=305,
-)
-
-
-_GAMEKEYFRAME = _descriptor.Descriptor(
-  name='GameKeyFrame',
-  full_name='GameKeyFrame',
-  filename=None,
-  file=DESCRIPTOR,
-  containing_type=None,
-  fields=[
-    _descriptor.FieldDescriptor(
-      name='ClockRunning', full_name='GameKeyFrame.ClockRunning', index=0,
-      number=1, type=8, cpp_type=7, label=1,
-      has_default_value=False, default_value=False,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='TimeLeft', full_name='GameKeyFrame.TimeLeft', index=1,
-      number=2, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='BlackScore', full_name='GameKeyFrame.BlackScore', index=2,
-      number=3, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='WhiteScore', full_name='GameKeyFrame.WhiteScore', index=3,
-      number=4, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='Period', full_name='GameKeyFrame.Period', index=4,
-      number=5, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='Timeout', full_name='GameKeyFrame.Timeout', index=5,
-      number=6, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='BlackPenalties', full_name='GameKeyFrame.BlackPenalties', index=6,
-      number=7, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='WhitePenalties', full_name='GameKeyFrame.WhitePenalties', index=7,
-      number=8, type=11, cpp_type=10, label=3,
-      has_default_value=False, default_value=[],
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='Layout', full_name='GameKeyFrame.Layout', index=8,
-      number=9, type=14, cpp_type=8, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='tid', full_name='GameKeyFrame.tid', index=9,
-      number=10, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='gid', full_name='GameKeyFrame.gid', index=10,
-      number=11, type=5, cpp_type=1, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-    _descriptor.FieldDescriptor(
-      name='TimeAtPause', full_name='GameKeyFrame.TimeAtPause', index=11,
-      number=12, type=13, cpp_type=3, label=1,
-      has_default_value=False, default_value=0,
-      message_type=None, enum_type=None, containing_type=None,
-      is_extension=False, extension_scope=None,
-      options=None),
-  ],
-  extensions=[
-  ],
-  nested_types=[],
-  enum_types=[
-  ],
-  options=None,
-  is_extendable=False,
-  extension_ranges=[],
-  oneofs=[
-  ],
-  serialized_start=308,
-  serialized_end=606,
-)
-
-_GOAL.fields_by_name['Period'].enum_type = _GAMESTATE
-_GAMEKEYFRAME.fields_by_name['Period'].enum_type = _GAMESTATE
-_GAMEKEYFRAME.fields_by_name['Timeout'].enum_type = _TIMEOUTSTATE
-_GAMEKEYFRAME.fields_by_name['BlackPenalties'].message_type = _PENALTY
-_GAMEKEYFRAME.fields_by_name['WhitePenalties'].message_type = _PENALTY
-_GAMEKEYFRAME.fields_by_name['Layout'].enum_type = _POOLLAYOUT
-DESCRIPTOR.message_types_by_name['Ping'] = _PING
-DESCRIPTOR.message_types_by_name['Pong'] = _PONG
-DESCRIPTOR.message_types_by_name['Penalty'] = _PENALTY
-DESCRIPTOR.message_types_by_name['Goal'] = _GOAL
-DESCRIPTOR.message_types_by_name['GameTime'] = _GAMETIME
-DESCRIPTOR.message_types_by_name['GameKeyFrame'] = _GAMEKEYFRAME
-DESCRIPTOR.enum_types_by_name['MessageType'] = _MESSAGETYPE
-DESCRIPTOR.enum_types_by_name['GameState'] = _GAMESTATE
-DESCRIPTOR.enum_types_by_name['TimeoutState'] = _TIMEOUTSTATE
-DESCRIPTOR.enum_types_by_name['PoolLayout'] = _POOLLAYOUT
-
-Ping = _reflection.GeneratedProtocolMessageType('Ping', (_message.Message,), dict(
-  DESCRIPTOR = _PING,
-  __module__ = 'messages_pb2'
-  # @@protoc_insertion_point(class_scope:Ping)
-  ))
-_sym_db.RegisterMessage(Ping)
-
-Pong = _reflection.GeneratedProtocolMessageType('Pong', (_message.Message,), dict(
-  DESCRIPTOR = _PONG,
-  __module__ = 'messages_pb2'
-  # @@protoc_insertion_point(class_scope:Pong)
-  ))
-_sym_db.RegisterMessage(Pong)
-
-Penalty = _reflection.GeneratedProtocolMessageType('Penalty', (_message.Message,), dict(
-  DESCRIPTOR = _PENALTY,
-  __module__ = 'messages_pb2'
-  # @@protoc_insertion_point(class_scope:Penalty)
-  ))
-_sym_db.RegisterMessage(Penalty)
-
-Goal = _reflection.GeneratedProtocolMessageType('Goal', (_message.Message,), dict(
-  DESCRIPTOR = _GOAL,
-  __module__ = 'messages_pb2'
-  # @@protoc_insertion_point(class_scope:Goal)
-  ))
-_sym_db.RegisterMessage(Goal)
-
-GameTime = _reflection.GeneratedProtocolMessageType('GameTime', (_message.Message,), dict(
-  DESCRIPTOR = _GAMETIME,
-  __module__ = 'messages_pb2'
-  # @@protoc_insertion_point(class_scope:GameTime)
-  ))
-_sym_db.RegisterMessage(GameTime)
-
-GameKeyFrame = _reflection.GeneratedProtocolMessageType('GameKeyFrame', (_message.Message,), dict(
-  DESCRIPTOR = _GAMEKEYFRAME,
-  __module__ = 'messages_pb2'
-  # @@protoc_insertion_point(class_scope:GameKeyFrame)
-  ))
-_sym_db.RegisterMessage(GameKeyFrame)
-
-
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0emessages.proto\"\x14\n\x04Ping\x12\x0c\n\x04\x44\x61ta\x18\x01 \x02(\r\"\x14\n\x04Pong\x12\x0c\n\x04\x44\x61ta\x18\x01 \x02(\r\"\x97\x01\n\x07Penalty\x12\x10\n\x08PlayerNo\x18\x01 \x01(\x05\x12\x11\n\tStartTime\x18\x02 \x01(\r\x12\x10\n\x08\x44uration\x18\x03 \x01(\x05\x12\x19\n\x11\x44urationRemaining\x18\x04 \x01(\x05\x12\x0f\n\x07IsWhite\x18\x05 \x01(\x08\x12\x0b\n\x03Seq\x18\x06 \x01(\r\x12\r\n\x05Index\x18\x07 \x01(\r\x12\r\n\x05\x43ount\x18\x08 \x01(\r\"t\n\x04Goal\x12\x0e\n\x06GoalNo\x18\x01 \x01(\x05\x12\x10\n\x08PlayerNo\x18\x02 \x01(\x05\x12\x0f\n\x07IsWhite\x18\x03 \x01(\x08\x12\x10\n\x08TimeLeft\x18\x04 \x01(\r\x12\x1a\n\x06Period\x18\x05 \x01(\x0e\x32\n.GameState\x12\x0b\n\x03Seq\x18\x06 \x01(\r\"0\n\x08GameTime\x12\x10\n\x08TimeLeft\x18\x01 \x02(\r\x12\x12\n\nTimeLeftMs\x18\x02 \x01(\r\"\xe6\x02\n\x0cGameKeyFrame\x12\x14\n\x0c\x43lockRunning\x18\x01 \x01(\x08\x12\x10\n\x08TimeLeft\x18\x02 \x01(\r\x12\x12\n\nBlackScore\x18\x03 \x01(\r\x12\x12\n\nWhiteScore\x18\x04 \x01(\r\x12\x1a\n\x06Period\x18\x05 \x01(\x0e\x32\n.GameState\x12\x1e\n\x07Timeout\x18\x06 \x01(\x0e\x32\r.TimeoutState\x12 \n\x0e\x42lackPenalties\x18\x07 \x03(\x0b\x32\x08.Penalty\x12 \n\x0eWhitePenalties\x18\x08 \x03(\x0b\x32\x08.Penalty\x12\x1b\n\x06Layout\x18\t \x01(\x0e\x32\x0b.PoolLayout\x12\x0b\n\x03tid\x18\n \x01(\x05\x12\x0b\n\x03gid\x18\x0b \x01(\x05\x12\x13\n\x0bTimeAtPause\x18\x0c \x01(\r\x12\x11\n\tRecordSeq\x18\r \x01(\r\x12\x12\n\nTimeLeftMs\x18\x0e \x01(\r\x12\x13\n\x0bRecordCount\x18\x0f \x01(\r\"\x1e\n\rResyncRequest\x12\r\n\x05Since\x18\x01 \x01(\r\"\x92\x05\n\x0cGameSnapshot\x12\x0f\n\x07Version\x18\x01 \x01(\r\x12\x0b\n\x03Seq\x18\x02 \x01(\r\x12\x15\n\rFragmentIndex\x18\x03 \x01(\r\x12\x15\n\rFragmentCount\x18\x04 \x01(\r\x12\x14\n\x0c\x43lockRunning\x18\x05 \x01(\x08\x12\x10\n\x08TimeLeft\x18\x06 \x01(\r\x12\x13\n\x0bTimeAtPause\x18\x07 \x01(\r\x12\x12\n\nBlackScore\x18\x08 \x01(\r\x12\x12\n\nWhiteScore\x18\t \x01(\r\x12\x1a\n\x06Period\x18\n \x01(\x0e\x32\n.GameState\x12\x1e\n\x07Timeout\x18\x0b \x01(\x0e\x32\r.TimeoutState\x12\x1b\n\x06Layout\x18\x0c \x01(\x0e\x32\x0b.PoolLayout\x12\x0b\n\x03tid\x18\r \x01(\x05\x12\x0b\n\x03gid\x18\x0e \x01(\x05\x12\x12\n\nTimeLeftMs\x18\x0f \x01(\r\x12\x1b\n\x0fPenaltyPlayerNo\x18\x14 \x03(\x11\x42\x02\x10\x01\x12\x1c\n\x10PenaltyStartTime\x18\x15 \x03(\rB\x02\x10\x01\x12\x1b\n\x0fPenaltyDuration\x18\x16 \x03(\x11\x42\x02\x10\x01\x12$\n\x18PenaltyDurationRemaining\x18\x17 \x03(\x11\x42\x02\x10\x01\x12\x1a\n\x0ePenaltyIsWhite\x18\x18 \x03(\x08\x42\x02\x10\x01\x12\x16\n\nPenaltySeq\x18\x19 \x03(\rB\x02\x10\x01\x12\x12\n\x06GoalNo\x18\x1e \x03(\x11\x42\x02\x10\x01\x12\x18\n\x0cGoalPlayerNo\x18\x1f \x03(\x11\x42\x02\x10\x01\x12\x17\n\x0bGoalIsWhite\x18  \x03(\x08\x42\x02\x10\x01\x12\x18\n\x0cGoalTimeLeft\x18! \x03(\rB\x02\x10\x01\x12\"\n\nGoalPeriod\x18\" \x03(\x0e\x32\n.GameStateB\x02\x10\x01\x12\x13\n\x07GoalSeq\x18# \x03(\rB\x02\x10\x01*\xf4\x01\n\x0bMessageType\x12\x14\n\x10MessageType_Ping\x10\x01\x12\x14\n\x10MessageType_Pong\x10\x02\x12\x1c\n\x18MessageType_GameKeyFrame\x10\x03\x12\x17\n\x13MessageType_Penalty\x10\x04\x12\x14\n\x10MessageType_Goal\x10\x05\x12\x18\n\x14MessageType_GameTime\x10\x06\x12\x15\n\x11MessageType_Batch\x10\x07\x12\x1c\n\x18MessageType_GameSnapshot\x10\x08\x12\x1d\n\x19MessageType_ResyncRequest\x10\t*\xb1\x02\n\tGameState\x12\x17\n\x13GameState_WallClock\x10\x00\x12\x17\n\x13GameState_FirstHalf\x10\x01\x12\x18\n\x14GameState_SecondHalf\x10\x02\x12\x16\n\x12GameState_HalfTime\x10\x03\x12\x16\n\x12GameState_GameOver\x10\x04\x12\x15\n\x11GameState_PreGame\x10\x05\x12\x15\n\x11GameState_OTFirst\x10\x06\x12\x14\n\x10GameState_OTHalf\x10\x07\x12\x16\n\x12GameState_OTSecond\x10\x08\x12\x19\n\x15GameState_SuddenDeath\x10\t\x12\x13\n\x0fGameState_PreOT\x10\n\x12\x1c\n\x18GameState_PreSuddenDeath\x10\x0b*\x9e\x01\n\x0cTimeoutState\x12\x15\n\x11TimeoutState_None\x10\x00\x12\x1b\n\x17TimeoutState_RefTimeout\x10\x01\x12\x1d\n\x19TimeoutState_BlackTimeout\x10\x02\x12\x1d\n\x19TimeoutState_WhiteTimeout\x10\x03\x12\x1c\n\x18TimeoutState_PenaltyShot\x10\x04*/\n\nPoolLayout\x12\x0f\n\x0bWhiteOnLeft\x10\x00\x12\x10\n\x0cWhiteOnRight\x10\x01')
+
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'messages_pb2', globals())
+if _descriptor._USE_C_DESCRIPTORS == False:
+
+  DESCRIPTOR._options = None
+  _GAMESNAPSHOT.fields_by_name['PenaltyPlayerNo']._options = None
+  _GAMESNAPSHOT.fields_by_name['PenaltyPlayerNo']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['PenaltyStartTime']._options = None
+  _GAMESNAPSHOT.fields_by_name['PenaltyStartTime']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['PenaltyDuration']._options = None
+  _GAMESNAPSHOT.fields_by_name['PenaltyDuration']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['PenaltyDurationRemaining']._options = None
+  _GAMESNAPSHOT.fields_by_name['PenaltyDurationRemaining']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['PenaltyIsWhite']._options = None
+  _GAMESNAPSHOT.fields_by_name['PenaltyIsWhite']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['PenaltySeq']._options = None
+  _GAMESNAPSHOT.fields_by_name['PenaltySeq']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['GoalNo']._options = None
+  _GAMESNAPSHOT.fields_by_name['GoalNo']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['GoalPlayerNo']._options = None
+  _GAMESNAPSHOT.fields_by_name['GoalPlayerNo']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['GoalIsWhite']._options = None
+  _GAMESNAPSHOT.fields_by_name['GoalIsWhite']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['GoalTimeLeft']._options = None
+  _GAMESNAPSHOT.fields_by_name['GoalTimeLeft']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['GoalPeriod']._options = None
+  _GAMESNAPSHOT.fields_by_name['GoalPeriod']._serialized_options = b'\020\001'
+  _GAMESNAPSHOT.fields_by_name['GoalSeq']._options = None
+  _GAMESNAPSHOT.fields_by_name['GoalSeq']._serialized_options = b'\020\001'
+  _MESSAGETYPE._serialized_start=1439
+  _MESSAGETYPE._serialized_end=1683
+  _GAMESTATE._serialized_start=1686
+  _GAMESTATE._serialized_end=1991
+  _TIMEOUTSTATE._serialized_start=1994
+  _TIMEOUTSTATE._serialized_end=2152
+  _POOLLAYOUT._serialized_start=2154
+  _POOLLAYOUT._serialized_end=2201
+  _PING._serialized_start=18
+  _PING._serialized_end=38
+  _PONG._serialized_start=40
+  _PONG._serialized_end=60
+  _PENALTY._serialized_start=63
+  _PENALTY._serialized_end=214
+  _GOAL._serialized_start=216
+  _GOAL._serialized_end=332
+  _GAMETIME._serialized_start=334
+  _GAMETIME._serialized_end=382
+  _GAMEKEYFRAME._serialized_start=385
+  _GAMEKEYFRAME._serialized_end=743
+  _RESYNCREQUEST._serialized_start=745
+  _RESYNCREQUEST._serialized_end=775
+  _GAMESNAPSHOT._serialized_start=778
+  _GAMESNAPSHOT._serialized_end=1436
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,493 @@
+""" Ethernet/Wi-Fi transport: every cycle goes out once as a UDP multicast
+    datagram, however many displays are listening, and clients that want to
+    be sure of what they missed catch up over TCP. Each end runs one
+    selector loop, rather than a thread per client.
+
+    The server multicasts a Ping every so often; clients answer by unicast,
+    which gives per-client round trip times and loss over the same path the
+    scores take. """
+
+from . import messages_pb2
+from .comms import UWHProtoHandler, DeltaTracker
+from .framing import framing_for_name, FrameReceiver
+
+from collections import OrderedDict
+from configparser import ConfigParser
+import errno
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+
+def NetConfigParser():
+    defaults = {
+        'group': '239.255.42.1',
+        'port': '4280',
+        'tcp_port': '4281',
+        'interface': '0.0.0.0',
+        'ttl': '1',
+        'batch': 'true',
+        # Only for displays that know GameSnapshot; older ones stall on it
+        'snapshot': 'false',
+    }
+    parser = ConfigParser(defaults=defaults)
+    parser.add_section('net')
+    return parser
+
+def net_group(cfg):
+    return cfg.get('net', 'group')
+
+def net_port(cfg):
+    return cfg.getint('net', 'port')
+
+def net_tcp_port(cfg):
+    """ None if TCP catch-up is turned off (tcp_port = 0) """
+    return cfg.getint('net', 'tcp_port') or None
+
+def net_interface(cfg):
+    return cfg.get('net', 'interface')
+
+def net_ttl(cfg):
+    return cfg.getint('net', 'ttl')
+
+def net_batch(cfg):
+    return cfg.getboolean('net', 'batch')
+
+def net_snapshot(cfg):
+    return cfg.getboolean('net', 'snapshot')
+
+
+class _Stream(object):
+    """ One TCP connection, COBS framed, written without blocking """
+
+    # A catch-up client this far behind is dropped rather than buffered
+    max_backlog = 256 * 1024
+
+    def __init__(self, sock):
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = sock
+        self.peer = sock.getpeername()
+        self._framing = framing_for_name('cobs')
+        self._receiver = FrameReceiver(self._framing)
+        self._out = bytearray()
+
+    def write(self, packet):
+        self._out += self._framing.encode(packet)
+        if len(self._out) > self.max_backlog:
+            raise ConnectionError("TCP client is not keeping up")
+        self.flush()
+
+    def flush(self):
+        if not self._out:
+            return
+        try:
+            sent = self.sock.send(self._out)
+        except BlockingIOError:
+            return
+        del self._out[:sent]
+
+    def wants_write(self):
+        return bool(self._out)
+
+    def read(self):
+        """ The packets completed by whatever has arrived """
+        data = self.sock.recv(4096)
+        if not data:
+            raise ConnectionError("Connection closed")
+        return self._receiver.feed(data)
+
+    def close(self):
+        self.sock.close()
+
+
+def _recv_datagrams(sock):
+    while True:
+        try:
+            yield sock.recvfrom(65536)
+        except OSError:
+            # Nothing left, or an ICMP error left over from a client that
+            # went away
+            return
+
+
+class ClientStats(object):
+    """ Round trips of the multicast Pings to one client, in seconds """
+
+    def __init__(self, first_ping):
+        self.first_ping = first_ping
+        self.pongs = 0
+        self.last = None
+        self.min = None
+        self.max = None
+        self._total = 0.0
+
+    def add(self, rtt):
+        self.pongs += 1
+        self.last = rtt
+        self.min = rtt if self.min is None else min(self.min, rtt)
+        self.max = rtt if self.max is None else max(self.max, rtt)
+        self._total += rtt
+
+    def mean(self):
+        return self._total / self.pongs if self.pongs else None
+
+
+class NetServer(UWHProtoHandler):
+    # Fits in one Ethernet frame, with room for the IP and UDP headers
+    mtu = 1400
+
+    def __init__(self, mgr, group, port, tcp_port=None, interface='0.0.0.0',
+                 ttl=1):
+        """ A `tcp_port` of 0 picks any free port; see tcp_address() """
+        UWHProtoHandler.__init__(self, mgr)
+        self._group = (group, port)
+
+        self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                             socket.inet_aton(interface))
+        self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        self._udp.bind((interface, 0))
+        self._udp.setblocking(False)
+
+        self._listener = None
+        if tcp_port is not None:
+            self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._listener.bind((interface, tcp_port))
+            self._listener.listen(socket.SOMAXCONN)
+            self._listener.setblocking(False)
+
+        self._streams = {}
+        (self._wakeup_r, self._wakeup_w) = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+        self._ping_seq = 0
+        self._pings = OrderedDict()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def tcp_address(self):
+        return None if self._listener is None else self._listener.getsockname()
+
+    def send_raw(self, recipient, data):
+        if isinstance(recipient, _Stream):
+            recipient.write(data)
+            return
+        try:
+            self._udp.sendto(data, recipient or self._group)
+        except OSError:
+            # A full socket buffer is as good as a lost datagram
+            return False
+
+    def recv_message(self, sender, kind, msg):
+        if kind == messages_pb2.MessageType_Pong:
+            self.handle_Pong(sender, msg)
+        else:
+            UWHProtoHandler.recv_message(self, sender, kind, msg)
+
+    def send_Ping(self):
+        self._ping_seq = (self._ping_seq + 1) & 0xFFFFFFFF
+        self._pings[self._ping_seq] = time.monotonic()
+        while len(self._pings) > 64:
+            self._pings.popitem(last=False)
+
+        kind = messages_pb2.MessageType_Ping
+        msg = self.message_for_msg_kind(kind)
+        msg.Data = self._ping_seq
+        self.send_message('', kind, msg)
+
+    def handle_Pong(self, sender, msg):
+        sent_at = self._pings.get(msg.Data)
+        if sent_at is None:
+            return
+        with self._stats_lock:
+            stats = self._stats.get(sender)
+            if stats is None:
+                stats = self._stats[sender] = ClientStats(msg.Data)
+            stats.add(time.monotonic() - sent_at)
+
+    def client_stats(self):
+        """ {client address: dict of pings, pongs, loss, and last, min, mean
+            and max round trip in seconds} for every client that has
+            answered a Ping """
+        with self._stats_lock:
+            result = {}
+            for (addr, stats) in self._stats.items():
+                pings = (self._ping_seq - stats.first_ping) % 2**32 + 1
+                result[addr] = dict(pings=pings, pongs=stats.pongs,
+                                    loss=max(0.0, 1.0 - stats.pongs / pings),
+                                    last=stats.last, min=stats.min,
+                                    mean=stats.mean(), max=stats.max)
+            return result
+
+    def _wake(self, *args):
+        try:
+            self._wakeup_w.send(b'x')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _accept(self, sel):
+        try:
+            (sock, _) = self._listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        stream = _Stream(sock)
+        self._streams[sock] = stream
+        sel.register(sock, selectors.EVENT_READ, stream)
+        # Everything, straight away; it's a newer client, so it knows batches
+        try:
+            self.send_Cycle([stream], batch=True)
+        except (ConnectionError, OSError):
+            self._drop(sel, stream)
+
+    def _drop(self, sel, stream):
+        logging.info("Dropping TCP client %s", stream.peer)
+        sel.unregister(stream.sock)
+        del self._streams[stream.sock]
+        stream.close()
+
+    def broadcast_loop(self, delta=False, interval=0.1, resync_interval=5,
+                       event_driven=False, batch=False, snapshot=False,
+                       drift_threshold=None, ping_interval=1.0, stop=None):
+        """ Multicast a cycle every `interval`, serve catch-up clients, and
+            Ping every `ping_interval` (None for never), until `stop` is set """
+        # Every display hears the same multicast, so one tracker will do
+        trackers = { '' : DeltaTracker(resync_interval, drift_threshold) }
+        sel = selectors.DefaultSelector()
+        sel.register(self._udp, selectors.EVENT_READ)
+        sel.register(self._wakeup_r, selectors.EVENT_READ)
+        if self._listener is not None:
+            sel.register(self._listener, selectors.EVENT_READ)
+        if event_driven:
+            self._mgr.subscribe(self._wake)
+
+        next_cycle = next_ping = time.monotonic()
+        try:
+            while stop is None or not stop.is_set():
+                now = time.monotonic()
+                if now >= next_cycle:
+                    try:
+                        self.send_Cycle([''], trackers, delta, batch, snapshot)
+                    except Exception:
+                        logging.exception("Problem sending broadcast cycle")
+                    # A running clock changes without telling anybody
+                    if not event_driven or self._mgr.gameClockRunning():
+                        next_cycle = now + interval
+                    else:
+                        next_cycle = now + resync_interval
+                if ping_interval and now >= next_ping:
+                    self.send_Ping()
+                    next_ping = now + ping_interval
+
+                wake_at = next_cycle if not ping_interval else min(next_cycle, next_ping)
+                timeout = max(0, wake_at - time.monotonic())
+                # Stop is only an Event, so look at it now and then
+                for (key, _) in sel.select(min(timeout, 0.5)):
+                    self._service(sel, key)
+                    if key.fileobj is self._wakeup_r and event_driven:
+                        next_cycle = time.monotonic()
+
+                for stream in list(self._streams.values()):
+                    events = selectors.EVENT_READ
+                    if stream.wants_write():
+                        events |= selectors.EVENT_WRITE
+                    sel.modify(stream.sock, events, stream)
+        finally:
+            if event_driven:
+                self._mgr.unsubscribe(self._wake)
+            for stream in list(self._streams.values()):
+                self._drop(sel, stream)
+            sel.close()
+
+    def _service(self, sel, key):
+        if key.fileobj is self._wakeup_r:
+            try:
+                while self._wakeup_r.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+        elif key.fileobj is self._udp:
+            for (data, addr) in _recv_datagrams(self._udp):
+                try:
+                    self.recv_raw(addr, data)
+                except Exception:
+                    logging.exception("Problem handling datagram from %s", addr)
+        elif key.fileobj is self._listener:
+            self._accept(sel)
+        else:
+            stream = key.data
+            try:
+                stream.flush()
+                for packet in stream.read():
+                    self.recv_raw(stream, packet)
+            except BlockingIOError:
+                pass
+            except (ConnectionError, OSError):
+                self._drop(sel, stream)
+            except Exception:
+                logging.exception("Problem handling TCP packet from %s", stream.peer)
+
+    def broadcast_thread(self, delta=False, interval=0.1, resync_interval=5,
+                         event_driven=False, batch=False, snapshot=False,
+                         drift_threshold=None, ping_interval=1.0, stop=None):
+        thread = threading.Thread(target=self.broadcast_loop,
+                                  args=(delta, interval, resync_interval,
+                                        event_driven, batch, snapshot,
+                                        drift_threshold, ping_interval, stop))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def close(self):
+        for sock in [self._udp, self._listener, self._wakeup_r, self._wakeup_w]:
+            if sock is not None:
+                sock.close()
+
+
+class NetClient(UWHProtoHandler):
+    resync_requests = True
+
+    def __init__(self, mgr, group, port, server=None, interface='0.0.0.0'):
+        """ `server` is the (host, tcp_port) to catch up from, if any """
+        UWHProtoHandler.__init__(self, mgr)
+        self._server = server
+        self._stream = None
+        # The catch-up socket while its connection is still being made
+        self._connecting = None
+        self._connect_deadline = None
+
+        self._mcast = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Several displays may share a machine
+        self._mcast.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._mcast.bind(('', port))
+        self._mcast.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                               socket.inet_aton(group) + socket.inet_aton(interface))
+        self._mcast.setblocking(False)
+
+        # Replies go out from a socket of our own, so that the server can
+        # tell displays on the same machine apart
+        self._reply = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._reply.bind((interface, 0))
+        self._reply.setblocking(False)
+
+    def send_raw(self, recipient, data):
+        if isinstance(recipient, _Stream):
+            recipient.write(data)
+            return
+        try:
+            self._reply.sendto(data, recipient)
+        except OSError:
+            return False
+
+    def request_Resync(self, recipient, since):
+        # The catch-up connection is the reliable way to ask, if there is one
+        if self._stream is not None:
+            recipient = self._stream
+        UWHProtoHandler.request_Resync(self, recipient, since)
+
+    def connected(self):
+        return self._stream is not None
+
+    def _connect(self, sel, timeout=1.0):
+        """ Start connecting for catch-up; the selector says when it is done,
+            so the multicast keeps being read meanwhile """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        err = sock.connect_ex(self._server)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            logging.info("Can't reach %s for catch-up", self._server)
+            sock.close()
+            return
+        self._connecting = sock
+        self._connect_deadline = time.monotonic() + timeout
+        sel.register(sock, selectors.EVENT_WRITE)
+
+    def _connected(self, sel):
+        sock = self._connecting
+        self._connecting = None
+        sel.unregister(sock)
+        err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            logging.info("Can't reach %s for catch-up: %s", self._server,
+                         os.strerror(err))
+            sock.close()
+            return
+        self._stream = _Stream(sock)
+        sel.register(sock, selectors.EVENT_READ, self._stream)
+
+    def _abandon_connect(self, sel):
+        sel.unregister(self._connecting)
+        self._connecting.close()
+        self._connecting = None
+
+    def _disconnect(self, sel):
+        sel.unregister(self._stream.sock)
+        self._stream.close()
+        self._stream = None
+
+    def listen_loop(self, stop=None, reconnect_interval=1.0):
+        sel = selectors.DefaultSelector()
+        sel.register(self._mcast, selectors.EVENT_READ)
+        sel.register(self._reply, selectors.EVENT_READ)
+        next_connect = time.monotonic()
+        try:
+            while stop is None or not stop.is_set():
+                if (self._server is not None and self._stream is None
+                        and self._connecting is None
+                        and time.monotonic() >= next_connect):
+                    self._connect(sel)
+                    next_connect = time.monotonic() + reconnect_interval
+                elif (self._connecting is not None and
+                      time.monotonic() >= self._connect_deadline):
+                    logging.info("Timed out reaching %s for catch-up", self._server)
+                    self._abandon_connect(sel)
+
+                for (key, _) in sel.select(0.25):
+                    if key.fileobj is self._connecting:
+                        self._connected(sel)
+                        continue
+                    if key.data is None:
+                        for (data, addr) in _recv_datagrams(key.fileobj):
+                            try:
+                                self.recv_raw(addr, data)
+                            except Exception:
+                                logging.exception("Problem handling datagram")
+                        continue
+                    try:
+                        self._stream.flush()
+                        for packet in self._stream.read():
+                            self.recv_raw(self._stream, packet)
+                    except BlockingIOError:
+                        pass
+                    except (ConnectionError, OSError):
+                        self._disconnect(sel)
+                    except Exception:
+                        logging.exception("Problem handling TCP packet")
+
+                if self._stream is not None:
+                    events = selectors.EVENT_READ
+                    if self._stream.wants_write():
+                        events |= selectors.EVENT_WRITE
+                    sel.modify(self._stream.sock, events, self._stream)
+        finally:
+            if self._connecting is not None:
+                self._abandon_connect(sel)
+            if self._stream is not None:
+                self._disconnect(sel)
+            sel.close()
+
+    def listen_thread(self, stop=None, reconnect_interval=1.0):
+        thread = threading.Thread(target=self.listen_loop,
+                                  args=(stop, reconnect_interval))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def close(self):
+        self._mcast.close()
+        self._reply.close()
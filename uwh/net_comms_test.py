@@ -0,0 +1,115 @@
+from .gamemanager import GameManager, TeamColor
+from .net_comms import (NetConfigParser, net_group, net_port, net_tcp_port,
+                        net_batch, NetServer, NetClient)
+from .testing import game, wait_for
+
+import socket
+import threading
+import time
+
+GROUP = '239.255.42.1'
+LOCAL = '127.0.0.1'
+
+
+def free_port(kind=socket.SOCK_DGRAM):
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.bind((LOCAL, 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def test_NetConfigParser_defaults():
+    cfg = NetConfigParser()
+
+    assert net_group(cfg) == '239.255.42.1'
+    assert net_port(cfg) == 4280
+    assert net_tcp_port(cfg) == 4281
+    assert net_batch(cfg)
+
+    cfg.set('net', 'tcp_port', '0')
+    assert net_tcp_port(cfg) is None
+
+
+def test_multicast():
+    port = free_port()
+    mgr = game()
+    server = NetServer(mgr, GROUP, port, interface=LOCAL)
+    clients = [NetClient(GameManager(), GROUP, port, interface=LOCAL)
+               for _ in range(3)]
+    stop = threading.Event()
+    threads = [c.listen_thread(stop) for c in clients]
+    threads.append(server.broadcast_thread(delta=True, interval=0.02,
+                                           batch=True, ping_interval=0.05,
+                                           stop=stop))
+
+    for c in clients:
+        assert wait_for(lambda: c._mgr.whiteScore() == 3)
+        assert wait_for(lambda: len(c._mgr.penalties(TeamColor.black)) == 1)
+    mgr.addBlackGoal(4)
+    for c in clients:
+        assert wait_for(lambda: c._mgr.blackScore() == 1)
+
+    # Each display answers Pings from its own address
+    assert wait_for(lambda: len(server.client_stats()) == 3)
+    for stats in server.client_stats().values():
+        assert stats['pongs'] >= 1
+        assert 0 <= stats['min'] <= stats['mean'] <= stats['max']
+
+    stop.set()
+    for t in threads:
+        t.join(2)
+        assert not t.is_alive()
+    server.close()
+    for c in clients:
+        c.close()
+
+
+def test_tcp_catchup():
+    port = free_port()
+    mgr = game()
+    server = NetServer(mgr, GROUP, port, tcp_port=0, interface=LOCAL)
+    stop = threading.Event()
+    # Nothing more goes out by multicast for a minute after the first cycle
+    server.broadcast_thread(interval=60, ping_interval=None, stop=stop)
+    time.sleep(0.1)
+
+    client = NetClient(GameManager(), GROUP, port,
+                       server=server.tcp_address(), interface=LOCAL)
+    client.listen_thread(stop)
+    assert wait_for(client.connected)
+    assert wait_for(lambda: client._mgr.whiteScore() == 3)
+    assert wait_for(lambda: len(client._mgr.penalties(TeamColor.black)) == 1)
+
+    stop.set()
+    time.sleep(0.6)
+    server.close()
+    client.close()
+
+
+def test_connect_without_blocking():
+    port = free_port()
+    mgr = game()
+    server = NetServer(mgr, GROUP, port, interface=LOCAL)
+    stop = threading.Event()
+    server.broadcast_thread(interval=0.02, ping_interval=None, stop=stop)
+
+    # A catch-up server whose backlog is full, so connecting to it hangs
+    stalled = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    stalled.bind((LOCAL, 0))
+    stalled.listen(0)
+    filler = socket.create_connection(stalled.getsockname())
+
+    client = NetClient(GameManager(), GROUP, port,
+                       server=stalled.getsockname(), interface=LOCAL)
+    client.listen_thread(stop)
+    # The multicast keeps being read meanwhile
+    assert wait_for(lambda: client._mgr.whiteScore() == 3, timeout=0.5)
+    assert not client.connected()
+
+    stop.set()
+    time.sleep(0.6)
+    filler.close()
+    stalled.close()
+    server.close()
+    client.close()
@@ -1,12 +1,14 @@
 from . import messages_pb2
-from .comms import UWHProtoHandler
+from .async_comms import Transport
+from .comms import UWHProtoHandler, DeltaTracker
+from .framing import framing_for_name, FrameReceiver
 
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 import json
 import logging
 import threading
 import time
-import binascii
 import serial
 from time import sleep
 
@@ -15,6 +17,11 @@ def RS485ConfigParser():
         'port': '/dev/tty.usbserial-',
         'baud': '11500',
         'clients': '[]',
+        'framing': 'hex',
+        # Only for displays that know batch frames; older ones stall on them
+        'batch': 'false',
+        # Only for displays that know GameSnapshot; older ones stall on it
+        'snapshot': 'false',
     }
     parser = ConfigParser(defaults=defaults)
     parser.add_section('rs485')
@@ -26,27 +33,98 @@ def port(cfg):
 def baud(cfg):
     return cfg.get('rs485', 'baud')
 
+def framing(cfg):
+    return cfg.get('rs485', 'framing')
+
+def batch(cfg):
+    return cfg.getboolean('rs485', 'batch')
+
+def snapshot(cfg):
+    return cfg.getboolean('rs485', 'snapshot')
+
+
+def open_serial(serial_port, baud, timeout):
+    """ `serial_port` is either a device name, or something that already
+        behaves like an open serial.Serial (see loopback_comms) """
+    if isinstance(serial_port, str):
+        return serial.Serial(serial_port, baud, timeout=timeout)
+    return serial_port
+
+
+class SerialTransport(Transport):
+    """ Plugs a serial port into AsyncEndpoint. Reads are driven by the
+        event loop watching the port's file descriptor; writes, which block
+        until the driver has room, go to a single thread of their own so
+        that they keep their order. """
+
+    def __init__(self, serial_port, baud=None, framing='hex'):
+        self.ser = open_serial(serial_port, baud, timeout=0)
+        self._framing = framing_for_name(framing)
+        self._receiver = FrameReceiver(self._framing)
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._loop = None
+
+    def open(self, loop, deliver):
+        self._loop = loop
+        self._deliver = deliver
+        loop.add_reader(self.ser.fileno(), self._readable)
+
+    def _readable(self):
+        try:
+            # Only what has arrived, so the event loop never waits on it
+            waiting = self.ser.in_waiting
+            if not waiting:
+                # Readable with nothing to read: the other end has gone
+                raise serial.SerialException("Port closed")
+            data = self.ser.read(waiting)
+        except serial.SerialException:
+            logging.exception("Problem reading from serial port")
+            self._loop.remove_reader(self.ser.fileno())
+            return
+        for packet in self._receiver.feed(data):
+            self._deliver('', packet)
+
+    async def send(self, recipient, packet):
+        await self._loop.run_in_executor(self._writer, self.ser.write,
+                                         self._framing.encode(packet))
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.remove_reader(self.ser.fileno())
+            self._loop = None
+        self._writer.shutdown(wait=False)
+
 
 class RS485Client(UWHProtoHandler):
-    def __init__(self, mgr, serial_port, baud):
+    def __init__(self, mgr, serial_port, baud, framing='hex'):
         UWHProtoHandler.__init__(self, mgr)
-        self.ser = serial.Serial(serial_port, baud, timeout=None)
+        self.ser = open_serial(serial_port, baud, timeout=None)
+        self._framing = framing_for_name(framing)
 
     def send_raw(self, recipient, data):
-        # TODO: chechsum? length?
-        self.ser.write(binascii.hexlify(data) + b'\n')
+        self.ser.write(self._framing.encode(data))
 
     def listen_loop(self):
-        recv = b''
+        receiver = FrameReceiver(self._framing)
         while True:
             try:
-                recv += self.ser.read()
-                if len(recv) > 0 and recv[-1] == b'\n'[0]:
-                    self.recv_raw('', binascii.unhexlify(recv[:-1]))
-                    recv = b''
-            except Exception:
-                recv = b''
+                # Block for the first byte, then take whatever else has
+                # already arrived in one go
+                data = self.ser.read(1)
+                waiting = self.ser.in_waiting
+                if waiting:
+                    data += self.ser.read(waiting)
+            except serial.SerialException:
+                logging.exception("Problem reading from serial port")
+                receiver.reset()
                 time.sleep(1)
+                continue
+
+            for packet in receiver.feed(data):
+                try:
+                    self.recv_raw('', packet)
+                except Exception:
+                    logging.exception("Problem handling rs485 packet")
 
     def listen_thread(self):
         thread = threading.Thread(target=self.listen_loop)
@@ -55,38 +133,44 @@ class RS485Client(UWHProtoHandler):
 
 
 class RS485Server(UWHProtoHandler):
-    def __init__(self, mgr, serial_port, baud):
+    def __init__(self, mgr, serial_port, baud, framing='hex'):
         UWHProtoHandler.__init__(self, mgr)
-        self.ser = serial.Serial(serial_port, baud, timeout=0)
+        self.ser = open_serial(serial_port, baud, timeout=0)
+        self._framing = framing_for_name(framing)
 
     def send_raw(self, recipient, data):
-        self.ser.write(binascii.hexlify(data) + b'\n')
-
-    def broadcast_loop(self):
-        while True:
+        self.ser.write(self._framing.encode(data))
+
+    def broadcast_loop(self, delta=False, interval=0.1, resync_interval=5,
+                       event_driven=False, batch=False,
+                       snapshot=False, drift_threshold=None, stop=None):
+        """ Broadcast until the `stop` event, if any, is set. That is only
+            checked between cycles. """
+        # Everybody on the bus hears the same thing, so one tracker will do
+        trackers = { '' : DeltaTracker(resync_interval, drift_threshold) }
+        listener = self._mgr.listen() if event_driven else None
+        while stop is None or not stop.is_set():
             try:
-                while True:
-                    (gkf_kind, gkf_msg) = self.get_GameKeyFrame()
-                    (pen_kind, pen_msgs) = self.get_Penalties()
-                    (gol_kind, gol_msgs) = self.get_Goals()
+                while stop is None or not stop.is_set():
+                    self.send_Cycle([''], trackers, delta, batch, snapshot)
 
-                    self.send_message('', gkf_kind, gkf_msg)
-
-                    for msg in pen_msgs:
-                        self.send_message('', pen_kind, msg)
-
-                    for msg in gol_msgs:
-                        self.send_message('', gol_kind, msg)
-
-                    time.sleep(0.1)
+                    self.wait_for_changes(listener, interval, resync_interval)
 
             except Exception as e:
                 import traceback
                 print(e)
                 traceback.print_tb(e.__traceback__)
                 time.sleep(1)
-
-    def broadcast_thread(self):
-        thread = threading.Thread(target=self.broadcast_loop)
+        if listener is not None:
+            listener.close()
+
+    def broadcast_thread(self, delta=False, interval=0.1, resync_interval=5,
+                         event_driven=False, batch=False,
+                         snapshot=False, drift_threshold=None, stop=None):
+        thread = threading.Thread(target=self.broadcast_loop,
+                                  args=(delta, interval, resync_interval,
+                                        event_driven, batch,
+                                        snapshot, drift_threshold, stop))
         thread.daemon = True
         thread.start()
+        return thread
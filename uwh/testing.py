@@ -0,0 +1,37 @@
+""" Helpers shared by the transport tests """
+
+from .gamemanager import GameManager, TeamColor, Penalty
+
+import asyncio
+import time
+
+
+def game():
+    """ A game with a little of everything to send """
+    mgr = GameManager()
+    mgr.setTid(1)
+    mgr.setGid(2)
+    mgr.setWhiteScore(3)
+    mgr.addPenalty(Penalty(7, TeamColor.black, 60))
+    return mgr
+
+
+def wait_for(cond, timeout=3):
+    """ Whether `cond()` came true within `timeout` seconds """
+    deadline = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+async def wait_for_async(cond, timeout=3):
+    """ wait_for, without blocking the running loop """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not cond():
+        if loop.time() > deadline:
+            return False
+        await asyncio.sleep(0.005)
+    return True
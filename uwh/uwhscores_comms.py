@@ -1,121 +1,734 @@
-import requests
+import aiohttp
+import asyncio
+import atexit
+import base64
+from collections import OrderedDict, namedtuple
+import hashlib
+import io
+import json
+import logging
+import os
 import threading
-from functools import lru_cache
+import time
+import weakref
+
+from .uwhscores_mock import MockBackend
+
+
+_FlagEntry = namedtuple('_FlagEntry', 'data etag last_modified checked')
+
+class FlagCache(object):
+    """ Team flag images, shared by every UWHScores in the process. Kept in
+        an LRU bounded by total bytes, optionally backed by `cache_dir` on
+        disk. Entries older than `max_age` seconds, and anything read back
+        from disk, need revalidating with ETag/Last-Modified before use. """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024, cache_dir=None, max_age=3600):
+        self._max_bytes = max_bytes
+        self._cache_dir = None
+        self.set_cache_dir(cache_dir)
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def set_cache_dir(self, cache_dir):
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self._cache_dir = cache_dir
+
+    def _path(self, url):
+        return os.path.join(self._cache_dir,
+                            hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def _load(self, url):
+        if not self._cache_dir:
+            return None
+        path = self._path(url)
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url:
+            return None
+        # Needs revalidating before it's trusted
+        return _FlagEntry(data, meta.get('etag'), meta.get('last_modified'), None)
+
+    def _save(self, url, entry):
+        if not self._cache_dir:
+            return
+        path = self._path(url)
+        meta = { 'url' : url, 'etag' : entry.etag,
+                 'last_modified' : entry.last_modified }
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(entry.data)
+            os.replace(path + '.tmp', path)
+            with open(path + '.json.tmp', 'w') as f:
+                json.dump(meta, f)
+            os.replace(path + '.json.tmp', path + '.json')
+        except OSError:
+            pass
+
+    def _remember(self, url, entry):
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._size -= len(old.data)
+            if len(entry.data) > self._max_bytes:
+                return
+            self._entries[url] = entry
+            self._size += len(entry.data)
+            while self._size > self._max_bytes:
+                (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted.data)
+
+    def lookup(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                return entry
+        entry = self._load(url)
+        if entry is not None:
+            self._remember(url, entry)
+        return entry
+
+    def fresh(self, entry):
+        return (entry.checked is not None and
+                time.monotonic() - entry.checked < self._max_age)
+
+    def store(self, url, data, etag, last_modified):
+        entry = _FlagEntry(data, etag, last_modified, time.monotonic())
+        self._remember(url, entry)
+        self._save(url, entry)
+
+    def revalidated(self, url, entry):
+        self._remember(url, entry._replace(checked=time.monotonic()))
+
+_flag_cache = FlagCache()
+
+def flag_cache():
+    """ The FlagCache shared by default between UWHScores instances """
+    return _flag_cache
+
+
+class ResponseCache(object):
+    """ Parsed replies of the read-only endpoints, keyed by url. Fresh for
+        `ttl` seconds, then served stale while being refreshed for up to
+        `stale_ttl` more. """
+
+    def __init__(self, ttl=30, stale_ttl=300):
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def lookup(self, url):
+        """ Returns (json, fresh), with json None on a miss """
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None:
+            return (None, False)
+        age = time.monotonic() - entry[1]
+        if age >= self._ttl + self._stale_ttl:
+            return (None, False)
+        return (entry[0], age < self._ttl)
+
+    def store(self, url, json):
+        with self._lock:
+            self._entries[url] = (json, time.monotonic())
+
+    def preload(self, url, json):
+        """ Remember `json` as already stale, so it gets served but also
+            refreshed """
+        with self._lock:
+            self._entries[url] = (json, time.monotonic() - self._ttl)
+
+    def invalidate(self, prefix=None):
+        """ Forget `prefix` and every url below it, or everything """
+        with self._lock:
+            if prefix is None:
+                self._entries = {}
+                return
+            for url in [u for u in self._entries
+                        if u == prefix or u.startswith(prefix + '/')]:
+                del self._entries[url]
 
-class UWHScores(object):
-    def __init__(self, base_address='https://uwhscores.com/api/v1/', mock=False):
+
+class ScoreRejected(aiohttp.ClientResponseError):
+    """ uwhscores turned a score down for good, rather than failing to take
+        it right now """
+
+
+def _basic_auth(username, password):
+    credentials = (username + ':' + password).encode('utf-8')
+    return 'Basic ' + base64.b64encode(credentials).decode('ascii')
+
+
+async def gather_limited(aws, limit, return_exceptions=False):
+    """ Like asyncio.gather, but with at most `limit` of `aws` running at
+        once """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def limited(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*[limited(aw) for aw in aws],
+                                return_exceptions=return_exceptions)
+
+
+class TournamentSnapshot(object):
+    """ One tournament's games, teams, rosters and flags, indexed so that
+        lookups don't need to go back to the server """
+
+    def __init__(self, tournament, games, teams, flags):
+        self._tournament = tournament
+        self._games = OrderedDict((game['gid'], game) for game in games)
+        self._by_pool = {}
+        self._by_start_time = {}
+        for game in games:
+            self._by_pool.setdefault(game.get('pool'), []).append(game)
+            self._by_start_time.setdefault(game.get('start_time'), []).append(game)
+        self._teams = OrderedDict((team['team_id'], team) for team in teams)
+        self._flags = flags
+
+    def tournament(self):
+        return self._tournament
+
+    def games(self):
+        return list(self._games.values())
+
+    def game(self, gid):
+        return self._games.get(gid)
+
+    def pools(self):
+        return list(self._by_pool.keys())
+
+    def games_in_pool(self, pool):
+        return self._by_pool.get(pool, [])
+
+    def start_times(self):
+        return sorted(t for t in self._by_start_time if t is not None)
+
+    def games_at(self, start_time):
+        return self._by_start_time.get(start_time, [])
+
+    def teams(self):
+        return list(self._teams.values())
+
+    def team(self, team_id):
+        return self._teams.get(team_id)
+
+    def roster(self, team_id):
+        team = self._teams.get(team_id)
+        return None if team is None else team.get('roster')
+
+    def flag(self, team_id):
+        """ The team's flag image as bytes, or None """
+        return self._flags.get(team_id)
+
+
+class AsyncUWHScores(object):
+    """ Coroutine interface to uwhscores.com. An instance belongs to the
+        event loop it is first used on.
+
+        `mock` may be True for the built in fixtures, or a MockBackend. It
+        takes the place of the server, behind the same caching.
+
+        With an OfflineStore as `store`, everything fetched is also written
+        there: it is served right away on the next start, and whenever the
+        server can't be reached. Scores are then queued in the store's outbox
+        and retried with exponential backoff, from `retry_base` up to
+        `retry_max` seconds apart, until they get through. """
+
+    def __init__(self, base_address='https://uwhscores.com/api/v1/', mock=False,
+                 max_concurrency=4, token_ttl=600, flag_cache=None,
+                 cache_ttl=30, stale_ttl=300, timeout=5, store=None,
+                 retry_base=1, retry_max=300):
         self._base_address = base_address
-        self._mock = mock
-        self._fail_handler = lambda x : print(x)
+        self._mock = MockBackend() if mock is True else (mock or None)
+        self._max_concurrency = max_concurrency
+        self._timeout = timeout
+        self._flag_cache = flag_cache or _flag_cache
+        self._cache = ResponseCache(cache_ttl, stale_ttl)
+        self._in_flight = {}
+        self._snapshots = {}
+        self._session = None
+
+        self._username = None
+        self._password = None
+        self._token = None
+        self._token_expiry = 0
+        # Tokens are refreshed a little early, so they don't expire in transit
+        self._token_ttl = max(token_ttl - 30, 0)
+        self._token_lock = None
+
+        self._store = store
+        self._retry_base = retry_base
+        self._retry_max = retry_max
+        self._drain_lock = None
+        self._drain_handle = None
+        if store is not None:
+            for (url, body, _) in store.responses():
+                self._cache.preload(url, body)
+
+    def _get_session(self):
+        if self._session is None:
+            # One keep-alive connection pool, and at most `max_concurrency`
+            # requests in flight no matter how many get queued up
+            connector = aiohttp.TCPConnector(limit=self._max_concurrency)
+            timeout = aiohttp.ClientTimeout(total=self._timeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=timeout)
+        return self._session
+
+    async def close(self):
+        if self._drain_handle is not None:
+            self._drain_handle.cancel()
+            self._drain_handle = None
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _url(self, *parts):
+        return self._base_address + '/'.join(str(p) for p in parts)
 
     def login(self, username, password):
         self._username = username
         self._password = password
+        self._token = None
+
+    async def _get_token(self):
+        """ Concurrent callers wait for a single login rather than each doing
+            their own """
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._token is not None and time.monotonic() < self._token_expiry:
+                return self._token
+
+            auth = _basic_auth(self._username, self._password)
+            async with self._get_session().get(self._url('login'),
+                                               headers={ 'Authorization' : auth }) as reply:
+                reply.raise_for_status()
+                self._token = (await reply.json(content_type=None))['token']
+            self._token_expiry = time.monotonic() + self._token_ttl
+            return self._token
+
+    def _expire_token(self, token):
+        # Somebody else may already have replaced it
+        if self._token == token:
+            self._token = None
+
+    async def get_tournament_list(self):
+        return (await self._get_json(self._url('tournaments')))['tournaments']
+
+    async def get_tournament(self, tid):
+        return (await self._get_json(self._url('tournaments', tid)))['tournament']
+
+    async def get_game_list(self, tid):
+        return (await self._get_json(self._url('tournaments', tid, 'games')))['games']
+
+    async def get_game(self, tid, gid):
+        return (await self._get_json(self._url('tournaments', tid, 'games', gid)))['game']
+
+    async def get_team_list(self, tid):
+        return (await self._get_json(self._url('tournaments', tid, 'teams')))['teams']
+
+    async def get_team(self, tid, team_id):
+        return (await self._get_json(self._url('tournaments', tid, 'teams', team_id)))['team']
+
+    async def get_roster(self, tid, team_id):
+        return (await self.get_team(tid, team_id))['roster']
+
+    async def get_team_flag(self, tid, team_id):
+        """ The team's flag image as bytes, or None if it doesn't have one """
+        flag_url = (await self.get_team(tid, team_id))['flag_url']
+        if not flag_url:
+            return None
+        return await self._get_flag(flag_url)
+
+    async def get_teams_with_rosters(self, tid, limit=None):
+        """ Every team in the tournament, rosters included, fetched
+            concurrently """
+        teams = await self.get_team_list(tid)
+        return await gather_limited([self.get_team(tid, team['team_id'])
+                                     for team in teams],
+                                    limit or self._max_concurrency)
+
+    async def prefetch_tournament(self, tid, limit=None, flags=True):
+        """ Fetch everything about a tournament at once, with at most
+            `limit` requests in flight, and return it as a TournamentSnapshot.
+            The latest one is also kept around, see snapshot(). """
+        limit = limit or self._max_concurrency
+        (tournament, games, teams) = await asyncio.gather(
+            self.get_tournament(tid),
+            self.get_game_list(tid),
+            self.get_teams_with_rosters(tid, limit))
+
+        images = {}
+        if flags:
+            with_flags = [team for team in teams if team.get('flag_url')]
+            fetched = await gather_limited([self._get_flag(team['flag_url'])
+                                            for team in with_flags],
+                                           limit, return_exceptions=True)
+            for (team, image) in zip(with_flags, fetched):
+                # A missing flag shouldn't spoil the whole schedule
+                if not isinstance(image, Exception):
+                    images[team['team_id']] = image
+
+        snapshot = TournamentSnapshot(tournament, games, teams, images)
+        self._snapshots[tid] = snapshot
+        return snapshot
+
+    def snapshot(self, tid):
+        """ The TournamentSnapshot from the last prefetch of `tid`, if any """
+        return self._snapshots.get(tid)
+
+    async def post_score(self, tid, gid, score_b, score_w, black_id, white_id):
+        score = {
+            "game_score": {
+                'tid': tid,
+                'gid': gid,
+                'score_w': score_w,
+                'score_b': score_b,
+                'black_id': black_id,
+                'white_id': white_id
+            }
+        }
+        url = self._url('tournaments', tid, 'games', gid)
 
-    def get_tournament_list(self, callback):
-        def success(reply):
-            json = reply.json()
-            return callback(json['tournaments'])
+        if self._mock is not None:
+            await self._mock.post(url, score)
+            self._cache.invalidate(self._url('tournaments', tid, 'games'))
+            return
 
-        self._async_request('get', self._base_address + 'tournaments',
-                            callback=success)
+        if self._store is None:
+            await self._deliver_score(url, score)
+        else:
+            self._store.enqueue(url, score)
+            await self.drain_outbox()
+
+    async def _deliver_score(self, url, score):
+        token = await self._get_token()
+        try:
+            if not await self._post_json(url, score, token, retry_unauthorized=True):
+                # Expired early, or revoked: log in again, once
+                self._expire_token(token)
+                token = await self._get_token()
+                await self._post_json(url, score, token, retry_unauthorized=False)
+        except aiohttp.ClientResponseError as e:
+            if e.status in (401, 403):
+                # Not the score's fault; the next go starts with a fresh login
+                self._expire_token(token)
+            raise
+        # The game list shows scores too
+        self._cache.invalidate(url.rsplit('/', 1)[0])
+
+    async def _post_json(self, url, json, token, retry_unauthorized):
+        auth = _basic_auth(token, '')
+        async with self._get_session().post(url, json=json,
+                                            headers={ 'Authorization' : auth }) as reply:
+            if reply.status == 401 and retry_unauthorized:
+                return False
+            if (400 <= reply.status < 500 and
+                reply.status not in (401, 403, 408, 429)):
+                raise ScoreRejected(reply.request_info, reply.history,
+                                    status=reply.status, message=reply.reason,
+                                    headers=reply.headers)
+            reply.raise_for_status()
+            return True
+
+    async def drain_outbox(self):
+        """ Try to deliver the queued scores that are due, and schedule
+            another go for whatever is left. Returns True once the outbox is
+            empty. """
+        if self._store is None:
+            return True
+        if self._username is None:
+            # Can't post anything without logging in; login() will be back
+            return self._store.next_attempt() is None
+
+        if self._drain_lock is None:
+            self._drain_lock = asyncio.Lock()
+        async with self._drain_lock:
+            retry_at = None
+            for (entry_id, url, score, attempts) in self._store.due(time.time()):
+                try:
+                    await self._deliver_score(url, score)
+                except ScoreRejected as e:
+                    # Trying again won't help
+                    logging.warning("uwhscores rejected score for %s: %s", url, e)
+                    self._store.remove(entry_id)
+                    continue
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    # Including failing to log in, which the next go retries
+                    retry_at = time.time() + min(self._retry_base * 2 ** attempts,
+                                                 self._retry_max)
+                    self._store.retry_later(entry_id, retry_at)
+                    # Most likely offline, so leave the rest for later too
+                    break
+                self._store.remove(entry_id)
+
+            self._schedule_drain(retry_at)
+            return self._store.next_attempt() is None
+
+    def _schedule_drain(self, retry_at):
+        if self._drain_handle is not None:
+            self._drain_handle.cancel()
+            self._drain_handle = None
+
+        next_attempt = self._store.next_attempt()
+        if next_attempt is None:
+            return
+        if retry_at is not None:
+            next_attempt = max(next_attempt, retry_at)
+        self._drain_handle = asyncio.get_event_loop().call_later(
+            max(next_attempt - time.time(), 0),
+            lambda: asyncio.ensure_future(self.drain_outbox()))
+
+    def invalidate_cache(self, tid=None):
+        """ Forget cached replies, for one tournament or all of them """
+        if tid is None:
+            self._cache.invalidate()
+        else:
+            self._cache.invalidate(self._url('tournaments', tid))
+
+    def _shared(self, key, download):
+        """ The task running `download()`, shared by everybody waiting on the
+            same `key` """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(download())
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return task
+
+    def _finished(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Background refreshes may fail without anybody listening
+            task.exception()
+
+    async def _get_json(self, url):
+        (json, fresh) = self._cache.lookup(url)
+        if json is not None:
+            if not fresh:
+                self._shared(url, lambda: self._download_json(url))
+            return json
+
+        try:
+            # Shielded, so a cancelled caller doesn't cancel it for the others
+            return await asyncio.shield(self._shared(url, lambda: self._download_json(url)))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            json = None if self._store is None else self._store.load_response(url)
+            if json is None:
+                raise
+            return json
+
+    async def _download_json(self, url):
+        if self._mock is not None:
+            json = await self._mock.get(url)
+        else:
+            async with self._get_session().get(url) as reply:
+                reply.raise_for_status()
+                json = await reply.json(content_type=None)
+        self._cache.store(url, json)
+        if self._store is not None:
+            self._store.save_response(url, json, time.time())
+        return json
+
+    async def _get_flag(self, url):
+        entry = self._flag_cache.lookup(url)
+        if entry is not None and self._flag_cache.fresh(entry):
+            return entry.data
+        return await asyncio.shield(self._shared(('flag', url),
+                                                 lambda: self._download_flag(url, entry)))
+
+    async def _download_flag(self, url, entry):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        try:
+            async with self._get_session().get(url, headers=headers) as reply:
+                if reply.status == 304 and entry is not None:
+                    self._flag_cache.revalidated(url, entry)
+                    return entry.data
+                reply.raise_for_status()
+                data = await reply.read()
+                self._flag_cache.store(url, data, reply.headers.get('ETag'),
+                                       reply.headers.get('Last-Modified'))
+                return data
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if entry is None:
+                raise
+            # Offline: a stale flag beats no flag
+            return entry.data
+
+
+class _LoopThread(object):
+    """ An event loop running on a daemon thread, so that synchronous code
+        can hand it coroutines """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coro):
+        """ Returns a concurrent.futures.Future for the result of `coro` """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+
+_loop_thread = None
+_loop_thread_lock = threading.Lock()
+# UWHScores instances with a session that may still be open
+_open_clients = weakref.WeakSet()
+
+def _shared_loop():
+    """ The _LoopThread every UWHScores runs on, started on first use """
+    global _loop_thread
+    with _loop_thread_lock:
+        if _loop_thread is None:
+            _loop_thread = _LoopThread()
+            atexit.register(_close_open_clients)
+        return _loop_thread
+
+def _close_open_clients():
+    for uwhscores in list(_open_clients):
+        try:
+            uwhscores.close()
+        except Exception:
+            logging.exception("Problem closing UWHScores")
+
+
+class UWHScores(object):
+    """ Callback interface to uwhscores.com, wrapping an AsyncUWHScores that
+        runs on a thread shared by every instance. Callbacks are called on
+        that thread, so they should be quick. Takes the same arguments as
+        AsyncUWHScores.
+
+        close() releases the connections; an instance that is dropped or
+        still open at exit is closed anyway. """
+
+    def __init__(self, base_address='https://uwhscores.com/api/v1/', mock=False,
+                 **kwargs):
+        self._async = AsyncUWHScores(base_address, mock=mock, **kwargs)
+        self._fail_handler = lambda x : print(x)
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def __del__(self):
+        # Without waiting: this may be running on the loop thread
+        loop = getattr(self, '_loop', None)
+        if loop is not None:
+            loop.submit(self._async.close())
+
+    def _submit(self, coro):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = _shared_loop()
+                _open_clients.add(self)
+            return self._loop.submit(coro)
+
+    def _call(self, coro, callback, callback_fail=None):
+        # `done` holds on to self, so that an instance nobody kept isn't
+        # closed under a request still waiting for its reply
+        def fail(e):
+            (callback_fail or self._fail_handler)(e)
+
+        def done(future):
+            if future.cancelled():
+                # Closed while waiting; there is nobody to tell
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                fail(e)
+                return
+            try:
+                callback(result)
+            except Exception as e:
+                fail(e)
+
+        future = self._submit(coro)
+        future.add_done_callback(done)
+        return future
+
+    def close(self):
+        with self._loop_lock:
+            if self._loop is None:
+                return
+            self._loop.submit(self._async.close()).result(timeout=5)
+            self._loop = None
+            _open_clients.discard(self)
+
+    def login(self, username, password):
+        self._async.login(username, password)
+        # Scores queued while logged out can go now
+        self._submit(self._async.drain_outbox())
+
+    def get_tournament_list(self, callback):
+        self._call(self._async.get_tournament_list(), callback)
 
     def get_tournament(self, tid, callback):
         if tid is None:
             return
 
-        def success(reply):
-            json = reply.json()
-            return callback(json['tournament'])
-
-        self._async_request('get', self._base_address + 'tournaments/' + str(tid),
-                            callback=success)
+        self._call(self._async.get_tournament(tid), callback)
 
     def get_game_list(self, tid, callback):
         if tid is None:
             return
 
-        def success(reply):
-            json = reply.json()
-            return callback(json['games'])
-
-        self._async_request('get', self._base_address + 'tournaments/' + str(tid) + '/games',
-                            callback=success)
+        self._call(self._async.get_game_list(tid), callback)
 
     def get_game(self, tid, gid, callback):
         if tid is None or gid is None:
             return
 
-        def success(reply):
-            json = reply.json()
-            return callback(json['game'])
-
-        self._async_request('get', self._base_address + 'tournaments/' + str(tid) + '/games/' + str(gid),
-                            callback=success)
+        self._call(self._async.get_game(tid, gid), callback)
 
     def get_team_list(self, tid, callback):
         if tid is None:
             return
 
-        def success(reply):
-            json = reply.json()
-            return callback(json['teams'])
-
-        self._async_request('get', self._base_address + 'tournaments/' + str(tid) + '/teams',
-                            callback=success)
+        self._call(self._async.get_team_list(tid), callback)
 
     def get_team(self, tid, team_id, callback):
         if tid is None or team_id is None:
             return
 
-        def success(reply):
-            json = reply.json()
-            return callback(json['team'])
-
-        self._async_request('get', self._base_address + 'tournaments/' + str(tid) + '/teams/' + str(team_id),
-                            callback=success)
+        self._call(self._async.get_team(tid, team_id), callback)
 
     def post_score(self, tid, gid, score_b, score_w, black_id, white_id):
-        def login_success(response):
-            token = response.json()['token']
-
-            score = {
-                "game_score": {
-                    'tid': tid,
-                    'gid': gid,
-                    'score_w': score_w,
-                    'score_b': score_b,
-                    'black_id': black_id,
-                    'white_id': white_id
-                }
-            }
-
-            self._async_request('post', self._base_address + 'tournaments/' + str(tid) + '/games/' + str(gid),
-                                json=score, callback=lambda _:None, auth=(token, ''))
-
-        self._async_request('get', self._base_address + 'login',
-                            auth=(self._username, self._password),
-                            callback=login_success)
-
+        return self._call(self._async.post_score(tid, gid, score_b, score_w,
+                                                 black_id, white_id),
+                          lambda _:None)
 
     def get_team_flag(self, tid, team_id, callback):
         if tid is None or team_id is None:
             return
 
-        def success(team):
-            flag_url = team['flag_url']
-
-            if not flag_url:
-                callback(None)
-                return
-
-            @lru_cache(maxsize=16)
-            def fetch_flag(url):
-                callback(requests.get(url, stream=True).raw)
-
-            fetch_flag(flag_url)
+        def success(data):
+            callback(None if data is None else io.BytesIO(data))
 
-        self.get_team(tid, team_id, success)
+        self._call(self._async.get_team_flag(tid, team_id), success)
 
     #def get_standings(self, tid, callback):
     #    def success(reply):
@@ -129,308 +742,22 @@ class UWHScores(object):
         if tid is None or team_id is None:
             return
 
-        def success(reply):
-            json = reply.json()
-            callback(json['team']['roster'])
-
-        self._async_request('get', self._base_address + 'tournaments/' + str(tid) + '/teams/' + str(team_id),
-                            callback=success)
-
-    def _mock_data(self):
-        return { 'api' : { 'v1' : {
-            'tournaments' : {
-                0 : { 'tid' : 0 },
-                1 : { 'tid' : 1 },
-                2 : { 'tid' : 2 },
-                3 : { 'tid' : 3 },
-                4 : { 'tid' : 4 },
-                5 : { 'tid' : 5 },
-                6 : { 'tid' : 6 },
-                7 : { 'tid' : 7 },
-                8 : { 'tid' : 8 },
-                9 : { 'tid' : 9 },
-                10 : { 'tid' : 10 },
-                11 : { 'tid' : 11 },
-                12 : {
-                    'mock_name' : 'tournament',
-                    'tid' : 12,
-                    'standings' : {
-                        0 : {
-                            'team' : 'Team Sexy',
-                            'team_id' : 2,
-                            'stats' : {
-                                'points' : 27
-                            },
-                        },
-                        2 : {
-                            'team' : 'UF',
-                        },
-                        4 : {
-                            'team' : 'Hampton'
-                        },
-                        6 : {
-                            'team' : 'Swordfish'
-                        },
-                        7 : {
-                            'team' : 'George Mason'
-                        }
-                    }
-                },
-                13 : { 'tid' : 13 },
-                14 : {
-                    'mock_name' : 'tournament',
-                    'tid' : 14,
-                    'name' : 'Battle@Altitude 2018',
-                    'location' : 'Denver, CO',
-                    'is_active' : False,
-                    'games' : {
-                        1 : {
-                            'black' : 'LA',
-                            'black_id' : 1,
-                            'pool' : '1',
-                        },
-                        4 : {
-                            'white' : 'Seattle',
-                            'white_id' : 6,
-                            'start_time' : '2018-01-27T09:02:00',
-                        },
-                        6 : {
-                            'black' : 'U19 Girls',
-                            'black_id' : 14,
-                            'day' : 'Sat',
-                            'start_time' : '2018-01-27T09:34:00',
-                            'white' : 'US Elite Women',
-                            'white_id' : 17,
-                        }
-                    },
-                    'teams' : {
-                        1 : { 'name' : 'LA' },
-                        3 : { 'name' : 'Rainbow Raptors' },
-                        7 : { 'name' : 'Cupcake Crocodiles' },
-                        11 : { 'name' : 'Chicago' },
-                        13 : { 'name' : 'Colorado B' },
-                        17 : { 'name' : 'US Elite Women' },
-                    }
-                },
-                15 : {
-                    'mock_name' : 'tournament',
-                    'tid' : 15,
-                    'name' : '2018 Worlds Mockup',
-                    'location' : 'Quebec City, Canada',
-                    'is_active' : True,
-                    'games' : {
-                        1 : {
-                            'mock_name' : 'game',
-                            'black' : 'Argentina',
-                            'black_id' : 1,
-                            'pool' : 1,
-                            'white' : 'Australia',
-                            'white_id' : 2,
-                            'start_time' : '2018-07-18T07:40:00'
-                        },
-                        2 : {
-                            'mock_name' : 'game',
-                            'black' : 'USA',
-                            'black_id' : 3,
-                            'pool' : 2,
-                            'white' : 'Columbia',
-                            'white_id' : 4,
-                            'start_time' : '2018-07-18T07:40:00'
-                        }
-                    },
-                    'teams' : {
-                        1 : {
-                            'mock_name' : 'team',
-                            'name' : 'Argentina Masters Men',
-                            'team_id' : 1,
-                            'roster' : {
-                                1 : {
-                                    'player_id' : 1,
-                                    'name' : 'Schmoe, Joe',
-                                },
-                                2 : {
-                                    'player_id' : 2,
-                                    'name' : 'Doe, John'
-                                },
-                                3 : {
-                                    'player_id' : 3,
-                                    'name' : 'Bobby, Ricky'
-                                },
-                                4 : {
-                                    'player_id' : 4,
-                                    'name' : 'Georgeson, George'
-                                },
-                                5 : {
-                                    'player_id' : 5,
-                                    'name' : 'Steveson, Steve'
-                                },
-                                6 : {
-                                    'player_id' : 6,
-                                    'name' : 'Justinson, Justin'
-                                },
-                                7 : {
-                                    'player_id' : 7,
-                                    'name' : 'Pauly, Paul'
-                                },
-                                8 : {
-                                    'player_id' : 8,
-                                    'name' : 'Everett, Earnest'
-                                },
-                                9 : {
-                                    'player_id' : 9,
-                                    'name' : 'Clumboldt, Cletus'
-                                },
-                                10 : {
-                                    'player_id' : 10,
-                                    'name' : 'Miller, Milhouse'
-                                },
-                                11 : {
-                                    'player_id' : 11,
-                                    'name' : 'Thompson, Tucker'
-                                },
-                                12 : {
-                                    'player_id' : 12,
-                                    'name' : 'Richardson, Rich'
-                                }
-                            }
-                        },
-                        2 : {
-                            'mock_name' : 'team',
-                            'name' : 'Australia Masters Men',
-                            'team_id' : 2,
-                            'roster' : {
-                                1 : {
-                                    'player_id' : 1,
-                                    'name' : 'Speedwagon, Mario',
-                                },
-                                2 : {
-                                    'player_id' : 2,
-                                    'name' : 'Romer, Robby'
-                                },
-                                3 : {
-                                    'player_id' : 3,
-                                    'name' : 'Riker, Randolph'
-                                },
-                                4 : {
-                                    'player_id' : 4,
-                                    'name' : 'Tomlin, Teddy'
-                                },
-                                5 : {
-                                    'player_id' : 5,
-                                    'name' : 'Wolf, Warren'
-                                },
-                                6 : {
-                                    'player_id' : 6,
-                                    'name' : 'Pollard, Phillip'
-                                },
-                                7 : {
-                                    'player_id' : 7,
-                                    'name' : 'Bavaro, Buster'
-                                },
-                                8 : {
-                                    'player_id' : 8,
-                                    'name' : 'James, Joshua'
-                                },
-                                9 : {
-                                    'player_id' : 9,
-                                    'name' : 'Shin, Stewart'
-                                },
-                                10 : {
-                                    'player_id' : 10,
-                                    'name' : 'Hume, Huey'
-                                },
-                                11 : {
-                                    'player_id' : 11,
-                                    'name' : 'Vos, Valentine'
-                                },
-                                12 : {
-                                    'player_id' : 12,
-                                    'name' : 'Newburn, Noel'
-                                }
-                            }
-                        },
-                        3 : { 'name' : 'USA Masters Men', 'team_id' : 3 },
-                        4 : { 'name' : 'Columbia Masters Men', 'team_id' : 4 },
-                    }
-                }
-            }
-        }}}
-
-    def _mock_api(self, endpoint, cb_success, cb_fail):
-        import urllib.parse
-        import posixpath
-
-        def path_parse(path_string):
-            result = []
-            tmp = posixpath.normpath(path_string)
-            while tmp != "/":
-                (tmp, item) = posixpath.split(tmp)
-                result.insert(0, item)
-            return result
-
-        url_parsed = urllib.parse.urlparse( endpoint )
-        path_parsed = path_parse(urllib.parse.unquote(url_parsed.path))
+        self._call(self._async.get_roster(tid, team_id), callback)
 
-        try:
-            mock = self._mock_data()
-
-            for idx, item in enumerate(path_parsed):
-                try:
-                    item = int(item)
-                except ValueError:
-                    pass
-                mock = mock[item]
+    def prefetch_tournament(self, tid, callback, limit=None, flags=True):
+        """ Calls back with a TournamentSnapshot, see
+            AsyncUWHScores.prefetch_tournament """
+        if tid is None:
+            return
 
-            class Wrap(object):
-                def __init__(self, wrap):
-                    self._wrap = wrap
+        self._call(self._async.prefetch_tournament(tid, limit, flags), callback)
 
-                def json(self):
-                    return { self._wrap['mock_name'] : self._wrap }
+    def snapshot(self, tid):
+        return self._async.snapshot(tid)
 
-            cb_success(Wrap(mock))
-        except KeyError as e:
-            print('mock lookup fail for: ' + endpoint)
-            cb_fail(e)
+    def invalidate_cache(self, tid=None):
+        """ Forget cached replies, for one tournament or all of them """
+        self._async.invalidate_cache(tid)
 
     def set_fail_handler(self, callback):
         self._fail_handler = callback
-
-    def _async_request(self, method, *args, callback,
-                       callback_fail=None,
-                       timeout=5, **kwargs):
-        method = {
-            'get' : requests.get,
-            'post' : requests.post,
-            'put' : requests.put,
-            'patch' : requests.patch,
-            'delete' : requests.delete,
-            'options' : requests.options,
-            'head' : requests.head
-        }[method.lower()]
-
-        callback_fail = callback_fail or self._fail_handler
-
-        def wrap_method(*args, **kwargs):
-            try:
-                method(*args, **kwargs)
-            except requests.exceptions.ConnectionError as e:
-                callback_fail(e)
-            except Exception as e:
-                callback_fail(e)
-
-        parent_args = args
-        if callback:
-            def callback_with_args(response, *args, **kwargs):
-                try:
-                    callback(response)
-                except Exception as e:
-                    callback_fail((parent_args[0], e))
-            kwargs['hooks'] = {'response': callback_with_args}
-        kwargs['timeout'] = timeout
-
-        if self._mock:
-            self._mock_api(args[0], callback, callback_fail)
-        else:
-            thread = threading.Thread(target=wrap_method, args=args, kwargs=kwargs)
-            thread.start()
@@ -1,4 +1,16 @@
-from .uwhscores_comms import UWHScores
+from .uwhscores_comms import (UWHScores, AsyncUWHScores, FlagCache, ResponseCache,
+                              gather_limited)
+from .uwhscores_store import OfflineStore
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import asyncio
+import base64
+import gc
+import json
+import tempfile
+import threading
+import time
 
 REPEAT_COUNT = 500
 REPEAT_DELAY = 0.01
@@ -26,6 +38,7 @@ def test_async_get_tournament_list():
         assert tournament_list[12]['is_active'] == False
 
     uwhscores.get_tournament_list(success)
+    uwhscores.close()
 
 def test_get_tournament():
     uwhscores = UWHScores(SERVER_ADDRESS, mock=MOCK)
@@ -37,6 +50,7 @@ def test_get_tournament():
         assert tournament['is_active'] == False
 
     uwhscores.get_tournament(14, success)
+    uwhscores.close()
 
 def test_get_game_list():
     uwhscores = UWHScores(SERVER_ADDRESS, mock=MOCK)
@@ -50,6 +64,7 @@ def test_get_game_list():
         assert game_list[3]['start_time'] == '2018-01-27T09:02:00'
 
     uwhscores.get_game_list(14, success)
+    uwhscores.close()
 
 def test_get_game():
     uwhscores = UWHScores(SERVER_ADDRESS, mock=MOCK)
@@ -63,6 +78,7 @@ def test_get_game():
         assert game['white_id'] == 17
 
     uwhscores.get_game(14, 6, success)
+    uwhscores.close()
 
 def test_get_team_list():
     uwhscores = UWHScores(SERVER_ADDRESS, mock=MOCK)
@@ -72,6 +88,7 @@ def test_get_team_list():
         assert team_list[3]['name'] == ' Colorado B'
 
     uwhscores.get_team_list(14, success)
+    uwhscores.close()
 
 def test_get_team():
     uwhscores = UWHScores(SERVER_ADDRESS, mock=MOCK)
@@ -83,6 +100,7 @@ def test_get_team():
         assert team['flag_url'][-22:] == 'static/flags/16/20.png'
 
     uwhscores.get_team(16, 20, success)
+    uwhscores.close()
 
 #def test_get_standings():
 #    uwhscores = UWHScores(SERVER_ADDRESS, mock=MOCK)
@@ -107,3 +125,628 @@ def test_get_roster():
         assert len(roster) == 10
 
     uwhscores.get_roster(16, 20, success)
+    uwhscores.close()
+
+
+class _StandIn(ThreadingMixIn, HTTPServer):
+    """ Local stand-in for uwhscores.com that keeps count of connections and
+        concurrent requests. `routes` maps (method, path) to a function of the
+        request handler returning (status, json or bytes[, headers]). """
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _StandInHandler)
+        self.delay = delay
+        self.routes = {}
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.hits = {}
+
+    def address(self):
+        return 'http://127.0.0.1:{}/api/v1/'.format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def respond(self, method):
+        path = self.path[len('/api/v1/'):]
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.hits[(method, path)] = self.server.hits.get((method, path), 0) + 1
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight,
+                                            self.server.in_flight)
+        time.sleep(self.server.delay)
+        route = self.server.routes.get((method, path))
+        result = route(self) if route else (404, { 'error' : path })
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+        (status, reply) = result[:2]
+        headers = result[2] if len(result) > 2 else {}
+        if isinstance(reply, bytes):
+            body = reply
+        else:
+            body = json.dumps(reply).encode()
+            headers['Content-Type'] = 'application/json'
+        self.send_response(status)
+        for (key, value) in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.respond('GET')
+
+    def do_POST(self):
+        self.respond('POST')
+
+    def log_message(self, *args):
+        pass
+
+
+def test_pooled_requests():
+    server = _StandIn(delay=0.02)
+    for tid in range(10):
+        server.routes[('GET', 'tournaments/' + str(tid))] = lambda r: (200, { 'tournament' : { 'tid' : 1 } })
+    server.start()
+    uwhscores = UWHScores(server.address(), max_concurrency=2)
+
+    done = threading.Semaphore(0)
+    def success(tournament):
+        assert tournament == { 'tid' : 1 }
+        done.release()
+
+    try:
+        for tid in range(10):
+            uwhscores.get_tournament(tid, success)
+        for _ in range(10):
+            assert done.acquire(timeout=5)
+
+        assert server.requests == 10
+        assert server.max_in_flight <= 2
+        # Connections get reused rather than opened per request
+        assert server.connections <= 2
+    finally:
+        uwhscores.close()
+        server.stop()
+
+
+def test_shared_loop():
+    server = _StandIn()
+    server.routes[('GET', 'tournaments')] = lambda r: (200, { 'tournaments' : [] })
+    server.start()
+
+    first = UWHScores(server.address())
+    second = UWHScores(server.address())
+    done = threading.Semaphore(0)
+    try:
+        for uwhscores in (first, second):
+            uwhscores.get_tournament_list(lambda _: done.release())
+            assert done.acquire(timeout=5)
+        # One thread between them
+        assert first._loop is second._loop
+
+        # One that nobody kept still gets its reply
+        UWHScores(server.address()).get_tournament_list(lambda _: done.release())
+        assert done.acquire(timeout=5)
+
+        # One that is dropped without being closed still lets go of its
+        # connections
+        session = second._async._session
+        del uwhscores, second
+        gc.collect()
+        deadline = time.monotonic() + 5
+        while not session.closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert session.closed
+    finally:
+        first.close()
+        server.stop()
+
+
+def test_post_score_token_reuse():
+    server = _StandIn()
+    tokens = ['first']
+    posted = threading.Semaphore(0)
+
+    def login(handler):
+        return (200, { 'token' : tokens[-1] })
+
+    def post(handler):
+        auth = handler.headers.get('Authorization')
+        expected = 'Basic ' + base64.b64encode((tokens[-1] + ':').encode()).decode()
+        if auth != expected:
+            return (401, { 'error' : 'bad token' })
+        assert json.loads(handler.body.decode())['game_score']['score_w'] == 3
+        posted.release()
+        return (200, {})
+
+    server.routes[('GET', 'login')] = login
+    server.routes[('POST', 'tournaments/1/games/2')] = post
+    server.start()
+
+    uwhscores = UWHScores(server.address(), max_concurrency=4)
+    uwhscores.login('user', 'pass')
+    try:
+        for _ in range(5):
+            uwhscores.post_score(1, 2, 1, 3, 10, 11)
+        for _ in range(5):
+            assert posted.acquire(timeout=5)
+        # Concurrent posts share a single login
+        assert server.hits[('GET', 'login')] == 1
+
+        # Server side revocation gets noticed, and fixed with one new login
+        tokens.append('second')
+        uwhscores.post_score(1, 2, 1, 3, 10, 11).result(timeout=5)
+        assert posted.acquire(timeout=5)
+        assert server.hits[('GET', 'login')] == 2
+        assert server.hits[('POST', 'tournaments/1/games/2')] == 7
+    finally:
+        uwhscores.close()
+        server.stop()
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def _flag_server(delay=0):
+    server = _StandIn(delay=delay)
+    flag = b'PNG' * 10
+
+    def get_flag(handler):
+        if handler.headers.get('If-None-Match') == '"v1"':
+            return (304, b'')
+        return (200, flag, { 'ETag' : '"v1"' })
+
+    for n in range(1, 4):
+        team = { 'team_id' : n, 'flag_url' : server.address() + 'flags/{}.png'.format(n) }
+        server.routes[('GET', 'tournaments/16/teams/{}'.format(n))] = (lambda team: lambda r: (200, { 'team' : team }))(team)
+        server.routes[('GET', 'flags/{}.png'.format(n))] = get_flag
+    server.start()
+    return (server, flag)
+
+
+def test_flag_cache_memory():
+    (server, flag) = _flag_server()
+
+    async def run():
+        uwhscores = AsyncUWHScores(server.address(), flag_cache=FlagCache(max_bytes=64))
+        try:
+            assert await uwhscores.get_team_flag(16, 1) == flag
+            assert await uwhscores.get_team_flag(16, 1) == flag
+            assert server.hits[('GET', 'flags/1.png')] == 1
+
+            # Evicted once the byte budget runs out
+            await uwhscores.get_team_flag(16, 2)
+            await uwhscores.get_team_flag(16, 3)
+            await uwhscores.get_team_flag(16, 1)
+            assert server.hits[('GET', 'flags/1.png')] == 2
+        finally:
+            await uwhscores.close()
+
+    try:
+        _run(run())
+    finally:
+        server.stop()
+
+
+def test_flag_cache_dedup():
+    (server, flag) = _flag_server(delay=0.05)
+
+    async def run():
+        uwhscores = AsyncUWHScores(server.address(), flag_cache=FlagCache())
+        try:
+            flags = await asyncio.gather(*[uwhscores.get_team_flag(16, 1)
+                                           for _ in range(5)])
+            assert flags == [flag] * 5
+            assert server.hits[('GET', 'flags/1.png')] == 1
+        finally:
+            await uwhscores.close()
+
+    try:
+        _run(run())
+    finally:
+        server.stop()
+
+
+def test_flag_cache_disk():
+    (server, flag) = _flag_server()
+    url = server.address() + 'flags/1.png'
+
+    async def fetch(cache):
+        uwhscores = AsyncUWHScores(server.address(), flag_cache=cache)
+        try:
+            return await uwhscores._get_flag(url)
+        finally:
+            await uwhscores.close()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        try:
+            assert _run(fetch(FlagCache(cache_dir=cache_dir))) == flag
+
+            # A new process revalidates what it finds on disk, and gets a 304
+            assert _run(fetch(FlagCache(cache_dir=cache_dir))) == flag
+            assert server.hits[('GET', 'flags/1.png')] == 2
+        finally:
+            server.stop()
+
+        # Offline, the stale copy is still better than nothing
+        assert _run(fetch(FlagCache(cache_dir=cache_dir))) == flag
+
+
+def test_get_team_flag_callback():
+    (server, flag) = _flag_server()
+    uwhscores = UWHScores(server.address(), flag_cache=FlagCache())
+    images = []
+    done = threading.Semaphore(0)
+    def success(image):
+        images.append(image.read())
+        done.release()
+
+    try:
+        uwhscores.get_team_flag(16, 1, success)
+        assert done.acquire(timeout=5)
+        assert images == [flag]
+    finally:
+        uwhscores.close()
+        server.stop()
+
+
+def test_response_cache():
+    server = _StandIn(delay=0.05)
+    team = { 'team_id' : 20, 'name' : 'Colorado', 'roster' : [{ 'number' : 4 }] }
+    server.routes[('GET', 'tournaments/16/teams/20')] = lambda r: (200, { 'team' : team })
+    server.routes[('GET', 'tournaments/16/games')] = lambda r: (200, { 'games' : [] })
+    server.routes[('GET', 'login')] = lambda r: (200, { 'token' : 't' })
+    server.routes[('POST', 'tournaments/16/games/1')] = lambda r: (200, {})
+    server.start()
+
+    uwhscores = UWHScores(server.address(), cache_ttl=60)
+    uwhscores.login('user', 'pass')
+    results = []
+    done = threading.Semaphore(0)
+    def success(value):
+        results.append(value)
+        done.release()
+
+    try:
+        # get_team and get_roster share one fetch of the same url, even
+        # while it is still in flight
+        uwhscores.get_team(16, 20, success)
+        uwhscores.get_roster(16, 20, success)
+        uwhscores.get_team(16, 20, success)
+        for _ in range(3):
+            assert done.acquire(timeout=5)
+        assert server.hits[('GET', 'tournaments/16/teams/20')] == 1
+        assert team['roster'] in results
+
+        # Served straight from the cache
+        uwhscores.get_team(16, 20, success)
+        assert done.acquire(timeout=5)
+        assert server.hits[('GET', 'tournaments/16/teams/20')] == 1
+
+        # Posting a score makes the game list go stale
+        uwhscores.get_game_list(16, success)
+        assert done.acquire(timeout=5)
+        uwhscores.post_score(16, 1, 1, 2, 10, 20).result(timeout=5)
+        uwhscores.get_game_list(16, success)
+        assert done.acquire(timeout=5)
+        assert server.hits[('GET', 'tournaments/16/games')] == 2
+        assert server.hits[('GET', 'tournaments/16/teams/20')] == 1
+    finally:
+        uwhscores.close()
+        server.stop()
+
+
+
+def test_response_cache_invalidate():
+    cache = ResponseCache()
+    base = 'http://uwhscores/api/v1/tournaments/'
+    for path in ('1', '1/games', '10', '10/games', '100'):
+        cache.store(base + path, path)
+
+    # Only tournament 1, not every tid that starts with a 1
+    cache.invalidate(base + '1')
+    assert cache.lookup(base + '1') == (None, False)
+    assert cache.lookup(base + '1/games') == (None, False)
+    assert cache.lookup(base + '10') == ('10', True)
+    assert cache.lookup(base + '10/games') == ('10/games', True)
+    assert cache.lookup(base + '100') == ('100', True)
+
+    cache.invalidate()
+    assert cache.lookup(base + '10') == (None, False)
+
+def test_response_cache_stale_while_revalidate():
+    server = _StandIn(delay=0.05)
+    server.routes[('GET', 'tournaments')] = lambda r: (200, { 'tournaments' : [server.requests] })
+    server.start()
+
+    uwhscores = UWHScores(server.address(), cache_ttl=0, stale_ttl=60)
+    results = []
+    done = threading.Semaphore(0)
+    def success(value):
+        results.append(value)
+        done.release()
+
+    try:
+        uwhscores.get_tournament_list(success)
+        assert done.acquire(timeout=5)
+
+        # Answered with the old reply, refreshed behind the scenes
+        uwhscores.get_tournament_list(success)
+        assert done.acquire(timeout=5)
+        assert results == [[1], [1]]
+
+        deadline = time.time() + 5
+        while server.hits[('GET', 'tournaments')] < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        # The hit is counted before the reply goes out
+        time.sleep(0.3)
+        uwhscores.get_tournament_list(success)
+        assert done.acquire(timeout=5)
+        assert results[-1] == [2]
+    finally:
+        uwhscores.close()
+        server.stop()
+
+
+def test_gather_limited():
+    running = [0, 0]
+
+    async def job(n):
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return n
+
+    assert _run(gather_limited([job(n) for n in range(10)], 3)) == list(range(10))
+    assert running[1] == 3
+
+
+def test_async_teams_with_rosters():
+    server = _StandIn(delay=0.02)
+    server.routes[('GET', 'tournaments/16/teams')] = lambda r: (200, { 'teams' : [{ 'team_id' : n } for n in range(6)] })
+    for n in range(6):
+        team = { 'team_id' : n, 'roster' : [{ 'number' : n }] }
+        server.routes[('GET', 'tournaments/16/teams/{}'.format(n))] = (lambda team: lambda r: (200, { 'team' : team }))(team)
+    server.start()
+
+    async def run():
+        uwhscores = AsyncUWHScores(server.address(), max_concurrency=3)
+        try:
+            teams = await uwhscores.get_teams_with_rosters(16)
+            assert [t['roster'][0]['number'] for t in teams] == list(range(6))
+            assert server.max_in_flight <= 3
+        finally:
+            await uwhscores.close()
+
+    try:
+        _run(run())
+    finally:
+        server.stop()
+
+
+def test_async_cancellation():
+    server = _StandIn(delay=0.2)
+    server.routes[('GET', 'tournaments/1')] = lambda r: (200, { 'tournament' : { 'tid' : 1 } })
+    server.start()
+
+    async def run():
+        uwhscores = AsyncUWHScores(server.address())
+        try:
+            patient = asyncio.ensure_future(uwhscores.get_tournament(1))
+            # Giving up on a shared fetch doesn't spoil it for others
+            try:
+                await asyncio.wait_for(uwhscores.get_tournament(1), 0.05)
+                assert False
+            except asyncio.TimeoutError:
+                pass
+            assert await patient == { 'tid' : 1 }
+            assert server.hits[('GET', 'tournaments/1')] == 1
+        finally:
+            await uwhscores.close()
+
+    try:
+        _run(run())
+    finally:
+        server.stop()
+
+
+def test_prefetch_tournament():
+    server = _StandIn()
+    games = [{ 'gid' : 1, 'pool' : '1', 'start_time' : '2018-07-18T07:40:00', 'black_id' : 1, 'white_id' : 2 },
+             { 'gid' : 2, 'pool' : '2', 'start_time' : '2018-07-18T07:40:00', 'black_id' : 3, 'white_id' : 4 },
+             { 'gid' : 3, 'pool' : '1', 'start_time' : '2018-07-18T08:20:00', 'black_id' : 1, 'white_id' : 3 }]
+    server.routes[('GET', 'tournaments/15')] = lambda r: (200, { 'tournament' : { 'tid' : 15 } })
+    server.routes[('GET', 'tournaments/15/games')] = lambda r: (200, { 'games' : games })
+    server.routes[('GET', 'tournaments/15/teams')] = lambda r: (200, { 'teams' : [{ 'team_id' : n } for n in range(1, 5)] })
+    for n in range(1, 5):
+        team = { 'team_id' : n, 'roster' : [{ 'number' : n }],
+                 'flag_url' : server.address() + 'flags/{}.png'.format(n) if n != 4 else None }
+        server.routes[('GET', 'tournaments/15/teams/{}'.format(n))] = (lambda team: lambda r: (200, { 'team' : team }))(team)
+        server.routes[('GET', 'flags/{}.png'.format(n))] = (lambda n: lambda r: (200, bytes([n])))(n)
+    # One broken flag doesn't sink the rest
+    server.routes[('GET', 'flags/3.png')] = lambda r: (500, b'')
+    server.start()
+
+    uwhscores = UWHScores(server.address(), flag_cache=FlagCache())
+    snapshots = []
+    done = threading.Semaphore(0)
+    def success(snapshot):
+        snapshots.append(snapshot)
+        done.release()
+
+    try:
+        uwhscores.prefetch_tournament(15, success)
+        assert done.acquire(timeout=5)
+        snapshot = snapshots[0]
+        assert uwhscores.snapshot(15) is snapshot
+
+        assert snapshot.tournament() == { 'tid' : 15 }
+        assert snapshot.game(2)['black_id'] == 3
+        assert [g['gid'] for g in snapshot.games_in_pool('1')] == [1, 3]
+        assert snapshot.start_times() == ['2018-07-18T07:40:00', '2018-07-18T08:20:00']
+        assert [g['gid'] for g in snapshot.games_at('2018-07-18T07:40:00')] == [1, 2]
+        assert snapshot.roster(2) == [{ 'number' : 2 }]
+        assert snapshot.flag(1) == b'\x01'
+        assert snapshot.flag(3) is None
+        assert snapshot.flag(4) is None
+
+        # Everything is cached now, so the regular calls stay local too
+        requests = server.requests
+        uwhscores.get_roster(15, 2, success)
+        assert done.acquire(timeout=5)
+        assert server.requests == requests
+    finally:
+        uwhscores.close()
+        server.stop()
+
+
+def test_offline_store():
+    server = _StandIn()
+    server.routes[('GET', 'tournaments/1')] = lambda r: (200, { 'tournament' : { 'tid' : 1 } })
+    server.start()
+    store = OfflineStore(':memory:')
+
+    async def fetch(address):
+        uwhscores = AsyncUWHScores(address, store=store)
+        try:
+            return await uwhscores.get_tournament(1)
+        finally:
+            await uwhscores.close()
+
+    address = server.address()
+    try:
+        assert _run(fetch(address)) == { 'tid' : 1 }
+    finally:
+        server.stop()
+
+    # Nobody home, but the store remembers
+    assert _run(fetch(address)) == { 'tid' : 1 }
+
+    async def cold_start():
+        uwhscores = AsyncUWHScores(address, store=store, cache_ttl=60)
+        try:
+            # Served from the preloaded cache, without waiting on the network
+            return await asyncio.wait_for(uwhscores.get_tournament(1), 0.01)
+        finally:
+            await uwhscores.close()
+    assert _run(cold_start()) == { 'tid' : 1 }
+
+
+def test_score_outbox():
+    server = _StandIn()
+    online = [False]
+    posted = []
+
+    def post(handler):
+        if not online[0]:
+            return (503, { 'error' : 'down' })
+        posted.append(json.loads(handler.body.decode())['game_score']['gid'])
+        return (200, {})
+
+    server.routes[('GET', 'login')] = lambda r: (200, { 'token' : 't' })
+    for gid in range(1, 4):
+        server.routes[('POST', 'tournaments/1/games/{}'.format(gid))] = post
+    server.routes[('POST', 'tournaments/1/games/9')] = lambda r: (400, { 'error' : 'no such game' })
+    server.start()
+    store = OfflineStore(':memory:')
+
+    async def run():
+        uwhscores = AsyncUWHScores(server.address(), store=store, retry_base=0.05)
+        uwhscores.login('user', 'pass')
+        try:
+            await uwhscores.post_score(1, 1, 0, 1, 10, 11)
+            await uwhscores.post_score(1, 2, 0, 2, 10, 11)
+            assert len(store.due(time.time() + 60)) == 2
+
+            # Retries back off on their own until the server comes back
+            online[0] = True
+            deadline = time.time() + 5
+            while store.next_attempt() is not None and time.time() < deadline:
+                await asyncio.sleep(0.01)
+            assert posted == [1, 2]
+
+            await uwhscores.post_score(1, 3, 0, 3, 10, 11)
+            assert posted == [1, 2, 3]
+
+            # Rejected outright, so not worth keeping
+            await uwhscores.post_score(1, 9, 0, 3, 10, 11)
+            assert store.next_attempt() is None
+        finally:
+            await uwhscores.close()
+
+    try:
+        _run(run())
+    finally:
+        server.stop()
+
+
+def test_score_outbox_login_failure():
+    server = _StandIn()
+    accepted = [False]
+    posted = []
+
+    def login(handler):
+        if not accepted[0]:
+            return (401, { 'error' : 'bad credentials' })
+        return (200, { 'token' : 't' })
+
+    def post(handler):
+        posted.append(json.loads(handler.body.decode())['game_score']['gid'])
+        return (200, {})
+
+    server.routes[('GET', 'login')] = login
+    server.routes[('POST', 'tournaments/1/games/1')] = post
+    server.start()
+    store = OfflineStore(':memory:')
+
+    async def run():
+        uwhscores = AsyncUWHScores(server.address(), store=store, retry_base=0.05)
+        uwhscores.login('user', 'pass')
+        try:
+            await uwhscores.post_score(1, 1, 0, 1, 10, 11)
+            # Not the score's fault, so it stays queued
+            assert posted == []
+            assert store.next_attempt() is not None
+
+            accepted[0] = True
+            deadline = time.time() + 5
+            while store.next_attempt() is not None and time.time() < deadline:
+                await asyncio.sleep(0.01)
+            assert posted == [1]
+        finally:
+            await uwhscores.close()
+
+    try:
+        _run(run())
+    finally:
+        server.stop()
@@ -0,0 +1,312 @@
+import aiohttp
+import asyncio
+import json
+import os
+import posixpath
+import random
+import time
+import urllib.parse
+
+
+# Built in fixtures, mirroring the url layout of uwhscores.com. Nodes with a
+# 'mock_name' are replies, wrapped as { mock_name : node }.
+MOCK_DATA = { 'api' : { 'v1' : {
+    'tournaments' : {
+        0 : { 'tid' : 0 },
+        1 : { 'tid' : 1 },
+        2 : { 'tid' : 2 },
+        3 : { 'tid' : 3 },
+        4 : { 'tid' : 4 },
+        5 : { 'tid' : 5 },
+        6 : { 'tid' : 6 },
+        7 : { 'tid' : 7 },
+        8 : { 'tid' : 8 },
+        9 : { 'tid' : 9 },
+        10 : { 'tid' : 10 },
+        11 : { 'tid' : 11 },
+        12 : {
+            'mock_name' : 'tournament',
+            'tid' : 12,
+            'standings' : {
+                0 : {
+                    'team' : 'Team Sexy',
+                    'team_id' : 2,
+                    'stats' : {
+                        'points' : 27
+                    },
+                },
+                2 : {
+                    'team' : 'UF',
+                },
+                4 : {
+                    'team' : 'Hampton'
+                },
+                6 : {
+                    'team' : 'Swordfish'
+                },
+                7 : {
+                    'team' : 'George Mason'
+                }
+            }
+        },
+        13 : { 'tid' : 13 },
+        14 : {
+            'mock_name' : 'tournament',
+            'tid' : 14,
+            'name' : 'Battle@Altitude 2018',
+            'location' : 'Denver, CO',
+            'is_active' : False,
+            'games' : {
+                1 : {
+                    'black' : 'LA',
+                    'black_id' : 1,
+                    'pool' : '1',
+                },
+                4 : {
+                    'white' : 'Seattle',
+                    'white_id' : 6,
+                    'start_time' : '2018-01-27T09:02:00',
+                },
+                6 : {
+                    'black' : 'U19 Girls',
+                    'black_id' : 14,
+                    'day' : 'Sat',
+                    'start_time' : '2018-01-27T09:34:00',
+                    'white' : 'US Elite Women',
+                    'white_id' : 17,
+                }
+            },
+            'teams' : {
+                1 : { 'name' : 'LA' },
+                3 : { 'name' : 'Rainbow Raptors' },
+                7 : { 'name' : 'Cupcake Crocodiles' },
+                11 : { 'name' : 'Chicago' },
+                13 : { 'name' : 'Colorado B' },
+                17 : { 'name' : 'US Elite Women' },
+            }
+        },
+        15 : {
+            'mock_name' : 'tournament',
+            'tid' : 15,
+            'name' : '2018 Worlds Mockup',
+            'location' : 'Quebec City, Canada',
+            'is_active' : True,
+            'games' : {
+                1 : {
+                    'mock_name' : 'game',
+                    'black' : 'Argentina',
+                    'black_id' : 1,
+                    'pool' : 1,
+                    'white' : 'Australia',
+                    'white_id' : 2,
+                    'start_time' : '2018-07-18T07:40:00'
+                },
+                2 : {
+                    'mock_name' : 'game',
+                    'black' : 'USA',
+                    'black_id' : 3,
+                    'pool' : 2,
+                    'white' : 'Columbia',
+                    'white_id' : 4,
+                    'start_time' : '2018-07-18T07:40:00'
+                }
+            },
+            'teams' : {
+                1 : {
+                    'mock_name' : 'team',
+                    'name' : 'Argentina Masters Men',
+                    'team_id' : 1,
+                    'roster' : {
+                        1 : {
+                            'player_id' : 1,
+                            'name' : 'Schmoe, Joe',
+                        },
+                        2 : {
+                            'player_id' : 2,
+                            'name' : 'Doe, John'
+                        },
+                        3 : {
+                            'player_id' : 3,
+                            'name' : 'Bobby, Ricky'
+                        },
+                        4 : {
+                            'player_id' : 4,
+                            'name' : 'Georgeson, George'
+                        },
+                        5 : {
+                            'player_id' : 5,
+                            'name' : 'Steveson, Steve'
+                        },
+                        6 : {
+                            'player_id' : 6,
+                            'name' : 'Justinson, Justin'
+                        },
+                        7 : {
+                            'player_id' : 7,
+                            'name' : 'Pauly, Paul'
+                        },
+                        8 : {
+                            'player_id' : 8,
+                            'name' : 'Everett, Earnest'
+                        },
+                        9 : {
+                            'player_id' : 9,
+                            'name' : 'Clumboldt, Cletus'
+                        },
+                        10 : {
+                            'player_id' : 10,
+                            'name' : 'Miller, Milhouse'
+                        },
+                        11 : {
+                            'player_id' : 11,
+                            'name' : 'Thompson, Tucker'
+                        },
+                        12 : {
+                            'player_id' : 12,
+                            'name' : 'Richardson, Rich'
+                        }
+                    }
+                },
+                2 : {
+                    'mock_name' : 'team',
+                    'name' : 'Australia Masters Men',
+                    'team_id' : 2,
+                    'roster' : {
+                        1 : {
+                            'player_id' : 1,
+                            'name' : 'Speedwagon, Mario',
+                        },
+                        2 : {
+                            'player_id' : 2,
+                            'name' : 'Romer, Robby'
+                        },
+                        3 : {
+                            'player_id' : 3,
+                            'name' : 'Riker, Randolph'
+                        },
+                        4 : {
+                            'player_id' : 4,
+                            'name' : 'Tomlin, Teddy'
+                        },
+                        5 : {
+                            'player_id' : 5,
+                            'name' : 'Wolf, Warren'
+                        },
+                        6 : {
+                            'player_id' : 6,
+                            'name' : 'Pollard, Phillip'
+                        },
+                        7 : {
+                            'player_id' : 7,
+                            'name' : 'Bavaro, Buster'
+                        },
+                        8 : {
+                            'player_id' : 8,
+                            'name' : 'James, Joshua'
+                        },
+                        9 : {
+                            'player_id' : 9,
+                            'name' : 'Shin, Stewart'
+                        },
+                        10 : {
+                            'player_id' : 10,
+                            'name' : 'Hume, Huey'
+                        },
+                        11 : {
+                            'player_id' : 11,
+                            'name' : 'Vos, Valentine'
+                        },
+                        12 : {
+                            'player_id' : 12,
+                            'name' : 'Newburn, Noel'
+                        }
+                    }
+                },
+                3 : { 'name' : 'USA Masters Men', 'team_id' : 3 },
+                4 : { 'name' : 'Columbia Masters Men', 'team_id' : 4 },
+            }
+        }
+    }
+}}}
+
+
+def _path_key(url):
+    path = posixpath.normpath(urllib.parse.unquote(urllib.parse.urlparse(url).path))
+    return tuple(part for part in path.split('/') if part)
+
+
+class MockBackend(object):
+    """ Stands in for uwhscores.com. Fixtures are indexed by url path once,
+        up front, and replies can be slowed down by `latency` (plus up to
+        `jitter`) seconds, fail at `error_rate`, or be limited to `max_rps`
+        requests per second overall. """
+
+    def __init__(self, fixtures=None, latency=0, jitter=0, error_rate=0,
+                 max_rps=None, seed=None):
+        self._replies = {}
+        self._index(MOCK_DATA if fixtures is None else fixtures, ())
+        self._latency = latency
+        self._jitter = jitter
+        self._error_rate = error_rate
+        self._interval = 1.0 / max_rps if max_rps else 0
+        self._next_slot = 0
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.posted = []
+
+    @classmethod
+    def from_directory(cls, path, **kwargs):
+        """ Fixtures from a directory of JSON files, one reply each, named
+            after their url path: api/v1/tournaments/14.json and so on """
+        backend = cls(fixtures={}, **kwargs)
+        for (dirpath, _, filenames) in os.walk(path):
+            for filename in filenames:
+                (name, ext) = os.path.splitext(filename)
+                if ext != '.json':
+                    continue
+                relative = os.path.relpath(os.path.join(dirpath, name), path)
+                with open(os.path.join(dirpath, filename)) as f:
+                    backend.add(relative.replace(os.sep, '/'), json.load(f))
+        return backend
+
+    def _index(self, node, key):
+        if not isinstance(node, dict):
+            return
+        if 'mock_name' in node:
+            self._replies[key] = { node['mock_name'] : node }
+        for (name, child) in node.items():
+            self._index(child, key + (str(name),))
+
+    def add(self, path, reply):
+        """ Serve `reply` for requests to `path` """
+        self._replies[_path_key('/' + path)] = reply
+
+    async def _simulate(self):
+        self.requests += 1
+        if self._interval:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+            if slot > now:
+                await asyncio.sleep(slot - now)
+        delay = self._latency + self._random.uniform(0, self._jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self._error_rate and self._random.random() < self._error_rate:
+            raise aiohttp.ClientConnectionError("Simulated failure")
+
+    def _lookup(self, url):
+        try:
+            return self._replies[_path_key(url)]
+        except KeyError:
+            print('mock lookup fail for: ' + url)
+            raise
+
+    async def get(self, url):
+        await self._simulate()
+        return self._lookup(url)
+
+    async def post(self, url, body):
+        await self._simulate()
+        self._lookup(url)
+        self.posted.append((url, body))
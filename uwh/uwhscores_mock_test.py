@@ -0,0 +1,102 @@
+from .uwhscores_mock import MockBackend
+from .uwhscores_comms import UWHScores, AsyncUWHScores
+
+import aiohttp
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def _run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_builtin_fixtures():
+    backend = MockBackend()
+    game = _run(backend.get('https://uwhscores.com/api/v1/tournaments/15/games/2'))
+    assert game['game']['black'] == 'USA'
+
+    team = _run(backend.get('https://uwhscores.com/api/v1/tournaments/15/teams/1'))
+    assert team['team']['roster'][3]['name'] == 'Bobby, Ricky'
+
+    try:
+        _run(backend.get('https://uwhscores.com/api/v1/tournaments/15/teams/99'))
+        assert False
+    except KeyError:
+        pass
+
+
+def test_fixture_directory():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'api', 'v1', 'tournaments'))
+        with open(os.path.join(tmp, 'api', 'v1', 'tournaments', '7.json'), 'w') as f:
+            json.dump({ 'tournament' : { 'tid' : 7 } }, f)
+
+        backend = MockBackend.from_directory(tmp)
+        reply = _run(backend.get('http://anywhere/api/v1/tournaments/7'))
+        assert reply == { 'tournament' : { 'tid' : 7 } }
+
+
+def test_simulation():
+    backend = MockBackend(error_rate=1)
+    try:
+        _run(backend.get('http://x/api/v1/tournaments/14'))
+        assert False
+    except aiohttp.ClientError:
+        pass
+
+    backend = MockBackend(latency=0.05)
+    start = time.monotonic()
+    _run(backend.get('http://x/api/v1/tournaments/14'))
+    assert time.monotonic() - start >= 0.05
+
+    backend = MockBackend(max_rps=100)
+    async def burst():
+        await asyncio.gather(*[backend.get('http://x/api/v1/tournaments/14')
+                               for _ in range(6)])
+    start = time.monotonic()
+    _run(burst())
+    assert time.monotonic() - start >= 0.05
+    assert backend.requests == 6
+
+
+def test_client_on_mock():
+    backend = MockBackend()
+
+    async def run():
+        uwhscores = AsyncUWHScores(mock=backend)
+        try:
+            assert (await uwhscores.get_tournament(14))['name'] == 'Battle@Altitude 2018'
+            assert (await uwhscores.get_tournament(14))['location'] == 'Denver, CO'
+            assert (await uwhscores.get_roster(15, 2))[1]['name'] == 'Speedwagon, Mario'
+            await uwhscores.post_score(15, 1, 2, 3, 1, 2)
+        finally:
+            await uwhscores.close()
+
+    _run(run())
+    # Mock replies get cached just like real ones
+    assert backend.requests == 3
+    assert backend.posted[0][1]['game_score']['score_w'] == 3
+
+
+def test_callbacks_on_mock():
+    uwhscores = UWHScores(mock=True)
+    games = []
+    done = threading.Semaphore(0)
+    def success(game):
+        games.append(game)
+        done.release()
+
+    try:
+        uwhscores.get_game(15, 1, success)
+        assert done.acquire(timeout=5)
+        assert games[0]['white'] == 'Australia'
+    finally:
+        uwhscores.close()
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+import threading
+
+
+class OfflineStore(object):
+    """ Durable copy of what UWHScores has fetched, plus an outbox of score
+        submissions that haven't reached the server yet. Backed by SQLite at
+        `path`, which may be ':memory:' for tests. """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                             ' url TEXT PRIMARY KEY,'
+                             ' body TEXT NOT NULL,'
+                             ' stored_at REAL NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                             ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                             ' url TEXT NOT NULL,'
+                             ' body TEXT NOT NULL,'
+                             ' attempts INTEGER NOT NULL DEFAULT 0,'
+                             ' next_attempt REAL NOT NULL DEFAULT 0)')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def save_response(self, url, body, stored_at):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)',
+                             (url, json.dumps(body), stored_at))
+
+    def load_response(self, url):
+        with self._lock:
+            row = self._db.execute('SELECT body FROM responses WHERE url = ?',
+                                   (url,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def responses(self):
+        """ Every stored (url, json, stored_at) """
+        with self._lock:
+            rows = self._db.execute('SELECT url, body, stored_at FROM responses').fetchall()
+        return [(url, json.loads(body), stored_at) for (url, body, stored_at) in rows]
+
+    def enqueue(self, url, body):
+        with self._lock, self._db:
+            return self._db.execute('INSERT INTO outbox (url, body) VALUES (?, ?)',
+                                    (url, json.dumps(body))).lastrowid
+
+    def due(self, now):
+        """ Outbox entries ready for another attempt, oldest first, as
+            (id, url, json, attempts) """
+        with self._lock:
+            rows = self._db.execute('SELECT id, url, body, attempts FROM outbox'
+                                    ' WHERE next_attempt <= ? ORDER BY id',
+                                    (now,)).fetchall()
+        return [(entry_id, url, json.loads(body), attempts)
+                for (entry_id, url, body, attempts) in rows]
+
+    def next_attempt(self):
+        """ When the next outbox entry falls due, or None if it is empty """
+        with self._lock:
+            return self._db.execute('SELECT MIN(next_attempt) FROM outbox').fetchone()[0]
+
+    def retry_later(self, entry_id, next_attempt):
+        with self._lock, self._db:
+            self._db.execute('UPDATE outbox SET attempts = attempts + 1,'
+                             ' next_attempt = ? WHERE id = ?',
+                             (next_attempt, entry_id))
+
+    def remove(self, entry_id):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM outbox WHERE id = ?', (entry_id,))
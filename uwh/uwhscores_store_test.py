@@ -0,0 +1,45 @@
+from .uwhscores_store import OfflineStore
+
+import os
+import tempfile
+
+
+def test_responses():
+    store = OfflineStore(':memory:')
+    assert store.load_response('http://x/tournaments') is None
+
+    store.save_response('http://x/tournaments', { 'tournaments' : [1] }, 10)
+    store.save_response('http://x/tournaments', { 'tournaments' : [1, 2] }, 20)
+    assert store.load_response('http://x/tournaments') == { 'tournaments' : [1, 2] }
+    assert store.responses() == [('http://x/tournaments', { 'tournaments' : [1, 2] }, 20)]
+
+
+def test_outbox():
+    store = OfflineStore(':memory:')
+    assert store.next_attempt() is None
+
+    first = store.enqueue('http://x/games/1', { 'score' : 1 })
+    second = store.enqueue('http://x/games/2', { 'score' : 2 })
+    assert [e[0] for e in store.due(0)] == [first, second]
+
+    store.retry_later(first, 100)
+    assert store.due(50) == [(second, 'http://x/games/2', { 'score' : 2 }, 0)]
+    assert store.due(100)[0] == (first, 'http://x/games/1', { 'score' : 1 }, 1)
+    assert store.next_attempt() == 0
+
+    store.remove(second)
+    assert store.next_attempt() == 100
+
+
+def test_durable():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'uwhscores.db')
+        store = OfflineStore(path)
+        store.save_response('http://x/tournaments', { 'tournaments' : [] }, 1)
+        store.enqueue('http://x/games/1', { 'score' : 1 })
+        store.close()
+
+        store = OfflineStore(path)
+        assert store.load_response('http://x/tournaments') == { 'tournaments' : [] }
+        assert len(store.due(0)) == 1
+        store.close()
@@ -3,8 +3,10 @@ from digi.xbee.exception import TimeoutException, XBeeException
 from digi.xbee.models.address import XBee64BitAddress
 
 from . import messages_pb2
-from .comms import UWHProtoHandler
+from .async_comms import Transport
+from .comms import UWHProtoHandler, DeltaTracker
 
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 import json
 import logging
@@ -19,6 +21,10 @@ def XBeeConfigParser():
         'clients': '[]',
         'ch': '000C',
         'id': '000D',
+        # Only for displays that know batch frames; older ones stall on them
+        'batch': 'false',
+        # Only for displays that know GameSnapshot; older ones stall on it
+        'snapshot': 'false',
     }
     parser = ConfigParser(defaults=defaults)
     parser.add_section('xbee')
@@ -39,8 +45,71 @@ def xbee_ch(cfg):
 def xbee_id(cfg):
     return cfg.get('xbee', 'id')
 
+def xbee_batch(cfg):
+    return cfg.getboolean('xbee', 'batch')
+
+def xbee_snapshot(cfg):
+    return cfg.getboolean('xbee', 'snapshot')
+
+
+class XBeeTransport(Transport):
+    """ Plugs an open XBeeDevice into AsyncEndpoint. The radio library
+        calls back on a thread of its own; packets are handed over to the
+        event loop from there. Sends wait for the radio's acknowledgement
+        on a single thread, so recipients may be RemoteXBeeDevices or their
+        64-bit addresses as hex strings. """
+
+    def __init__(self, xbee):
+        self._xbee = xbee
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._remotes = {}
+        self._loop = None
+        self._callback = None
+
+    def open(self, loop, deliver):
+        self._loop = loop
+
+        def callback(xbee_msg):
+            loop.call_soon_threadsafe(deliver, xbee_msg.remote_device,
+                                      bytes(xbee_msg.data))
+
+        self._callback = callback
+        self._xbee.add_data_received_callback(callback)
+
+    def _remote(self, recipient):
+        if not isinstance(recipient, str):
+            return recipient
+        remote = self._remotes.get(recipient)
+        if remote is None:
+            remote = RemoteXBeeDevice(self._xbee,
+                                      XBee64BitAddress.from_hex_string(recipient))
+            self._remotes[recipient] = remote
+        return remote
+
+    def _send_data(self, recipient, packet):
+        try:
+            self._xbee.send_data(self._remote(recipient), packet)
+            return True
+        except TimeoutException:
+            return False
+        except XBeeException as e:
+            print(e)
+            return False
+
+    async def send(self, recipient, packet):
+        return await self._loop.run_in_executor(self._writer, self._send_data,
+                                                recipient, packet)
+
+    def close(self):
+        if self._callback is not None:
+            self._xbee.del_data_received_callback(self._callback)
+            self._callback = None
+        self._writer.shutdown(wait=False)
+
 
 class XBeeClient(UWHProtoHandler):
+    resync_requests = True
+
     def __init__(self, mgr, serial_port, baud):
         UWHProtoHandler.__init__(self, mgr)
         self._xbee = XBeeDevice(serial_port, baud)
@@ -56,10 +125,12 @@ class XBeeClient(UWHProtoHandler):
     def send_raw(self, recipient, data):
         try:
             self._xbee.send_data(recipient, data)
+            return True
         except TimeoutException:
-            pass
+            return False
         except XBeeException as e:
             print(e)
+            return False
 
     def listen_thread(self):
         def callback(xbee_msg):
@@ -71,10 +142,17 @@ class XBeeClient(UWHProtoHandler):
         self._xbee.add_data_received_callback(callback)
 
 class XBeeServer(UWHProtoHandler):
+    # NP on the smallest XBee we've met, in case the radio won't say
+    mtu = 73
+
     def __init__(self, mgr, serial_port, baud):
         UWHProtoHandler.__init__(self, mgr)
         self._xbee = XBeeDevice(serial_port, baud)
         self._xbee.open()
+        try:
+            self.mtu = int.from_bytes(self._xbee.get_parameter('NP'), 'big')
+        except XBeeException as e:
+            print(e)
 
     def setup(self, atid, atch, atni):
         self._xbee.set_parameter('ID', binascii.unhexlify(atid))
@@ -103,10 +181,22 @@ class XBeeServer(UWHProtoHandler):
     def send_raw(self, recipient, data):
         try:
             self._xbee.send_data(recipient, data)
+            return True
         except TimeoutException:
-            pass
+            return False
         except XBeeException as e:
             print(e)
+            return False
+
+    def listen_thread(self):
+        """ Answer what clients send back, like resync requests """
+        def callback(xbee_msg):
+            try:
+                self.recv_raw(xbee_msg.remote_device, xbee_msg.data)
+            except ValueError:
+                logging.exception("Problem parsing xbee packet")
+
+        self._xbee.add_data_received_callback(callback)
 
     def time_ping(self, remote, val):
         ping_kind = messages_pb2.MessageType_Ping
@@ -134,23 +224,22 @@ class XBeeServer(UWHProtoHandler):
         self.client_discovery(found_client)
         return clients
 
-    def broadcast_loop(self, client_addrs):
+    def broadcast_loop(self, client_addrs, delta=False, interval=0.1,
+                       resync_interval=5, event_driven=False, batch=False,
+                       snapshot=False, drift_threshold=None):
+        trackers = { addr : DeltaTracker(resync_interval, drift_threshold)
+                     for addr in client_addrs }
+        listener = self._mgr.listen() if event_driven else None
         while True:
             try:
                 while True:
-                    (gkf_kind, gkf_msg) = self.get_GameKeyFrame()
-                    (pen_kind, pen_msgs) = self.get_Penalties()
-                    (gol_kind, gol_msgs) = self.get_Goals()
-                    for addr in client_addrs:
+                    plan = self.plan_Cycle(client_addrs, trackers, delta,
+                                           batch, snapshot)
+                    for (addr, frames, tracker, full) in plan:
                         client = self.recipient_from_address(addr)
+                        self.send_frames(client, frames, tracker, full)
 
-                        self.send_message(client, gkf_kind, gkf_msg)
-
-                        for msg in pen_msgs:
-                            self.send_message(client, pen_kind, msg)
-
-                        for msg in gol_msgs:
-                            self.send_message(client, gol_kind, msg)
+                    self.wait_for_changes(listener, interval, resync_interval)
 
             except Exception as e:
                 import traceback
@@ -158,8 +247,12 @@ class XBeeServer(UWHProtoHandler):
                 traceback.print_tb(e.__traceback__)
                 time.sleep(1)
 
-    def broadcast_thread(self, client_addrs):
+    def broadcast_thread(self, client_addrs, delta=False, interval=0.1,
+                         resync_interval=5, event_driven=False, batch=False,
+                         snapshot=False, drift_threshold=None):
         thread = threading.Thread(target=self.broadcast_loop,
-                                  args=(client_addrs,))
+                                  args=(client_addrs, delta, interval,
+                                        resync_interval, event_driven, batch,
+                                        snapshot, drift_threshold))
         thread.daemon = True
         thread.start()
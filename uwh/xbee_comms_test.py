@@ -1,4 +1,7 @@
-from .xbee_comms import XBeeConfigParser, xbee_port, xbee_baud, xbee_clients
+from .xbee_comms import XBeeConfigParser, xbee_port, xbee_baud, xbee_clients, XBeeTransport
+
+import asyncio
+import threading
 
 def test_XBeeConfigParser_defaults():
     cfg = XBeeConfigParser()
@@ -6,3 +9,56 @@ def test_XBeeConfigParser_defaults():
     assert xbee_port(cfg) == '/dev/tty.usbserial-DN03ZRU8'
     assert xbee_baud(cfg) == 9600
     assert xbee_clients(cfg) == []
+
+
+class FakeRadio(object):
+    """ Stands in for an open XBeeDevice: calls back from its own thread """
+
+    def __init__(self):
+        self.callbacks = []
+        self.sent = []
+
+    def add_data_received_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def del_data_received_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def send_data(self, remote, data):
+        self.sent.append((remote, data, threading.current_thread()))
+
+    def receive(self, remote, data):
+        class XBeeMessage(object):
+            pass
+        msg = XBeeMessage()
+        msg.remote_device = remote
+        msg.data = bytearray(data)
+        thread = threading.Thread(target=lambda: [cb(msg) for cb in self.callbacks])
+        thread.start()
+        thread.join()
+
+
+def test_XBeeTransport():
+    radio = FakeRadio()
+    transport = XBeeTransport(radio)
+    received = []
+    # A RemoteXBeeDevice passes straight through; only addresses get looked up
+    other = object()
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        loop_thread = threading.current_thread()
+
+        def deliver(sender, packet):
+            received.append((sender, packet, threading.current_thread() is loop_thread))
+
+        transport.open(loop, deliver)
+        radio.receive('remote', b'hello')
+        await asyncio.sleep(0.01)
+        assert await transport.send(other, b'bye')
+        transport.close()
+
+    asyncio.run(run())
+    assert received == [('remote', b'hello', True)]
+    assert radio.sent[0][:2] == (other, b'bye')
+    assert radio.callbacks == []